@@ -0,0 +1,118 @@
+"""Thin client for the assembler service.
+
+Starting assemble.py costs more than assembling a typical class:
+the interpreter, logging, configuration, the instruction set, and
+the regular expressions must all be set up again for every file.
+`python3 assemble.py --serve` does that once and then assembles
+files on request over a Unix socket (asm.sock in the directory it
+was started in).  This client takes the same arguments as
+assemble.py for a single file, sends the request, and prints the
+assembler's log messages.  It imports nothing heavy, so it starts
+quickly.  If no service is running, it runs assemble.py instead.
+
+Requests and responses are one line of JSON each:
+    {"source": path, "target": path, "format": "json", ...}
+    {"ok": true, "log": ["INFO:__main__:...", ...]}
+A request the service cannot make sense of gets
+    {"ok": false, "error": "Bad request: ...", "log": [...]}
+A request {"command": "shutdown"} stops the service, and
+{"command": "ping"} checks that it is running.
+"""
+
+import os
+import sys
+import json
+from pathlib import Path
+
+SOCKET_PATH = "asm.sock"  # In the working directory, like asm.conf
+ASSEMBLER = Path(__file__).resolve().parent.joinpath("assemble.py")
+
+
+class ServiceUnavailable(Exception):
+    """No assembler service is listening on the socket"""
+    pass
+
+
+def request(message: dict, socket_path: str = SOCKET_PATH) -> dict:
+    """Send one request to the service and return its response"""
+    # Imported here, as assemble.py imports this module for
+    # SOCKET_PATH and does not otherwise need sockets
+    import socket
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+            with sock.makefile("rwb") as stream:
+                stream.write(json.dumps(message).encode("utf-8") + b"\n")
+                stream.flush()
+                response = stream.readline()
+    except (FileNotFoundError, ConnectionRefusedError) as e:
+        raise ServiceUnavailable(f"No assembler service at {socket_path}") \
+            from e
+    if not response:
+        raise ServiceUnavailable(f"Assembler service at {socket_path} "
+                                 f"closed the connection")
+    return json.loads(response)
+
+
+def assemble(source: str, target: str, format: str = "json",
+             incremental: bool = False, stream: bool = False,
+             optimize: bool = False, fuse: bool = False,
+             socket_path: str = SOCKET_PATH) -> dict:
+    """Ask the service to assemble source into target.
+    Paths are relative to our working directory, not the service's.
+    """
+    return request({"source": os.path.abspath(source),
+                    "target": os.path.abspath(target),
+                    "format": format,
+                    "incremental": incremental,
+                    "stream": stream,
+                    "optimize": optimize,
+                    "fuse": fuse}, socket_path)
+
+
+def cli() -> object:
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Assemble a tiny virtual machine module "
+                    "using the assembler service")
+    parser.add_argument("source", nargs="?")
+    parser.add_argument("target", nargs="?")
+    parser.add_argument("--format", choices=["json", "binary"],
+                        default="json")
+    parser.add_argument("--incremental", action="store_true")
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("-O", "--optimize", action="store_true")
+    parser.add_argument("--fuse", action="store_true")
+    parser.add_argument("--socket", default=SOCKET_PATH,
+                        help="Socket of the service (default asm.sock)")
+    parser.add_argument("--stop", action="store_true",
+                        help="Stop the service")
+    args = parser.parse_args()
+    if not args.stop and not (args.source and args.target):
+        parser.error("source and target are required")
+    return args
+
+
+def main():
+    args = cli()
+    if args.stop:
+        try:
+            request({"command": "shutdown"}, args.socket)
+        except ServiceUnavailable as e:
+            print(e, file=sys.stderr)
+        return
+    try:
+        response = assemble(args.source, args.target, args.format,
+                            args.incremental, args.stream, args.optimize,
+                            args.fuse, args.socket)
+    except ServiceUnavailable:
+        # Do it the slow way
+        os.execv(sys.executable, [sys.executable, str(ASSEMBLER)]
+                 + sys.argv[1:])
+    for message in response["log"]:
+        print(message, file=sys.stderr)
+    sys.exit(0 if response["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
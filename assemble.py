@@ -12,12 +12,21 @@ There are two approaches to "resolving" labels:
 """
 
 import re
+import io
+import os
 import sys
 import json
+import time
 from pathlib import Path
-import argparse
-import configparser
-from typing import Dict, List,  Optional, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List,  Optional, \
+    Set, Tuple, Union
+# Modules used only in some modes (argparse, configparser,
+# hashlib, tempfile, resource, socket, concurrent.futures)
+# are imported where they are used, to keep startup fast.
+
+import objfile
+import opcodes  # Generated from opdefs.txt by build_bytecode_table.py
+import asmclient
 
 import logging
 logging.basicConfig()
@@ -26,28 +35,79 @@ log.setLevel(logging.DEBUG)
 
 
 class Configuration:
-    def __init__(self):
+    """Settings from asm.conf, which we read when first needed"""
+    def __getattr__(self, name: str):
+        # Called only for attributes we have not set
+        if name.startswith("__") or "tvmlib" in self.__dict__:
+            raise AttributeError(name)
+        self.read()
+        return getattr(self, name)
+
+    def read(self):
+        import configparser
         config = configparser.ConfigParser()
         try:
             config.read("asm.conf")
-            self.tvmlib = Path(config["DEFAULT"]["TVMLIB"])
-        except FileExistsError:
+            # TVMLIB may list several directories, like a PATH;
+            # object files are written to the first.
+            tvmlib = config["DEFAULT"]["TVMLIB"]
+        except KeyError:
             # If no configuration file is present, we will look in ./OBJ
-            self.tvmlib = Path("./OBJ")
+            tvmlib = "./OBJ"
+        self.search_path = [Path(d) for d in tvmlib.split(os.pathsep) if d]
+        self.tvmlib = self.search_path[0]
+        # Signatures of imported modules are cached next to TVMLIB
+        self.signature_cache = Path(f"{self.tvmlib}.signatures.json")
+        # Encoded methods for incremental assembly, by content hash
+        self.method_cache = Path(f"{self.tvmlib}.methods")
 
 
 CONFIG = Configuration()  # Visible from any code
 
 
+# Object code formats and the file suffixes that go with them
+FORMAT_SUFFIXES = {"json": objfile.JSON_SUFFIX,
+                   "binary": objfile.BINARY_SUFFIX}
+
+
 def cli() -> object:
+    import argparse
     parser = argparse.ArgumentParser(
         description="Assemble tiny virtual machine module"
                     "into JSON-formatted object code"
     )
-    parser.add_argument("source", type=argparse.FileType("r"))
+    parser.add_argument("source", type=argparse.FileType("r"), nargs="?")
     parser.add_argument("target", type=argparse.FileType("w"),
                         nargs="?", default=sys.stdout)
-    return parser.parse_args()
+    parser.add_argument("--batch", nargs="+", metavar="SOURCE",
+                        help="Assemble many .asm files in one invocation")
+    parser.add_argument("-o", "--outdir", type=Path, default=None,
+                        help="Directory for batch object files "
+                             "(default TVMLIB)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="Worker processes for batch mode")
+    parser.add_argument("--format", choices=FORMAT_SUFFIXES, default="json",
+                        help="Object code format (default json)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Reuse encoded methods that have not changed")
+    parser.add_argument("--stream", action="store_true",
+                        help="Keep only the current method in memory")
+    parser.add_argument("-O", "--optimize", action="store_true",
+                        help="Remove redundant instructions "
+                             "(peephole optimization), share local "
+                             "variable slots, and call native methods "
+                             "of built-in classes directly")
+    parser.add_argument("--fuse", action="store_true",
+                        help="Use fused operations for common sequences "
+                             "(needs a VM built from the same opdefs.txt)")
+    parser.add_argument("--serve", action="store_true",
+                        help="Assemble files on request (see asmclient.py)")
+    parser.add_argument("--socket", default=asmclient.SOCKET_PATH,
+                        help="Socket for --serve (default asm.sock)")
+    args = parser.parse_args()
+    if args.batch is None and args.source is None and not args.serve:
+        parser.error("a source file (or --batch or --serve) is required")
+    return args
 
 
 # ----------------
@@ -57,41 +117,265 @@ def cli() -> object:
 #    - Field numbers for load and store operations
 #
 class ImportedModule:
-    """Imported module uses information from
-    json file
+    """Imported module uses the signature (method and field
+    lists, and the arity of each method) from its json file,
+    usually by way of the signature cache.
     """
-    def __init__(self, path: Path):
-        with open(path, "r") as source:
-            self.json = json.load(source)
-        # Dict from name to position would be faster, but
-        # number of lookups is very small
-        self.methods: List[str] = self.json["methods"]
-        self.fields:  List[str] = self.json["fields"]
+    def __init__(self, signature: dict):
+        self.methods: List[str] = slot_order(signature["methods"])
+        self.fields:  List[str] = slot_order(signature["fields"])
+        self.method_slots: Dict[str, int] = signature["methods"]
+        self.field_slots: Dict[str, int] = signature["fields"]
+        self.arities: Dict[str, int] = signature["arities"]
 
     def method_slot(self, name: str) -> int:
-        if name in self.methods:
-            return self.methods.index(name)
+        if name in self.method_slots:
+            return self.method_slots[name]
         log.error(f"Method {name} not defined")
         return 0
 
     def n_methods(self) -> int:
         return len(self.methods)
 
+    def arity(self, name: str) -> Optional[int]:
+        """Number of arguments of method name, if known"""
+        return self.arities.get(name)
+
     def field_slot(self, name: str) -> int:
-        return self.fields.index(name)
+        return self.field_slots[name]
+
+
+def slot_map(names: List[str]) -> Dict[str, int]:
+    """Name -> position, keeping the first position of a repeated name"""
+    slots: Dict[str, int] = {}
+    for slot, name in enumerate(names):
+        slots.setdefault(name, slot)
+    return slots
+
+
+def slot_order(slots: Dict[str, int]) -> List[str]:
+    """Inverse of slot_map"""
+    return sorted(slots, key=slots.get)
+
+
+def arity_map(obj: dict) -> Dict[str, int]:
+    """Method name -> arity, from the arities list of an object
+    file (parallel to its methods list); object files from before
+    we recorded arities have none
+    """
+    return {name: arity
+            for name, arity in zip(obj["methods"], obj.get("arities", []))
+            if arity >= 0}
+
+
+# ----------------
+#  Signature cache:  Module signatures (method and field slot
+#  maps) keyed by object file path.  An entry is reused without
+#  parsing the object file if the file's mtime and size are
+#  unchanged, or if its content hash is unchanged.  The cache
+#  is kept on disk (CONFIG.signature_cache) between runs.
+#
+SIGNATURES: Dict[str, dict] = {}
+SIGNATURES_LOADED = False
+SIGNATURES_CHANGED: Dict[str, dict] = {}  # Entries to write back
+
+# Class name -> object file, from the directories in CONFIG.search_path
+LIBRARY_INDEX: Dict[str, Path] = {}
+# Modification times of those directories when we indexed them
+LIBRARY_STAMP: List[Optional[int]] = []
+
+
+def index_library():
+    """Index the object files in the search path, once,
+    so we don't probe every directory for every import.
+    Earlier directories take precedence.
+    """
+    for directory in reversed(CONFIG.search_path):
+        if directory.is_dir():
+            # Binary object files are preferred, as in the loader
+            for suffix in reversed(objfile.SUFFIXES):
+                for path in directory.glob(f"*{suffix}"):
+                    LIBRARY_INDEX[path.stem] = path
+
+
+def refresh_library():
+    """Forget the library index if object files have been added,
+    removed, or replaced (which changes their directory) since we
+    made it.  Changes to the content of an object file are caught
+    by module_signature.
+    """
+    stamp = []
+    for directory in CONFIG.search_path:
+        try:
+            stamp.append(directory.stat().st_mtime_ns)
+        except OSError:
+            stamp.append(None)
+    if stamp != LIBRARY_STAMP:
+        LIBRARY_INDEX.clear()
+        LIBRARY_STAMP[:] = stamp
+
+
+def use_outdir(outdir: Path):
+    """Look for imports in outdir before the rest of the search path,
+    so that a class sees the object files just written there for the
+    classes it depends on, rather than older copies in TVMLIB.
+    """
+    outdir = Path(outdir)
+    search_path = [outdir] + [directory for directory in CONFIG.search_path
+                              if directory.resolve() != outdir.resolve()]
+    if search_path != CONFIG.search_path:
+        CONFIG.search_path = search_path
+        LIBRARY_INDEX.clear()
+        LIBRARY_STAMP.clear()
+
+
+def find_module(module: str) -> Path:
+    """Path to the object file for module"""
+    if not LIBRARY_INDEX:
+        index_library()
+    if module not in LIBRARY_INDEX:
+        # Might have been written since we indexed the library,
+        # e.g., by an earlier class in a batch.
+        for directory in CONFIG.search_path:
+            for suffix in objfile.SUFFIXES:
+                path = directory.joinpath(module).with_suffix(suffix)
+                if path.exists():
+                    LIBRARY_INDEX[module] = path
+                    break
+            if module in LIBRARY_INDEX:
+                break
+        else:
+            # Not found; let the caller fail on the usual path
+            return CONFIG.tvmlib.joinpath(module).with_suffix(".json")
+    return LIBRARY_INDEX[module]
+
+
+def load_signature_cache():
+    global SIGNATURES_LOADED
+    SIGNATURES_LOADED = True
+    try:
+        with open(CONFIG.signature_cache, "r") as f:
+            SIGNATURES.update(json.load(f))
+    except (OSError, ValueError):
+        # Missing or damaged cache just means we parse imports
+        log.debug(f"No usable signature cache {CONFIG.signature_cache}")
+
+
+def save_signature_cache(entries: Dict[str, dict]):
+    """Merge entries into the on-disk cache.  The file is replaced
+    atomically, since batch mode may have several writers.
+    """
+    if not entries:
+        return
+    cached: Dict[str, dict] = {}
+    try:
+        with open(CONFIG.signature_cache, "r") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        pass
+    cached.update(entries)
+    temp = CONFIG.signature_cache.with_name(
+        f"{CONFIG.signature_cache.name}.{os.getpid()}")
+    try:
+        with open(temp, "w") as f:
+            json.dump(cached, f)
+        os.replace(temp, CONFIG.signature_cache)
+    except OSError as e:
+        log.warning(f"Could not save signature cache: {e}")
+
+
+def module_signature(path: Path) -> dict:
+    """Method and field slot maps, and method arities,
+    of the object file at path
+    """
+    if not SIGNATURES_LOADED:
+        load_signature_cache()
+    key = str(path)
+    stat = path.stat()
+    entry = SIGNATURES.get(key)
+    if entry and "arities" not in entry:
+        entry = None  # Cached before we recorded arities
+    if entry and (entry["mtime"], entry["size"]) == \
+            (stat.st_mtime_ns, stat.st_size):
+        return entry
+    with open(path, "rb") as source:
+        content = source.read()
+    import hashlib
+    digest = hashlib.sha256(content).hexdigest()
+    if not (entry and entry["hash"] == digest):
+        log.debug(f"Parsing signature of {path}")
+        obj = objfile.loads(content)
+        entry = {"hash": digest,
+                 "methods": slot_map(obj["methods"]),
+                 "fields": slot_map(obj["fields"]),
+                 "arities": arity_map(obj)}
+    entry = dict(entry, mtime=stat.st_mtime_ns, size=stat.st_size)
+    SIGNATURES[key] = entry
+    SIGNATURES_CHANGED[key] = entry
+    return entry
 
 
 IMPORTS: Dict[str, Optional[ImportedModule]] = { "$": None }
 # $ will be replaced by current class name in output .json file
+# Position of each module in IMPORTS, for new and is_instance
+IMPORT_SLOTS: Dict[str, int] = { "$": 0 }
+# Object file path -> (signature hash, module), kept across
+# classes assembled by one process
+MODULES: Dict[str, Tuple[str, ImportedModule]] = {}
 
 
 def import_module(module: str) -> ImportedModule:
     if module not in IMPORTS:
-        path = CONFIG.tvmlib.joinpath(module).with_suffix(".json")
-        IMPORTS[module] = ImportedModule(path)
+        path = find_module(module)
+        signature = module_signature(path)
+        cached = MODULES.get(str(path))
+        if not cached or cached[0] != signature["hash"]:
+            cached = (signature["hash"], ImportedModule(signature))
+            MODULES[str(path)] = cached
+        IMPORT_SLOTS[module] = len(IMPORTS)
+        IMPORTS[module] = cached[1]
     return IMPORTS[module]
 
 
+# ----------------
+#  Symbol tables:  Methods, fields, arguments, and locals
+#  are ordered (position is the slot number), but we look
+#  them up by name for every symbolic operand, so we keep
+#  a dict from name to slot alongside the list.
+#
+class SymbolTable:
+    """Ordered list of names with constant time lookup
+    of each name's position.  Supports the list operations
+    the assembler used on plain lists of names.
+    """
+    def __init__(self, names: Iterable[str] = ()):
+        self.names: List[str] = []
+        self.slots: Dict[str, int] = {}
+        for name in names:
+            self.append(name)
+
+    def append(self, name: str):
+        # Like list.index, a repeated name keeps its first slot
+        self.slots.setdefault(name, len(self.names))
+        self.names.append(name)
+
+    def index(self, name: str) -> int:
+        """Slot of name; raises KeyError if not present"""
+        return self.slots[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.slots
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
+
+    def __getitem__(self, slot: int) -> str:
+        return self.names[slot]
+
+
 # The named literals MUST match the definitions
 # in vm_loader.h for CODE_NOTHING, etc
 # #define CODE_NOTHING  (-1)
@@ -108,8 +392,9 @@ NAMED_LITERALS = {
 #  The instruction set of the machine and the numeric
 #  encoding of instructions must be consistent between
 #  assembler and loader, so it is derived from a common
-#  text file, opdefs.txt.  The assembler constructs an
-#  internal representation for translation.
+#  text file, opdefs.txt.  build_bytecode_table.py turns it
+#  into the loader's table and into opcodes.py, from which the
+#  assembler constructs an internal representation for translation.
 #
 #  There is one ugly hack in this scheme:  We need to
 #  know that constants are re-encoded in the loader, because
@@ -122,6 +407,17 @@ class InstructionDef:
         self.name = name
         self.code = code
         self.ops = ops
+        # A fused operation replaces a sequence of (name, operand
+        # pattern), and carries the operand of one of them
+        self.parts: List[Tuple[str, Optional[str]]] = []
+        self.operand_op: Optional[str] = name if ops else None
+
+    def fuses(self, parts: List[Tuple[str, Optional[str]]]):
+        self.parts = parts
+        self.operand_op = None
+        for name, pattern in parts:
+            if pattern in OPERAND_MARKERS:
+                self.operand_op = name
 
     def size(self) -> int:
         """An instruction without an operand
@@ -141,29 +437,35 @@ class InstructionSet:
     """A dict-like structure
     mapping instruction names to InstructionCode objects
     """
-    def __init__(self, path: str):
+    def __init__(self, opdefs: Iterable[Tuple[str, int, int]],
+                 fusions: Iterable[Tuple[str, list]] = ()):
+        """Instruction set initialized from (name, code, ops) table,
+        and the sequences that fused operations replace
+        """
         self.ops: Dict[str, InstructionDef] = {}
-        """Instruction set initialized from text table"""
-        opcode = 0
-        with open(path, "r") as f:
-            for line in f:
-                # Strip comments, discard empty lines
-                line = line.split("#")[0].strip()
-                if not line:
-                    continue
-                # What remains should be an instruction definition
-                parts = line.split(",")
-                name, code, ops = parts
-                instr = InstructionDef(name, opcode, ops)
-                self.ops[name] = instr
-                opcode += 1
+        for name, code, ops in opdefs:
+            self.ops[name] = InstructionDef(name, code, ops)
+        self.fused: List[InstructionDef] = []
+        for name, parts in fusions:
+            self.ops[name].fuses(parts)
+            self.fused.append(self.ops[name])
+        # Try longer sequences first
+        self.fused.sort(key=lambda op: len(op.parts), reverse=True)
 
     def __getitem__(self, name: str):
         return self.ops[name]
 
 
+# Operand patterns (in fused sequences) that match an operand
+# for the fused operation to carry
+OPERAND_MARKERS = {
+    "<any>": lambda operand: True,
+    "<int>": lambda operand: operand.isdigit(),
+    "<str>": lambda operand: operand.startswith('"'),
+}
+
 # Instruction set is global
-INSTRS = InstructionSet("opdefs.txt")
+INSTRS = InstructionSet(opcodes.OPDEFS, opcodes.FUSIONS)
 
 
 class Instruction:
@@ -174,7 +476,7 @@ class Instruction:
         self.label = label
         self.operation = operation
         self.operand = operand
-        if operation.ops == '0':
+        if operation.ops == 0:
             assert operand is None
         else:
             assert operand is not None
@@ -195,27 +497,82 @@ class Instruction:
 # Our object file will be a JSON structure with
 # constants, code, and other information.  We'll build
 # it up in an object and then dump it all at once.
+# In streaming mode, code for each method is set aside
+# in a temporary file as soon as the method is finished,
+# so that only the current method is kept in memory.
 #
 UNRESOLVED_ADDRESS = -42  # Just an easily recognized value
 
+# The loader remaps each class's constants through a fixed
+# size table; this MUST match constant_renumber_map in vm_loader.c
+LOADER_CONSTANT_CAPACITY = 30
 
-class ObjectCode:
+
+class MethodSpool:
+    """Finished methods, kept in a temporary file rather than
+    in memory.  Can be iterated any number of times.  A method
+    may be replaced (e.g., to add max_stack); the new version is
+    written at the end of the file, and the old one is skipped.
+    """
     def __init__(self):
+        import tempfile
+        self.file = tempfile.TemporaryFile("w+", encoding="utf-8")
+        self.offsets: List[int] = []  # Of each method's current version
+
+    def write(self, method: dict) -> int:
+        self.file.seek(0, os.SEEK_END)
+        offset = self.file.tell()
+        self.file.write(json.dumps(method, separators=(",", ":")) + "\n")
+        return offset
+
+    def append(self, method: dict):
+        self.offsets.append(self.write(method))
+
+    def __setitem__(self, index: int, method: dict):
+        self.offsets[index] = self.write(method)
+
+    def __getitem__(self, index: int) -> dict:
+        self.file.seek(self.offsets[index])
+        return json.loads(self.file.readline())
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __iter__(self) -> Iterator[dict]:
+        for index in range(len(self.offsets)):
+            yield self[index]
+
+
+class ObjectCode:
+    def __init__(self, stream: bool = False, optimize: bool = False,
+                 fuse: bool = False):
         # The following are initialized in declare_class
         self.class_name: str = ""
         self.super_name: str = ""
-        self.method_list: List[str] = []
-        self.field_list: List[str] = []
-        # Constant pool
-        self.constants: List[Tuple[str, int]] = []
+        self.method_list = SymbolTable()
+        self.field_list = SymbolTable()
+        # Constant pool, with each (kind, value) entered once
+        self.constants: List[Dict[str, str]] = []
+        self.constant_index: Dict[Tuple[str, str], int] = {}
+        self.constants_interned = 0  # Duplicate entries avoided
         # Method code (instructions)
         self.code = []  # Will expand to code per method
         # For each method defined here, we want its
         # name, its slot# (position in vtable), its
         # local variable names, and its code.
-        self.method_code: List[dict] = []
-        self.method_locals: List[str] = []
-        self.method_args: List[str] = []
+        self.method_code: Union[List[dict], MethodSpool] = \
+            MethodSpool() if stream else []
+        self.method: Optional[dict] = None  # The one being assembled
+        self.method_locals = SymbolTable()
+        self.method_args = SymbolTable()
+        # Method name -> arity, inherited and defined here
+        self.arities: Dict[str, int] = {}
+        # Position -> "Class:method" of each call in the current method
+        self.calls: Dict[int, str] = {}
+        # Positions in method_code (with their calls) of finished
+        # methods waiting for max_stack, which needs the arity of
+        # each method they call
+        self.unmeasured: List[Tuple[int, Dict[int, str]]] = []
         # Things to be resolved
         # Labels resolve to addresses within the code
         # of a method.
@@ -223,6 +580,18 @@ class ObjectCode:
         self.labels: Dict[str, int] = {}
         # address -> unresolved label
         self.label_patch: Dict[int, str] = {}
+        # With optimize or fuse, instructions and labels of each
+        # method are held here for the peephole and fusion passes,
+        # then encoded
+        self.optimize = optimize
+        self.fuse = fuse
+        self.held: Optional[List[Union[str, Instruction]]] = \
+            [] if optimize or fuse else None
+        self.peephole_removed = 0  # Instructions
+        self.peephole_removed_words = 0
+        self.fused = 0  # Sequences replaced by fused operations
+        self.slots_saved = 0  # Local variable slots shared (with -O)
+        self.devirtualized = 0  # Calls made direct (with -O)
 
     def declare_class(self, name: str, super_name: str):
         self.class_name = name
@@ -231,9 +600,11 @@ class ObjectCode:
         # Methods and field list are initially those
         # we inherit, but may be extended elsewhere
         # in the assembly code
-        self.method_list = super_module.methods
+        # (copies, so that the imported module is not altered)
+        self.method_list = SymbolTable(super_module.methods)
         self.n_inherited = len(super_module.methods)
-        self.field_list = super_module.fields
+        self.field_list = SymbolTable(super_module.fields)
+        self.arities = dict(super_module.arities)
         # AND we need to be able to refer to this class in NEW
 
     def declare_field(self, name: str):
@@ -257,7 +628,7 @@ class ObjectCode:
         # it's not filled in later in the code.
 
     def begin_method(self, method_name: str):
-        self.resolve_jumps()  # Of preceding method!
+        self.end_method()  # The preceding method!
         # And then re-initialize tables
         # label -> address
         self.labels: Dict[str, int] = {}
@@ -268,18 +639,112 @@ class ObjectCode:
             self.method_list.append(method_name)
         method_slot = self.method_list.index(method_name)
         # Initialize code block
-        self.method_locals = []
+        self.method_locals = SymbolTable()
         self.code = []  # We will append instructions to this list
-        self.method_code.append({"name": method_name, "slot": method_slot,
-                                 "code": self.code})
+        self.calls = {}
+        self.method = {"name": method_name, "slot": method_slot,
+                       "code": self.code}
+
+    def end_method(self):
+        """Finish the code of the current method"""
+        self.finish_code()
+        if self.method:
+            self.arities[self.method["name"]] = return_arity(self.code)
+            # Methods go into the object code in the order they are
+            # defined.  One that calls a method defined later waits
+            # there for its max_stack.
+            measured = self.measure(self.method, self.calls)
+            if measured is None:
+                self.unmeasured.append((len(self.method_code), self.calls))
+                measured = self.method
+            self.method_code.append(measured)
+            self.method = None
+            self.measure_methods()
+
+    def call_arity(self, full_name: str) -> Optional[int]:
+        """Arity of "Class:method", if known"""
+        class_name, method_name = full_name.split(":")
+        if class_name == "$":
+            return self.arities.get(method_name)
+        return import_module(class_name).arity(method_name)
+
+    def measure(self, method: dict, calls: Dict[int, str],
+                final: bool = False) -> Optional[dict]:
+        """method with max_stack added, or None if it calls a
+        method defined later in this class and this is not the
+        final call
+        """
+        undefined = sorted({target for target in calls.values()
+                            if target.startswith("$:")
+                            and target[2:] not in self.arities})
+        if undefined and not final:
+            return None
+        where = f"{self.class_name}:{method['name']}"
+        for target in undefined:
+            log.error(f"{where} calls {target}, "
+                      f"which is declared but not defined")
+        depth = None if undefined else max_stack_depth(
+            method["code"], calls, self.call_arity, where)
+        if depth is None:
+            return method
+        if self.optimize:
+            self.devirtualized += devirtualize(
+                method["code"], calls, self.constants,
+                [self.class_name] + list(IMPORTS)[1:],
+                self.call_arity)
+        return {"name": method["name"], "slot": method["slot"],
+                "max_stack": depth, "code": method["code"]}
+
+    def measure_methods(self, final: bool = False):
+        """Add max_stack, in place, to the waiting methods whose
+        callees' arities we now know (or to all, if final)
+        """
+        waiting = []
+        for position, calls in self.unmeasured:
+            method = self.measure(self.method_code[position], calls, final)
+            if method is None:
+                waiting.append((position, calls))
+            else:
+                self.method_code[position] = method
+        self.unmeasured = waiting
+
+    def finish_code(self):
+        """Encode instructions held for the peephole and
+        fusion passes, then resolve jumps
+        """
+        if self.held:
+            held, self.held = self.held, None
+            optimized = held
+            if self.optimize:
+                # Locals that are not also arguments
+                private = set(self.method_locals) - set(self.method_args)
+                optimized = peephole(held, private)
+                self.peephole_removed += count_instructions(held) \
+                    - count_instructions(optimized)
+                self.peephole_removed_words += count_words(held) \
+                    - count_words(optimized)
+            if self.fuse:
+                optimized, n_fused = fuse(optimized)
+                self.fused += n_fused
+            for item in optimized:
+                if isinstance(item, str):
+                    self.add_label(item)
+                else:
+                    self.add_instruction(item)
+            self.held = []
+            if self.optimize:
+                # Needs the jumps resolved, to follow control flow
+                self.resolve_jumps()
+                self.slots_saved += share_local_slots(self.code)
+        self.resolve_jumps()
 
     def declare_locals(self, method_locals: List[str]):
         """Map local variable names to position in activation record"""
-        self.method_locals = method_locals
+        self.method_locals = SymbolTable(method_locals)
 
     def declare_args(self, args: List[str]):
         """Map argument names to offsets *before* the frame pointer"""
-        self.method_args = args
+        self.method_args = SymbolTable(args)
 
     def resolve_local(self, var: str) -> int:
         """Map local variable to position in activation record.
@@ -335,8 +800,7 @@ class ObjectCode:
 
     def resolve_class(self, class_name: str) -> int:
         import_module(class_name)  # In case we need to
-        index = list(IMPORTS).index(class_name)
-        return index
+        return IMPORT_SLOTS[class_name]
 
     def resolve_jumps(self):
         """Patch up references to code labels"""
@@ -349,8 +813,9 @@ class ObjectCode:
                 self.code[patch_loc] = jump_span
                 log.debug(f"Jump from loc {patch_loc} to {patch_label} "
                           f"({label_loc}) is {jump_span} words")
-            except IndexError:
+            except LookupError:
                 log.error(f"Unresolved label '{patch_label}'")
+        self.label_patch = {}  # All patched
 
     def add_int_constant(self, literal: str) -> int:
         literal_index = len(self.int_constants)
@@ -362,11 +827,33 @@ class ObjectCode:
         self.str_constants.append(literal)
         return literal_index
 
+    def intern_constant(self, kind: str, value: str) -> int:
+        """Index of (kind, value) in the constant pool,
+        adding it only the first time it is used in this class.
+        """
+        key = (kind, value)
+        if key in self.constant_index:
+            self.constants_interned += 1
+            return self.constant_index[key]
+        self.constant_index[key] = len(self.constants)
+        self.constants.append({"kind": kind, "value": value})
+        if len(self.constants) == LOADER_CONSTANT_CAPACITY:
+            log.warning(f"Class {self.class_name} has more constants "
+                        f"than the loader can hold "
+                        f"({LOADER_CONSTANT_CAPACITY - 1})")
+        return self.constant_index[key]
+
     def add_label(self, label: str):
         """On a line by itself"""
+        if self.held is not None:
+            self.held.append(label)
+            return
         self.labels[label] = len(self.code)
 
     def add_instruction(self, instr: Instruction):
+        if self.held is not None:
+            self.held.append(instr)
+            return
         if instr.label:
             # Address of next instruction
             self.labels[instr.label] = len(self.code)
@@ -379,7 +866,8 @@ class ObjectCode:
 
     def encode_operand(self, instr: Instruction):
         """Each operand type is idiosyncratic"""
-        op: str = instr.operation.name
+        # A fused operation carries the operand of one of its parts
+        op: str = instr.operation.operand_op
         operand: str = instr.operand
         if op == "const":
             # We have integer constants and string
@@ -400,10 +888,12 @@ class ObjectCode:
             else:
                 log.error(f"Could not type operand '{operand}'")
                 kind = "BOGUS CONSTANT"
-            self.constants.append({"kind": kind, "value": operand})
-            return len(self.constants) - 1
+            return self.intern_constant(kind, operand)
         if op == "call":
             slot = self.resolve_call(operand)
+            # The call's effect on the stack depends on the arity
+            # of the method, which the slot does not tell us
+            self.calls[len(self.code) - 1] = operand
             return slot
         if op in ["load_field", "store_field"]:
             # These operations use indexes into the fields of an object
@@ -427,13 +917,18 @@ class ObjectCode:
         # Match should be exhaustive
         log.error(f"Unhandled operand type for {instr}")
 
-    def json(self) -> str:
-        struct = {
+    def struct(self) -> dict:
+        """Object code structure, for either object file format"""
+        self.measure_methods(final=True)
+        return {
             "class_name": self.class_name,
             "super": self.super_name,
             "imports": [self.class_name] + list(IMPORTS)[1:],
-            "methods": self.method_list,
-            "fields": self.field_list,
+            "methods": self.method_list.names,
+            # Arity of each method, or -1 if not known
+            "arities": [self.arities.get(name, -1)
+                        for name in self.method_list],
+            "fields": self.field_list.names,
             # It's just simpler to count fields and methods
             # in the assembler than in the loader, so we'll add
             # some redundant information here.
@@ -443,7 +938,24 @@ class ObjectCode:
             "constants": self.constants,
             "code": self.method_code
         }
-        return json.dumps(struct, indent=4)
+
+    def json(self) -> str:
+        f = io.StringIO()
+        objfile.write_json(self.struct(), f)
+        return f.getvalue()
+
+    def binary(self) -> bytes:
+        return objfile.dump(self.struct())
+
+    def write(self, target, format: str = "json"):
+        """Write object code to a (text mode) file"""
+        if format == "binary":
+            target.flush()
+            objfile.write_binary(self.struct(), target.buffer)
+            target.buffer.flush()
+        else:
+            objfile.write_json(self.struct(), target)
+            print(file=target)
 
     def __str__(self) -> str:
         return self.json()
@@ -456,13 +968,35 @@ class ObjectCode:
 #
 
 def strip_comments(line: str) -> str:
-    return line.split("#")[0].strip()
+    comment = line.find("#")
+    if comment >= 0:
+        line = line[:comment]
+    return line.strip()
     # Note comment lines will now be empty,
     # as will blank lines.
 
 
+class LazyPattern:
+    """A regular expression compiled when first used, so that
+    starting the assembler does not wait for all of them
+    """
+    def __init__(self, pattern: str, flags: int = 0):
+        self.pattern = pattern
+        self.flags = flags
+
+    def __getattr__(self, name: str):
+        # Called only until we have compiled the pattern
+        if name.startswith("__"):
+            raise AttributeError(name)
+        compiled = re.compile(self.pattern, self.flags)
+        self.match = compiled.match
+        self.fullmatch = compiled.fullmatch
+        self.search = compiled.search
+        return getattr(compiled, name)
+
+
 # Instruction pattern (single operation of vm)
-INSTR_PAT = re.compile(r"""
+INSTR_PAT = LazyPattern(r"""
     ((?P<label> \w+) [:] )?   # Optional label
     \s*
     (?P<opname> [a-zA-Z_]+)      # Operation name is required
@@ -481,13 +1015,13 @@ INSTR_PAT = re.compile(r"""
     """, re.VERBOSE)
 
 # Bare labels
-LABEL_PAT = re.compile(r"""
+LABEL_PAT = LazyPattern(r"""
     ((?P<label> \w+):)   # Nothing but the label
    \s*
     """, re.VERBOSE)
 
 # Directive:  Name this class
-CLASS_DECL_PAT = re.compile(r"""
+CLASS_DECL_PAT = LazyPattern(r"""
 [.]class \s+ 
 (?P<class_name> [\w$]+ )[:](?P<super_name> \w+)
 \s*
@@ -495,7 +1029,7 @@ CLASS_DECL_PAT = re.compile(r"""
 
 # Directive: Name this method
 #   (Starts a new method entry in the code object)
-METHOD_DEF_PAT = re.compile(r"""
+METHOD_DEF_PAT = LazyPattern(r"""
 [.]method \s+
 (?P<method_name> [$]?\w+ )
 \s*
@@ -504,7 +1038,7 @@ METHOD_DEF_PAT = re.compile(r"""
 # Directive:  Declare a method to be defined
 # later in this class, so we can call it before
 # we define it.
-METHOD_DECL_PAT = re.compile(r"""
+METHOD_DECL_PAT = LazyPattern(r"""
 [.]method \s+ 
 (?P<method_name> [$]?\w+ )
 \s+ forward
@@ -513,7 +1047,7 @@ METHOD_DECL_PAT = re.compile(r"""
 
 
 # Directive: Add a field to the objects of this class
-FIELD_DECL_PAT = re.compile(r"""
+FIELD_DECL_PAT = LazyPattern(r"""
 [.]field \s+
 (?P<field_name> \w+ )
 \s*
@@ -522,7 +1056,7 @@ FIELD_DECL_PAT = re.compile(r"""
 # Local variable:  The assembler emits an "alloc" instruction
 #   and records the positions of local variables so that they
 #   can be used within method code.
-LOCALS_DECL_PAT = re.compile(r"""
+LOCALS_DECL_PAT = LazyPattern(r"""
 [.]local \s+
 (?P<local_var_name> (\w+)(,\w+)*)
 \s*
@@ -531,110 +1065,1279 @@ LOCALS_DECL_PAT = re.compile(r"""
 # Method argument:
 #    These will have addresses that are at a negative
 #    offset from the frame pointer
-ARGS_DECL_PAT = re.compile(r"""
+ARGS_DECL_PAT = LazyPattern(r"""
 [.]args \s+
 (?P<arg_var_name> (\w+)(,\w+)*)
 \s*
 """, re.VERBOSE)
 
 
-def translate(lines: List[str]) -> ObjectCode:
-    code = ObjectCode()
+# Directives are recognized by the leading dot, so we can
+# dispatch on the word after it and try only the patterns
+# for that directive.  Anything else is an instruction or
+# a bare label.
+DIRECTIVE_PAT = LazyPattern(r"[.](\w+)")
+DIRECTIVES = {
+    "class": [("class", CLASS_DECL_PAT)],
+    # .method f forward must be tried before .method f
+    "method": [("method_decl", METHOD_DECL_PAT),
+               ("method_def", METHOD_DEF_PAT)],
+    "field": [("field", FIELD_DECL_PAT)],
+    "local": [("local", LOCALS_DECL_PAT)],
+    "args": [("args", ARGS_DECL_PAT)]
+}
+
+
+def lex(lines: Iterable[str]) -> Iterator[Tuple[str, Dict[str, str]]]:
+    """Classify each non-empty line, yielding its kind
+    (class, method_decl, method_def, field, local, args,
+    instr, or label) and the named parts of the line.
+    Lines that cannot be classified are logged and skipped.
+    """
     for line in lines:
         line = strip_comments(line)
         if not line:
             continue
-
-        # Kinds of assembly language line:
-        # Class declaration (.class)
-        match = CLASS_DECL_PAT.match(line)
-        if match:
-            class_name = match.groupdict()["class_name"]
-            superclass_name = match.groupdict()["super_name"]
-            code.declare_class(class_name, superclass_name)
+        if line[0] == ".":
+            keyword = DIRECTIVE_PAT.match(line)
+            for kind, pattern in DIRECTIVES.get(keyword and keyword[1], []):
+                match = pattern.match(line)
+                if match:
+                    yield kind, match.groupdict()
+                    break
+            else:
+                log.error(f"NO MATCH on '{line}'")
             continue
-
-        # Method (.method f forward) to be filled in later
-        match = METHOD_DECL_PAT.match(line)
+        # An operation (label: operation operand)
+        match = INSTR_PAT.fullmatch(line)
         if match:
-            method_name = match.groupdict()["method_name"]
-            code.declare_method(method_name)
+            yield "instr", match.groupdict()
             continue
-
-        # Method (.method) followed immediately by body
-        match = METHOD_DEF_PAT.match(line)
+        # A label with no instruction
+        match = LABEL_PAT.match(line)
         if match:
-            method_name = match.groupdict()["method_name"]
-            code.begin_method(method_name)
+            yield "label", match.groupdict()
             continue
+        log.error(f"NO MATCH on '{line}'")
+
+
+def translate(lines: Iterable[str],
+              method_cache: Optional["MethodCache"] = None,
+              stream: bool = False, optimize: bool = False,
+              fuse: bool = False) -> ObjectCode:
+    code = ObjectCode(stream, optimize, fuse)
+    if method_cache:
+        for block in method_blocks(lines):
+            method_cache.translate_block(code, block)
+    else:
+        for kind, parts in lex(lines):
+            translate_line(code, kind, parts)
+    code.end_method()  # The last method entered
+    return code
 
-        # Field declaration, ".field name"
-        match = FIELD_DECL_PAT.match(line)
-        if match:
-            field_name = match.groupdict()["field_name"]
-            code.declare_field(field_name)
-            continue
 
-        # Local variable declaration, ".local name,name,name"
-        match = LOCALS_DECL_PAT.match(line)
-        if match:
-            locals_name_list = match.groupdict()["local_var_name"]
-            method_locals = locals_name_list.split(",")
-            n_locals = len(method_locals)
-            # Allocate space on stack for local variables
-            code.add_instruction(Instruction(
-                label=None,
-                operation=INSTRS["alloc"],
-                operand=n_locals))
-            # Now set up locals symbol table information
-            code.declare_locals(method_locals)
-            continue
+def translate_line(code: ObjectCode, kind: str, parts: Dict[str, str]):
+    """Add one line, as classified by lex, to the object code"""
+    # Kinds of assembly language line, most common first
+    # An operation (label: operation operand)
+    if kind == "instr":
+        instruction = Instruction(parts["label"], INSTRS[parts["opname"]],
+                                  parts["operand"])
+        code.add_instruction(instruction)
+
+    # A label with no instruction
+    elif kind == "label":
+        code.add_label(parts["label"])
+
+    # Class declaration (.class)
+    elif kind == "class":
+        code.declare_class(parts["class_name"], parts["super_name"])
+
+    # Method (.method f forward) to be filled in later
+    elif kind == "method_decl":
+        code.declare_method(parts["method_name"])
+
+    # Method (.method) followed immediately by body
+    elif kind == "method_def":
+        code.begin_method(parts["method_name"])
+
+    # Field declaration, ".field name"
+    elif kind == "field":
+        code.declare_field(parts["field_name"])
+
+    # Local variable declaration, ".local name,name,name"
+    elif kind == "local":
+        method_locals = parts["local_var_name"].split(",")
+        n_locals = len(method_locals)
+        # Allocate space on stack for local variables
+        code.add_instruction(Instruction(
+            label=None,
+            operation=INSTRS["alloc"],
+            operand=n_locals))
+        # Now set up locals symbol table information
+        code.declare_locals(method_locals)
+
+    # Argument declaration, ".args name,name,name"
+    elif kind == "args":
+        args = parts["arg_var_name"].split(",")
+        # No space allocation needed, unlike local variables,
+        # because these are *before* (at negative offsets from)
+        # the frame pointer.
+        # Set up locals symbol table information
+        code.declare_args(args)
 
-        # Local variable declaration, ".local name,name,name"
-        match = ARGS_DECL_PAT.match(line)
-        if match:
-            locals_name_list = match.groupdict()["arg_var_name"]
-            args = locals_name_list.split(",")
-            # No space allocation needed, unlike local variables,
-            # because these are *before* (at negative offsets from)
-            # the frame pointer.
-            # Set up locals symbol table information
-            code.declare_args(args)
-            continue
 
-        # An operation (label: operation operand)
-        match = INSTR_PAT.fullmatch(line)
-        if match:
-            parts = match.groupdict()
-            label = parts["label"]
-            opname = parts["opname"]
-            operand = parts["operand"]
-            instruction = Instruction(label, INSTRS[opname], operand)
-            code.add_instruction(instruction)
+# ----------------
+#  Peephole optimization (-O):  Compilers emit redundant
+#  sequences, and every instruction we remove is one less
+#  dispatch in the VM.  The instructions and labels of each
+#  method are held until the method is finished, simplified
+#  here, and then encoded.  Labels of removed instructions
+#  move to the next instruction kept, so jumps still land
+#  where they should.
+#
+JUMPS = ["jump", "jump_if", "jump_ifnot"]
+NO_FALL_THROUGH = ["jump", "return", "halt"]
+Node = Tuple[List[str], Instruction]  # Labels of the instruction
+
+
+def peephole(items: List[Union[str, Instruction]],
+             method_locals: Set[str]) -> List[Union[str, Instruction]]:
+    """Simplified instructions (with labels) of one method"""
+    nodes: List[Node] = []
+    labels: List[str] = []
+    for item in items:
+        if isinstance(item, str):
+            labels.append(item)
             continue
+        if item.label:
+            labels.append(item.label)
+        nodes.append((labels, Instruction(None, item.operation, item.operand)))
+        labels = []
+    trailing = labels  # Labels at the end of the method
+    changed = True
+    while changed:
+        nodes, trailing, changed = peephole_pass(nodes, trailing,
+                                                 method_locals)
+    optimized: List[Union[str, Instruction]] = []
+    for labels, instr in nodes:
+        optimized.extend(labels)
+        optimized.append(instr)
+    optimized.extend(trailing)
+    return optimized
+
+
+def peephole_pass(nodes: List[Node], trailing: List[str],
+                  method_locals: Set[str]
+                  ) -> Tuple[List[Node], List[str], bool]:
+    """One pass over the method; returns kept nodes, trailing
+    labels, and whether anything changed
+    """
+    position = {label: i for i, (labels, _) in enumerate(nodes)
+                for label in labels}
+    position.update((label, len(nodes)) for label in trailing)
+    loads: Dict[str, int] = {}
+    targets: Set[str] = set()  # Labels that some jump refers to
+    for _, instr in nodes:
+        if instr.operation.name == "load":
+            loads[instr.operand] = loads.get(instr.operand, 0) + 1
+        elif instr.operation.name in JUMPS:
+            targets.add(instr.operand)
+
+    def thread(label: str) -> str:
+        """Final destination of a jump to label, through any
+        unconditional jumps found there
+        """
+        seen = {label}
+        while position.get(label, len(nodes)) < len(nodes):
+            instr = nodes[position[label]][1]
+            if instr.operation.name != "jump" or instr.operand in seen:
+                break
+            label = instr.operand
+            seen.add(label)
+        return label
+
+    kept: List[Node] = []
+    moved: List[str] = []  # Labels of removed instructions
+    changed = False
+    i = 0
+    while i < len(nodes):
+        labels, instr = nodes[i]
+        labels = moved + labels
+        moved = []
+        op = instr.operation.name
+        following = nodes[i + 1][1] if i + 1 < len(nodes) else None
+        # Can we remove the following instruction?  Not if it is
+        # the target of a jump
+        following_free = following and targets.isdisjoint(nodes[i + 1][0])
+        if op in JUMPS:
+            target = thread(instr.operand)
+            if target != instr.operand:
+                instr = Instruction(None, instr.operation, target)
+                changed = True
+            if position.get(target) == i + 1:
+                # Jump to the next instruction
+                changed = True
+                if op == "jump":
+                    moved = labels
+                    i += 1
+                    continue
+                # Still need to pop the condition
+                instr = Instruction(None, INSTRS["pop"], None)
+                op = "pop"
+        if op in ["const", "load"] and following_free \
+                and following.operation.name == "pop":
+            # Value pushed only to be popped
+            moved = labels
+            i += 2
+            changed = True
+            continue
+        if op == "store" and following_free \
+                and following.operation.name == "load" \
+                and following.operand == instr.operand \
+                and instr.operand in method_locals \
+                and loads[instr.operand] == 1:
+            # The value stays on the stack, and the local
+            # is not read anywhere else
+            moved = labels
+            i += 2
+            changed = True
+            continue
+        kept.append((labels, instr))
+        i += 1
+        if op in NO_FALL_THROUGH:
+            # Unreachable until the next jump target
+            while i < len(nodes) and targets.isdisjoint(nodes[i][0]):
+                moved.extend(nodes[i][0])
+                i += 1
+                changed = True
+    return kept, moved + trailing, changed
 
-        # A label with no instruction
-        # An operation (label: operation operand)
-        match = LABEL_PAT.match(line)
-        if not match:
-            log.error(f"NO MATCH on '{line}'")
+
+def count_instructions(items: List[Union[str, Instruction]]) -> int:
+    return sum(1 for item in items if not isinstance(item, str))
+
+
+def count_words(items: List[Union[str, Instruction]]) -> int:
+    return sum(1 + item.operation.ops for item in items
+               if not isinstance(item, str))
+
+
+# ----------------
+#  Fusion (--fuse):  Replace common sequences of instructions
+#  with fused operations (superinstructions, see opdefs.txt)
+#  that do the same work in one dispatch.  A sequence is fused
+#  only if no label falls within it.
+#
+def fuse(items: List[Union[str, Instruction]]
+         ) -> Tuple[List[Union[str, Instruction]], int]:
+    """Instructions with sequences fused, and how many were"""
+    fused: List[Union[str, Instruction]] = []
+    n_fused = 0
+    i = 0
+    while i < len(items):
+        for operation in INSTRS.fused:
+            instr = fused_instruction(operation,
+                                      items[i:i + len(operation.parts)])
+            if instr:
+                fused.append(instr)
+                n_fused += 1
+                i += len(operation.parts)
+                break
+        else:
+            fused.append(items[i])
+            i += 1
+    return fused, n_fused
+
+
+def fused_instruction(operation: InstructionDef,
+                      window: List[Union[str, Instruction]]
+                      ) -> Optional[Instruction]:
+    """Fused instruction, if window is the sequence it replaces"""
+    if len(window) < len(operation.parts):
+        return None
+    operand = None
+    for k, (item, (name, pattern)) in enumerate(zip(window, operation.parts)):
+        if isinstance(item, str) or item.operation.name != name \
+                or (k > 0 and item.label):
+            return None
+        if pattern in OPERAND_MARKERS:
+            if not OPERAND_MARKERS[pattern](item.operand):
+                return None
+            operand = item.operand
+        elif pattern != item.operand:
+            return None
+    return Instruction(window[0].label, operation, operand)
+
+
+# ----------------
+#  Stack depth:  The VM checks that a method's frame fits on the
+#  stack once, when the method is called, rather than on every
+#  push.  So each method in the object code records the most words
+#  it pushes above its frame header (max_stack), counting its locals
+#  and the temporaries of evaluation.  We find it by following the
+#  control flow of the encoded method, with the stack depth at each
+#  instruction, which must be the same on every path to it.
+#
+OPCODES: Dict[int, InstructionDef] = {
+    op.code: op for op in INSTRS.ops.values()}
+
+# Operation -> (words popped, words pushed), for operations whose
+# effect does not depend on the operand
+STACK_EFFECTS: Dict[str, Tuple[int, int]] = {
+    "halt": (0, 0), "enter": (0, 0), "jump": (0, 0),
+    "const": (0, 1), "load": (0, 1), "new": (0, 1), "call_native": (0, 1),
+    "pop": (1, 0), "store": (1, 0), "jump_if": (1, 0), "jump_ifnot": (1, 0),
+    "return": (1, 0),
+    "load_field": (1, 1), "is_instance": (1, 1),
+    "store_field": (2, 0)
+}
+
+
+# Opcode -> effect (as from stack_effect), for operations whose
+# effect depends on neither the operand nor a method called
+FIXED_EFFECTS: Dict[int, Tuple[int, int, int]] = {
+    op.code: (popped, pushed - popped, max(pushed - popped, 0))
+    for op in INSTRS.ops.values()
+    if op.name in STACK_EFFECTS and not op.parts
+    for popped, pushed in [STACK_EFFECTS[op.name]]}
+
+
+def decode(code: List[int]) -> Iterator[Tuple[int, InstructionDef,
+                                                Optional[int]]]:
+    """Position, operation, and operand of each encoded instruction"""
+    pc = 0
+    while pc < len(code):
+        operation = OPCODES[code[pc]]
+        operand = code[pc + 1] if operation.ops else None
+        yield pc, operation, operand
+        pc += operation.size()
+
+
+def return_arity(code: List[int]) -> int:
+    """Arguments a method reclaims when it returns (0 if it never does)"""
+    for _, operation, operand in decode(code):
+        if operation.name == "return":
+            return operand
+    return 0
+
+
+def stack_effect(operation: InstructionDef, operand: Optional[int],
+                 target: Optional[str],
+                 arity: Callable[[str], Optional[int]]
+                 ) -> Optional[Tuple[int, int, int]]:
+    """Words an operation needs on the stack, its net change to the
+    depth, and the most the depth rises within it (if it is fused),
+    or None if it calls a method whose arity we do not know.  target
+    is the operand of a call.
+    """
+    needed, net, rise = 0, 0, 0
+    for name, pattern in operation.parts or [(operation.name, None)]:
+        # A part either carries the operation's operand or has its own
+        if pattern is not None and pattern not in OPERAND_MARKERS:
+            target = pattern
+            operand = int(pattern) if pattern.isdigit() else None
+        if name in ["call", "call_builtin"]:
+            n_args = arity(target)
+            if n_args is None:
+                return None
+            popped, pushed = n_args + 1, 1  # Receiver and arguments
+        elif name == "alloc":
+            popped, pushed = 0, operand
+        elif name == "roll":
+            popped, pushed = operand + 1, operand + 1
+        else:
+            popped, pushed = STACK_EFFECTS[name]
+        needed = max(needed, popped - net)
+        net += pushed - popped
+        rise = max(rise, net)
+    return needed, net, rise
+
+
+def max_stack_depth(code: List[int], calls: Dict[int, str],
+                    arity: Callable[[str], Optional[int]],
+                    where: str) -> Optional[int]:
+    """Most words the encoded method code pushes onto its frame,
+    or None if it calls a method whose arity we do not know.
+    calls maps the position of each call to its "Class:method".
+    Paths that reach an instruction with different depths, pop
+    more than they pushed, or run off the end are errors.
+    """
+    depth_at: List[Optional[int]] = [None] * len(code)
+    deepest = 0
+    returns: Set[int] = set()
+    # Effects of operations with operands or calls, each found once
+    effects: Dict[Tuple[int, Optional[int], Optional[str]],
+                  Optional[Tuple[int, int, int]]] = {}
+
+    def reach(pc: int, depth: int) -> bool:
+        """Note that control reaches pc with depth;
+        True if it had not before
+        """
+        if pc >= len(code):
+            log.error(f"{where}: control runs off the end of the method")
+        elif depth_at[pc] is None:
+            depth_at[pc] = depth
+            return True
+        elif depth_at[pc] != depth:
+            log.error(f"{where}: unbalanced stack at {pc}: "
+                      f"depth {depth_at[pc]} on one path, "
+                      f"{depth} on another")
+        return False
+
+    work = [0] if reach(0, 0) else []
+    while work:
+        pc = work.pop()
+        depth = depth_at[pc]
+        while True:
+            # Along straight-line code from pc
+            operation = OPCODES[code[pc]]
+            operand = code[pc + 1] if operation.ops else None
+            effect = FIXED_EFFECTS.get(code[pc])
+            if effect is None:
+                key = (code[pc], operand, calls.get(pc))
+                if key not in effects:
+                    effects[key] = stack_effect(operation, operand,
+                                                calls.get(pc), arity)
+                effect = effects[key]
+            if effect is None:
+                log.warning(f"{where}: arity of the method called at "
+                            f"{pc} is not known (rebuild its object "
+                            f"file); max_stack omitted")
+                return None
+            needed, net, rise = effect
+            if needed > depth:
+                log.error(f"{where}: {operation.name} at {pc} needs "
+                          f"{needed} words on the stack, but there are "
+                          f"only {depth}")
+                depth = needed
+            if depth + rise > deepest:
+                deepest = depth + rise
+            depth += net
+            name = operation.name
+            following = pc + 1 + operation.ops
+            if name in JUMPS:
+                # Relative to the word after the operand
+                if reach(following + operand, depth):
+                    work.append(following + operand)
+            if name == "return":
+                returns.add(operand)
+            if name in NO_FALL_THROUGH:
+                break
+            if following < len(code) and depth_at[following] is None:
+                depth_at[following] = depth  # The usual case
+            elif not reach(following, depth):
+                break
+            pc = following
+    if len(returns) > 1:
+        log.error(f"{where}: returns reclaim different numbers of "
+                  f"arguments {sorted(returns)}")
+    return deepest
+
+
+# ----------------
+#  Sharing local variable slots (with -O):  Each name in .local
+#  gets its own slot, and alloc initializes every slot on every
+#  call, but compilers declare many temporaries whose values are
+#  never needed at the same time.  We divide the encoded method
+#  into basic blocks, find which locals are live (may be read
+#  before they are next stored) at each store, and give locals
+#  that are never live at each other's stores the same slot.
+#  Reading a local that was never stored gets the nothing that
+#  alloc left there; such a local is live from the start of the
+#  method, so no other local shares its slot while it is needed.
+#
+FIRST_LOCAL = 3  # Frame offset of the first local (see resolve_local)
+Decoded = Tuple[int, InstructionDef, Optional[int]]  # As from decode
+
+
+def basic_blocks(code: List[int]) -> Dict[int, List[Decoded]]:
+    """Instructions of each basic block of encoded method code,
+    by the position where the block begins, in order
+    """
+    instructions = list(decode(code))
+    starts = {0}
+    for pc, operation, operand in instructions:
+        following = pc + operation.size()
+        if operation.name in JUMPS:
+            starts.add(following + operand)
+        if operation.name in JUMPS or operation.name in NO_FALL_THROUGH:
+            starts.add(following)
+    blocks: Dict[int, List[Decoded]] = {}
+    block: List[Decoded] = []
+    for instruction in instructions:
+        if instruction[0] in starts:
+            block = blocks.setdefault(instruction[0], [])
+        block.append(instruction)
+    return blocks
+
+
+def successors(block: List[Decoded], code_length: int) -> List[int]:
+    """Where control may go after a basic block"""
+    pc, operation, operand = block[-1]
+    following = pc + operation.size()
+    targets = []
+    if operation.name in JUMPS:
+        targets.append(following + operand)
+    if operation.name not in NO_FALL_THROUGH and following < code_length:
+        targets.append(following)
+    return targets
+
+
+def local_access(operation: InstructionDef, operand: Optional[int],
+                 n_locals: int) -> Optional[str]:
+    """Whether the instruction reads or writes a local (not an
+    argument or $):  "load", "store", or None
+    """
+    if operation.operand_op in ["load", "store"] \
+            and FIRST_LOCAL <= operand < FIRST_LOCAL + n_locals:
+        return operation.operand_op
+    return None
+
+
+def share_local_slots(code: List[int]) -> int:
+    """Renumber the locals of encoded method code (in place) so that
+    locals whose values are never needed at the same time share a
+    slot, and shrink its alloc to match.  Returns the number of
+    slots saved.
+    """
+    allocs = [(pc, operand) for pc, operation, operand in decode(code)
+              if operation.name == "alloc"]
+    if len(allocs) != 1 or allocs[0][1] < 2:
+        return 0  # Nothing to share, or not as .local declares them
+    alloc_pc, n_locals = allocs[0]
+    for _, operation, operand in decode(code):
+        if operation.operand_op in ["load", "store"] \
+                and operand >= FIRST_LOCAL + n_locals:
+            return 0  # Not a declared local; leave it all alone
+    blocks = basic_blocks(code)
+    # Locals each block reads before storing, and stores
+    reads: Dict[int, Set[int]] = {}
+    stores: Dict[int, Set[int]] = {}
+    for start, block in blocks.items():
+        reads[start], stores[start] = set(), set()
+        for _, operation, operand in block:
+            access = local_access(operation, operand, n_locals)
+            if access == "load" and operand not in stores[start]:
+                reads[start].add(operand)
+            elif access == "store":
+                stores[start].add(operand)
+    following = {start: successors(block, len(code))
+                 for start, block in blocks.items()}
+    live_in: Dict[int, Set[int]] = {start: set() for start in blocks}
+    changed = True
+    while changed:
+        changed = False
+        for start in reversed(list(blocks)):
+            live = set().union(*(live_in[target]
+                                 for target in following[start]))
+            live = reads[start] | (live - stores[start])
+            if live != live_in[start]:
+                live_in[start] = live
+                changed = True
+    # Locals that must not share a slot
+    conflicts: Dict[int, Set[int]] = {
+        FIRST_LOCAL + i: set() for i in range(n_locals)}
+    for start, block in blocks.items():
+        live = set().union(*(live_in[target] for target in following[start]))
+        for _, operation, operand in reversed(block):
+            access = local_access(operation, operand, n_locals)
+            if access == "store":
+                live.discard(operand)
+                for other in live:
+                    conflicts[operand].add(other)
+                    conflicts[other].add(operand)
+            elif access == "load":
+                live.add(operand)
+    slot_of: Dict[int, int] = {}
+    for local in sorted(conflicts):
+        taken = {slot_of[other] for other in conflicts[local]
+                 if other in slot_of}
+        slot_of[local] = min(slot for slot in range(
+            FIRST_LOCAL, FIRST_LOCAL + n_locals + 1) if slot not in taken)
+    n_slots = max(slot_of.values()) + 1 - FIRST_LOCAL
+    if n_slots == n_locals:
+        return 0
+    code[alloc_pc + 1] = n_slots
+    for pc, operation, operand in decode(code):
+        if local_access(operation, operand, n_locals):
+            code[pc + 1] = slot_of[operand]
+    return n_locals - n_slots
+
+
+# ----------------
+#  Direct calls to built-in methods (with -O):  A call finds the
+#  method in the vtable of the receiver's class, and a native
+#  method such as Int:plus is a trampoline that makes a frame only
+#  to call a C function.  We follow the classes of the values on
+#  the frame stack through each method (the class of a constant,
+#  a new object, or the result of a native method, through locals
+#  and across jumps).  Where the receiver of a call is certainly of
+#  a built-in class that implements the method natively, the call
+#  becomes call_builtin, which calls the C function directly.
+#
+# Built-in classes, in the order the VM loads them (vm_loader_init),
+# with the methods each implements natively in builtins.c and the
+# class of what each returns; these MUST match the VM
+NATIVE_METHODS: Dict[str, Dict[str, str]] = {
+    "Obj": {"string": "String", "equals": "Boolean"},
+    "String": {"print": "Nothing", "equals": "Boolean"},
+    "Boolean": {"string": "String", "equals": "Boolean"},
+    "Int": {"string": "String", "equals": "Boolean", "less": "Boolean",
+            "plus": "Int", "sub": "Int", "mul": "Int", "div": "Int"},
+    "Nothing": {"string": "String", "equals": "Boolean"}
+}
+BUILTIN_INDEX = {name: i for i, name in enumerate(NATIVE_METHODS)}
+BUILTIN_SLOTS = 32  # call_builtin operand is builtin * BUILTIN_SLOTS + slot
+NAMED_LITERAL_CLASSES = {NAMED_LITERALS["nothing"]: "Nothing",
+                         NAMED_LITERALS["false"]: "Boolean",
+                         NAMED_LITERALS["true"]: "Boolean"}
+CONSTANT_CLASSES = {"i": "Int", "s": "String"}
+
+
+def devirtualize(code: List[int], calls: Dict[int, str],
+                 constants: List[Dict[str, str]], imports: List[str],
+                 arity: Callable[[str], Optional[int]]) -> int:
+    """Replace calls in encoded method code (in place) with
+    call_builtin where the receiver is certainly of a built-in class
+    that implements the method natively.  constants and imports are
+    the constant pool and class list that operands index.  Returns
+    the number of calls replaced.
+    """
+    # Class of each word on the frame stack (above the frame header,
+    # so local i is word i), or None if it is not certain
+    Stack = List[Optional[str]]
+
+    def step(stack: Stack, pc: int, operation: InstructionDef,
+             operand: Optional[int]) -> Optional[str]:
+        """Apply an instruction to stack; returns the class of the
+        receiver if the instruction is a call we can make directly
+        """
+        name = operation.name
+        if name == "const":
+            stack.append(NAMED_LITERAL_CLASSES[operand] if operand < 0
+                         else CONSTANT_CLASSES.get(
+                             constants[operand]["kind"]))
+        elif name == "new":
+            stack.append(imports[operand])
+        elif name == "alloc":
+            stack.extend(["Nothing"] * operand)
+        elif name == "load" and 0 <= operand - FIRST_LOCAL < len(stack):
+            stack.append(stack[operand - FIRST_LOCAL])
+        elif name == "store" and 0 <= operand - FIRST_LOCAL < len(stack) - 1:
+            stack[operand - FIRST_LOCAL] = stack.pop()
+        elif name == "roll":
+            stack.append(stack.pop(-1 - operand))
+        elif name == "is_instance":
+            stack[-1] = "Boolean"
+        elif name in ["call", "call_builtin"]:
+            receiver = stack[-1]
+            method = calls[pc].split(":")[1]
+            del stack[len(stack) - 1 - arity(calls[pc]):]
+            result = NATIVE_METHODS.get(receiver, {}).get(method)
+            stack.append(result)
+            if result and name == "call":
+                return receiver
+        else:
+            needed, net, _ = stack_effect(operation, operand, None, arity)
+            if needed > len(stack):
+                raise IndexError("stack underflow")
+            del stack[len(stack) - needed:]
+            stack.extend([None] * (needed + net))
+        return None
+
+    blocks = basic_blocks(code)
+    following = {start: successors(block, len(code))
+                 for start, block in blocks.items()}
+    # Classes on the stack where each block begins
+    entry: Dict[int, Stack] = {0: []}
+    work = [0]
+    direct: Dict[int, str] = {}  # Position of call -> receiver class
+    try:
+        while work:
+            start = work.pop()
+            stack = list(entry[start])
+            for pc, operation, operand in blocks[start]:
+                step(stack, pc, operation, operand)
+            for target in following[start]:
+                known = entry.get(target)
+                if known is None:
+                    merged = list(stack)
+                elif len(known) != len(stack):
+                    return 0  # Unbalanced; max_stack_depth reports it
+                else:
+                    merged = [this if this == that else None
+                              for this, that in zip(known, stack)]
+                    if merged == known:
+                        continue
+                entry[target] = merged
+                work.append(target)
+        for start, stack in entry.items():
+            stack = list(stack)
+            for pc, operation, operand in blocks[start]:
+                receiver = step(stack, pc, operation, operand)
+                if receiver and code[pc + 1] < BUILTIN_SLOTS:
+                    direct[pc] = receiver
+    except (IndexError, KeyError, TypeError):
+        return 0  # Stack underflow, or a callee's arity is not known
+    for pc, receiver in direct.items():
+        code[pc] = INSTRS["call_builtin"].code
+        code[pc + 1] += BUILTIN_INDEX[receiver] * BUILTIN_SLOTS
+    return len(direct)
+
+
+# ----------------
+#  Incremental assembly:  An encoded method depends only on its
+#  own lines and on the class state when it begins (method, field,
+#  and argument lists, and the signatures of classes it refers to).
+#  We hash those together and keep encoded methods in a content
+#  addressed cache, so unchanged methods are not lexed or encoded
+#  again.  The cache holds one file per source file (name.json in
+#  CONFIG.method_cache), mapping hashes to encoded methods.
+#  Constant pool indexes and class indexes depend on the methods
+#  before this one, so the cache records where they appear, and
+#  they are re-resolved when the method is reused.
+#
+METHOD_CACHE_VERSION = 5
+Line = Tuple[str, Dict[str, str]]  # As produced by lex
+
+
+def is_method_def(line: str) -> bool:
+    """Does this (comment-stripped) line begin a method,
+    as lex would classify it?
+    """
+    return (line.startswith(".method")
+            and not METHOD_DECL_PAT.match(line)
+            and METHOD_DEF_PAT.match(line) is not None)
+
+
+def method_blocks(lines: Iterable[str]) -> Iterator[List[str]]:
+    """Group source lines into the class header and one
+    block per method, each beginning with its .method line.
+    """
+    block: List[str] = []
+    for line in lines:
+        if is_method_def(strip_comments(line)) and block:
+            yield block
+            block = []
+        block.append(line)
+    if block:
+        yield block
+
+
+def referenced_classes(lines: List[Line]) -> List[str]:
+    """Classes imported by the instructions of a method, in the order
+    they are first referenced (which determines the imports order).
+    """
+    classes: Dict[str, None] = {}
+    for kind, parts in lines:
+        if kind != "instr" or not parts["operand"]:
             continue
-        parts = match.groupdict()
-        label = parts["label"]
-        code.add_label(label)
+        if parts["opname"] in ["call", "load_field", "store_field"]:
+            classes[parts["operand"].split(":")[0]] = None
+        elif parts["opname"] in ["new", "is_instance"]:
+            classes[parts["operand"]] = None
+    classes.pop("$", None)
+    return list(classes)
 
 
+class ErrorCounter(logging.Handler):
+    """Counts errors logged, so we don't cache methods
+    whose error messages would be lost on reuse.
+    """
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.count = 0
 
-    code.resolve_jumps()  # Of the last method entered
-    return code
+    def emit(self, record: logging.LogRecord):
+        self.count += 1
+
+
+class MethodCache:
+    """Encoded methods of one source file, by content hash"""
+    def __init__(self, directory: Path, source: str):
+        self.path = directory.joinpath(Path(source).stem).with_suffix(".json")
+        try:
+            with open(self.path, "r") as f:
+                self.cached: Dict[str, dict] = json.load(f)
+        except (OSError, ValueError):
+            self.cached = {}
+        self.used: Dict[str, dict] = {}  # Written back by close()
+        self.hits = 0
+        self.misses = 0
+        self.errors = ErrorCounter()
+        log.addHandler(self.errors)
+        self.opcodes = {instr.code: instr for instr in INSTRS.ops.values()}
+        self.instructions = repr((opcodes.OPDEFS, opcodes.FUSIONS))
+        import hashlib
+        self.sha256 = hashlib.sha256
+        # Method and field lists only grow, so we hash them
+        # incrementally as names are added
+        self.class_code: Optional[ObjectCode] = None
+        self.n_hashed = (0, 0)
+        self.class_hash = self.sha256()
+        self.signature_hashes: Dict[str, str] = {}
+
+    def class_state_digest(self, code: ObjectCode) -> str:
+        if code is not self.class_code:
+            self.class_code = code
+            self.n_hashed = (0, 0)
+            self.class_hash = self.sha256()
+        n_methods, n_fields = self.n_hashed
+        for name in code.method_list.names[n_methods:]:
+            self.class_hash.update(f"m {name}\n".encode("utf-8"))
+        for name in code.field_list.names[n_fields:]:
+            self.class_hash.update(f"f {name}\n".encode("utf-8"))
+        self.n_hashed = (len(code.method_list), len(code.field_list))
+        return self.class_hash.hexdigest()
+
+    def signature_hash(self, class_name: str) -> str:
+        if class_name not in self.signature_hashes:
+            signature = module_signature(find_module(class_name))
+            self.signature_hashes[class_name] = signature["hash"]
+        return self.signature_hashes[class_name]
+
+    def key(self, code: ObjectCode, block: List[str]) -> str:
+        """Hash of the method's source and the class state it
+        depends on.  Signatures of the classes it refers to are
+        checked against the cache entry, since we don't know
+        which classes those are without lexing the method.
+        """
+        state = [METHOD_CACHE_VERSION, self.instructions,
+                 code.optimize, code.fuse,
+                 self.class_state_digest(code), code.method_args.names,
+                 block]
+        return self.sha256(repr(state).encode("utf-8")).hexdigest()
+
+    def translate_block(self, code: ObjectCode, block: List[str]):
+        lines = lex(block)
+        first = next(lines, None)
+        if not first or first[0] != "method_def":
+            # Class header
+            if first:
+                translate_line(code, *first)
+            for kind, parts in lines:
+                translate_line(code, kind, parts)
+            return
+        translate_line(code, *first)  # begin_method
+        key = self.key(code, block)
+        entry = self.cached.get(key)
+        if entry and all(self.signature_hash(name) == signature
+                         for name, signature in entry["imports"]):
+            self.hits += 1
+            self.used[key] = entry
+            self.reuse(code, entry)
+            return
+        self.misses += 1
+        errors = self.errors.count
+        counts = [code.peephole_removed, code.peephole_removed_words,
+                  code.fused, code.slots_saved]
+        lines = list(lines)
+        for kind, parts in lines:
+            translate_line(code, kind, parts)
+        code.finish_code()
+        if self.errors.count == errors and \
+                all(kind != "class" for kind, _ in lines):
+            entry = self.entry(code, lines)
+            entry["counts"] = [after - before for before, after in zip(
+                counts, [code.peephole_removed,
+                         code.peephole_removed_words, code.fused,
+                         code.slots_saved])]
+            self.used[key] = entry
+
+    def entry(self, code: ObjectCode, lines: List[Line]) -> dict:
+        """Cache entry for the method just encoded:  its code,
+        the positions of constant and class operands and of calls
+        in it, the declarations within it, and the classes it
+        refers to
+        """
+        imports = list(IMPORTS)
+        constants = []
+        classes = []
+        pos = 0
+        while pos < len(code.code):
+            op = self.opcodes[code.code[pos]]
+            pos += 1
+            if not op.ops:
+                continue
+            operand = code.code[pos]
+            if op.operand_op == "const" and operand >= 0:
+                constant = code.constants[operand]
+                constants.append([pos, constant["kind"], constant["value"]])
+            elif op.operand_op in ["new", "is_instance"]:
+                classes.append([pos, imports[operand]])
+            pos += 1
+        declarations = [[kind, parts] for kind, parts in lines
+                        if kind in ["method_decl", "field", "local", "args"]]
+        # A copy, since calls in the code may yet be made direct
+        return {"code": list(code.code), "constants": constants,
+                "classes": classes,
+                "calls": [[pos, target] for pos, target in code.calls.items()],
+                "declarations": declarations,
+                "imports": [[name, self.signature_hash(name)]
+                            for name in referenced_classes(lines)]}
+
+    def reuse(self, code: ObjectCode, entry: dict):
+        """Apply a cached method, with the same effects on
+        the class as encoding it would have had
+        """
+        for kind, parts in entry["declarations"]:
+            # The alloc instruction from .local is in the cached code
+            if kind == "local":
+                code.declare_locals(parts["local_var_name"].split(","))
+            else:
+                translate_line(code, kind, parts)
+        for class_name, _ in entry["imports"]:
+            import_module(class_name)
+        code.code[:] = entry["code"]
+        for pos, kind, value in entry["constants"]:
+            code.code[pos] = code.intern_constant(kind, value)
+        for pos, class_name in entry["classes"]:
+            code.code[pos] = code.resolve_class(class_name)
+        code.calls = {pos: target for pos, target in entry["calls"]}
+        removed, removed_words, fused, slots_saved = entry["counts"]
+        code.peephole_removed += removed
+        code.peephole_removed_words += removed_words
+        code.fused += fused
+        code.slots_saved += slots_saved
+
+    def close(self):
+        """Save the methods used this time, dropping stale ones"""
+        log.info(f"Method cache: {self.hits} methods reused, "
+                 f"{self.misses} assembled")
+        log.removeHandler(self.errors)
+        if self.misses == 0 and len(self.used) == len(self.cached):
+            return  # Unchanged
+        temp = self.path.with_name(f"{self.path.name}.{os.getpid()}")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(temp, "w") as f:
+                json.dump(self.used, f)
+            os.replace(temp, self.path)
+        except OSError as e:
+            log.warning(f"Could not save method cache: {e}")
+
+
+# ----------------
+#  Batch mode:  Assemble many source files in one invocation,
+#  across a pool of worker processes.  A class can be assembled
+#  only after the object files of the classes it refers to
+#  (its superclass in particular) have been written, so we
+#  scan each source for class references before scheduling it.
+#
+
+# Class names in operands like Counter:inc or new Counter
+CLASS_REF_PAT = LazyPattern(r"""
+    \b (?P<opname> call | load_field | store_field | new | is_instance )
+    \s+ (?P<class_name> \w+ ) \b
+    """, re.VERBOSE)
+
+
+class BatchItem:
+    """One source file in a batch, with the classes it depends on"""
+    def __init__(self, source: Path):
+        self.source = source
+        self.class_name = source.stem
+        self.depends: Set[str] = set()
+        with open(source, "r") as f:
+            for line in f:
+                line = strip_comments(line)
+                match = CLASS_DECL_PAT.match(line)
+                if match:
+                    self.class_name = match.groupdict()["class_name"]
+                    self.depends.add(match.groupdict()["super_name"])
+                    continue
+                match = CLASS_REF_PAT.search(line)
+                if match:
+                    self.depends.add(match.groupdict()["class_name"])
+        self.depends.discard(self.class_name)
+
+
+def reset_imports():
+    """Forget modules imported while assembling a previous class"""
+    IMPORTS.clear()
+    IMPORTS["$"] = None
+    IMPORT_SLOTS.clear()
+    IMPORT_SLOTS["$"] = 0
+
+
+def assemble_file(source: Path, target: Path, format: str = "json",
+                  incremental: bool = False, stream: bool = False,
+                  optimize: bool = False, fuse: bool = False) -> dict:
+    """Assemble one source file to one object file.
+    Used by the batch worker processes, which hand back
+    their new signature cache entries for the parent to save,
+    and constant pool statistics for the summary.
+    """
+    reset_imports()
+    refresh_library()
+    SIGNATURES_CHANGED.clear()
+    result = {"ok": False, "constants": [], "interned": 0,
+              "removed": 0, "fused": 0, "devirtualized": 0}
+    method_cache = None
+    if incremental:
+        method_cache = MethodCache(CONFIG.method_cache, source)
+    try:
+        with open(source, "r") as f:
+            objcode = translate(f, method_cache, stream, optimize, fuse)
+        with open(target, "w") as f:
+            objcode.write(f, format)
+        result.update(ok=True, constants=list(objcode.constant_index),
+                      interned=objcode.constants_interned,
+                      removed=objcode.peephole_removed,
+                      fused=objcode.fused,
+                      devirtualized=objcode.devirtualized)
+    except Exception as e:
+        log.error(f"Failed to assemble {source}: {e}")
+    if method_cache:
+        method_cache.close()
+    result["signatures"] = dict(SIGNATURES_CHANGED)
+    return result
+
+
+def assemble_batch(sources: List[Path], outdir: Path, jobs: int,
+                   format: str = "json", incremental: bool = False,
+                   stream: bool = False, optimize: bool = False,
+                   fuse: bool = False) -> bool:
+    """Assemble sources into outdir, each class after the
+    classes it depends on.  Returns True iff all succeeded.
+    """
+    import concurrent.futures
+    started = time.perf_counter()
+    items = [BatchItem(source) for source in sources]
+    in_batch = {item.class_name for item in items}
+    for item in items:
+        # Classes outside the batch must already be in the library
+        item.depends &= in_batch
+    done: Set[str] = set()
+    failed: Set[str] = set()
+    signatures: Dict[str, dict] = {}
+    # Constant pool entries, in all classes and distinct
+    n_constants = 0
+    n_interned = 0
+    n_removed = 0
+    n_fused = 0
+    n_devirtualized = 0
+    program_constants: Set[Tuple[str, str]] = set()
+    waiting = list(items)
+    running = {}
+    use_outdir(outdir)
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs, initializer=use_outdir,
+            initargs=(outdir,)) as pool:
+        while waiting or running:
+            for item in list(waiting):
+                if item.depends & failed:
+                    log.error(f"Skipping {item.source}: "
+                              f"depends on failed {item.depends & failed}")
+                    failed.add(item.class_name)
+                    waiting.remove(item)
+                elif item.depends <= done:
+                    target = outdir.joinpath(item.class_name)\
+                        .with_suffix(FORMAT_SUFFIXES[format])
+                    future = pool.submit(assemble_file, item.source, target,
+                                         format, incremental, stream,
+                                         optimize, fuse)
+                    running[future] = item
+                    waiting.remove(item)
+            if not running:
+                # Everything left waits on something that will never finish
+                for item in waiting:
+                    log.error(f"Circular dependence: {item.source} "
+                              f"waits for {item.depends - done}")
+                    failed.add(item.class_name)
+                break
+            finished, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                item = running.pop(future)
+                result = future.result()
+                signatures.update(result["signatures"])
+                n_constants += len(result["constants"])
+                n_interned += result["interned"]
+                n_removed += result["removed"]
+                n_fused += result["fused"]
+                n_devirtualized += result["devirtualized"]
+                program_constants.update(
+                    tuple(constant) for constant in result["constants"])
+                if result["ok"]:
+                    done.add(item.class_name)
+                else:
+                    failed.add(item.class_name)
+    save_signature_cache(signatures)
+    elapsed = time.perf_counter() - started
+    rate = len(done) / elapsed if elapsed > 0 else 0.0
+    log.info(f"Assembled {len(done)} of {len(items)} files "
+             f"in {elapsed:.2f} seconds ({rate:.1f} files/second)")
+    log.info(f"Constant pools: {n_constants} entries "
+             f"({n_interned} duplicates interned within classes), "
+             f"{len(program_constants)} distinct in the program")
+    if optimize:
+        log.info(f"Peephole: removed {n_removed} instructions")
+        log.info(f"Calls: {n_devirtualized} call sites devirtualized")
+    if fuse:
+        log.info(f"Fusion: {n_fused} sequences fused")
+    return not failed
+
+
+# ----------------
+#  Service mode:  Setting up the assembler (interpreter, logging,
+#  configuration, instruction set, patterns) takes longer than
+#  assembling a typical class.  With --serve we do it once, then
+#  assemble files on request from asmclient.py over a Unix socket,
+#  keeping imported module signatures between requests.  Object
+#  files in TVMLIB may change between requests, so we check the
+#  library before each one.
+#
+
+class LogCapture(logging.Handler):
+    """Log messages of one request, to send back to the client"""
+    def __init__(self):
+        super().__init__()
+        self.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        self.messages: List[str] = []
+
+    def emit(self, record: logging.LogRecord):
+        self.messages.append(self.format(record))
+
+
+def serve_request(request: dict) -> dict:
+    """Assemble one file as asked by a client"""
+    capture = LogCapture()
+    log.addHandler(capture)
+    error = None
+    try:
+        result = assemble_file(Path(request["source"]),
+                               Path(request["target"]),
+                               request.get("format", "json"),
+                               request.get("incremental", False),
+                               request.get("stream", False),
+                               request.get("optimize", False),
+                               request.get("fuse", False))
+        save_signature_cache(result["signatures"])
+    except KeyError as e:
+        error = f"Bad request: missing {e}"
+    except TypeError as e:
+        error = f"Bad request: {e}"  # E.g., a path that is not a string
+    finally:
+        log.removeHandler(capture)
+    if error:
+        log.error(f"{error} in {request}")
+        return {"ok": False, "error": error, "log": capture.messages}
+    return {"ok": result["ok"], "log": capture.messages}
+
+
+def respond(stream, response: dict):
+    stream.write(json.dumps(response).encode("utf-8") + b"\n")
+    stream.flush()
+
+
+def serve_connection(stream) -> bool:
+    """Answer requests from one client, one at a time (since
+    assembly uses globals).  Returns False if asked to stop.
+    A request we cannot make sense of gets an error response,
+    and we go on to the next.
+    """
+    for line in stream:
+        try:
+            request = json.loads(line)
+            command = request.get("command", "assemble")
+        except (ValueError, AttributeError) as e:
+            # Not JSON (or not UTF-8), or not a JSON object
+            log.error(f"Bad request {line[:80]!r}: {e}")
+            respond(stream, {"ok": False, "error": f"Bad request: {e}",
+                             "log": []})
+            continue
+        if command == "assemble":
+            response = serve_request(request)
+        else:
+            # "shutdown", or "ping" to check that we are here
+            response = {"ok": True, "log": []}
+        respond(stream, response)
+        if command == "shutdown":
+            return False
+    return True
+
+
+def serve(socket_path: str):
+    """Assemble files on request until asked to stop"""
+    import socket
+    try:
+        asmclient.request({"command": "ping"}, socket_path)
+        log.error(f"Assembler service is already running on {socket_path}")
+        return
+    except asmclient.ServiceUnavailable:
+        pass
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)  # Left behind by a service that died
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(socket_path)
+        server.listen()
+        log.info(f"Assembler service listening on {socket_path}")
+        try:
+            serving = True
+            while serving:
+                connection, _ = server.accept()
+                with connection, connection.makefile("rwb") as stream:
+                    serving = serve_connection(stream)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(socket_path)
+    log.info("Assembler service stopped")
+
+
+class SourceReader:
+    """Lines of a source file, read as they are needed,
+    counting how much we have read
+    """
+    def __init__(self, f: Iterable[str]):
+        self.f = f
+        self.n_bytes = 0
+
+    def __iter__(self) -> Iterator[str]:
+        for line in self.f:
+            self.n_bytes += len(line)
+            yield line
 
 
 def main():
     """Assemble one file into object code in json format"""
     args = cli()
-    source = [line for line in args.source]
-    objcode = translate(source)
-    print(objcode.json(), file=args.target)
+    if args.serve:
+        serve(args.socket)
+        return
+    if args.batch is not None:
+        outdir = args.outdir or CONFIG.tvmlib
+        sources = [Path(source) for source in args.batch]
+        ok = assemble_batch(sources, outdir, args.jobs, args.format,
+                            args.incremental, args.stream, args.optimize,
+                            args.fuse)
+        sys.exit(0 if ok else 1)
+    source = SourceReader(args.source)
+    method_cache = None
+    if args.incremental:
+        method_cache = MethodCache(CONFIG.method_cache, args.source.name)
+    objcode = translate(source, method_cache, args.stream, args.optimize,
+                        args.fuse)
+    if method_cache:
+        method_cache.close()
+    objcode.write(args.target, args.format)
+    log.info(f"Constant pool: {len(objcode.constants)} entries, "
+             f"{objcode.constants_interned} duplicates interned")
+    if args.optimize:
+        log.info(f"Peephole: removed {objcode.peephole_removed} instructions "
+                 f"({objcode.peephole_removed_words} words)")
+        log.info(f"Locals: {objcode.slots_saved} slots saved by sharing")
+        log.info(f"Calls: {objcode.devirtualized} call sites devirtualized")
+    if args.fuse:
+        log.info(f"Fusion: {objcode.fused} sequences fused")
+    # ru_maxrss is in kilobytes on Linux
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    log.info(f"Peak memory {peak / 1024:.1f} MB "
+             f"for {source.n_bytes / 2**20:.1f} MB of source")
+    save_signature_cache(SIGNATURES_CHANGED)
 
 
 if __name__ == "__main__":
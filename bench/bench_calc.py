@@ -0,0 +1,130 @@
+"""Throughput of the calculator compiler, in expressions per second.
+
+Generates a file of random expressions (with assignments to a few
+variables among them) and compiles it to object code two ways:
+
+    direct   calc.py's batch compiler, which hands instructions
+             to the assembler's ObjectCode;
+    text     assembly text from calc.py, then translated by the
+             assembler, as when the two are run separately.
+
+Both include parsing the expressions and producing JSON.  Parsing
+is the same for both and is also reported on its own.
+
+Run from anywhere:  python3 bench/bench_calc.py --lines 100000
+"""
+import argparse
+import logging
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+from bench_phases import BUILTINS, ROOT, use_library
+
+sys.path.insert(0, str(ROOT))
+import assemble
+import calc
+
+assemble.log.setLevel(logging.ERROR)  # Not the constant pool warning
+calc.log.setLevel(logging.WARNING)
+
+VARIABLES = [f"v{i}" for i in range(8)]
+
+
+def cli() -> object:
+    parser = argparse.ArgumentParser(
+        description="Expressions per second compiled by calc.py")
+    parser.add_argument("--lines", type=int, default=100_000,
+                        help="Expressions to compile (default 100000)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs of each (best is reported)")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+def expression(rng: random.Random, assigned: List[str], depth: int) -> str:
+    if depth == 0 or rng.random() < 0.3:
+        if assigned and rng.random() < 0.3:
+            return rng.choice(assigned)
+        return str(rng.randrange(100))
+    op = rng.choice("+-*/")
+    left = expression(rng, assigned, depth - 1)
+    if op == "/":
+        right = str(rng.randrange(1, 10))  # Never divide by zero
+    else:
+        right = expression(rng, assigned, depth - 1)
+    text = f"{left} {op} {right}"
+    return f"({text})" if rng.random() < 0.5 else text
+
+
+def workload(n: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    assigned, lines = [], []
+    for i in range(n):
+        text = expression(rng, assigned, 3)
+        if i % 5 == 0:
+            name = rng.choice(VARIABLES)
+            lines.append(f"{name} = {text}")
+            if name not in assigned:
+                assigned.append(name)
+        else:
+            lines.append(text)
+    return lines
+
+
+def direct(lines: List[str]) -> str:
+    trees, _ = calc.parse_lines(lines)
+    assemble.reset_imports()
+    return calc.compile_trees(trees).json()
+
+
+def text(lines: List[str]) -> str:
+    trees, _ = calc.parse_lines(lines)
+    source = [".class Calc:Obj", ".method $constructor"]
+    method_locals = calc.locals_of(trees)
+    if method_locals:
+        source.append(f".local {','.join(method_locals)}")
+    source.append("    enter")
+    for tree in trees:
+        ops = calc.emit(tree)
+        if not isinstance(tree, calc.Assign):
+            ops += calc.PRINT_VALUE
+        source.extend(calc.as_text(ops).splitlines())
+    source.extend(["    const nothing", "    return 0"])
+    assemble.reset_imports()
+    return assemble.translate(source).json()
+
+
+def best_time(step, lines: List[str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        step(lines)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    args = cli()
+    lines = workload(args.lines, args.seed)
+    with tempfile.TemporaryDirectory() as scratch:
+        lib = Path(scratch)
+        for name in BUILTINS:
+            shutil.copyfile(ROOT.joinpath("OBJ", name + ".json"),
+                            lib.joinpath(name + ".json"))
+        use_library(lib)
+        print(f"{len(lines)} expressions")
+        print(f"{'':>8} {'seconds':>10} {'expr/sec':>12}")
+        for label, step in [("parse", calc.parse_lines),
+                            ("direct", direct), ("text", text)]:
+            seconds = best_time(step, lines, args.repeat)
+            print(f"{label:>8} {seconds:>10.3f} "
+                  f"{len(lines) / seconds:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Start-up and per-line parse times of calc.py.
+
+Start-up is measured two ways:  building the parser in this
+process, from the grammar (no cache) and from cached LALR tables;
+and the wall time of a short-lived calculator process compiling
+one line, with the cache cold (absent) and warm.
+
+Per-line times are for parsing generated expressions (from
+bench_calc.py) with one parser shared by all the lines.
+
+Run from anywhere:  python3 bench/bench_calc_parse.py
+"""
+import argparse
+import logging
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench_calc import workload
+from bench_phases import ROOT
+
+sys.path.insert(0, str(ROOT))
+import calc
+from lark import Lark
+
+calc.log.setLevel(logging.WARNING)
+
+ONE_LINE = "import calc; calc.PARSER_CACHE = {cache!r}; calc.calc('1+2')"
+
+
+def cli() -> object:
+    parser = argparse.ArgumentParser(
+        description="Start-up and per-line parse times of calc.py")
+    parser.add_argument("--lines", type=int, default=20_000,
+                        help="Expressions to parse (default 20000)")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Runs of each (best is reported)")
+    return parser.parse_args()
+
+
+def build_time(cache, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        Lark(calc.calc_grammar, parser='lalr',
+             transformer=calc.BuildTree(), cache=cache)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def process_time(cache: Path, cold: bool, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        if cold:
+            cache.unlink(missing_ok=True)
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", ONE_LINE.format(
+            cache=str(cache))], cwd=ROOT, check=True)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    args = cli()
+    with tempfile.TemporaryDirectory() as scratch:
+        cache = Path(scratch, "calc_parser.lark")
+        print("Start-up (msec)")
+        print(f"  build parser, no cache   "
+              f"{1000 * build_time(False, args.repeat):>8.2f}")
+        build_time(str(cache), 1)  # Fill the cache
+        print(f"  build parser, cached     "
+              f"{1000 * build_time(str(cache), args.repeat):>8.2f}")
+        print(f"  one-line process, cold   "
+              f"{1000 * process_time(cache, True, args.repeat):>8.2f}")
+        print(f"  one-line process, warm   "
+              f"{1000 * process_time(cache, False, args.repeat):>8.2f}")
+
+    lines = workload(args.lines, 1)
+    calc.calc_parser()  # Not timed
+    best = float("inf")
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        calc.parse_lines(lines)
+        best = min(best, time.perf_counter() - started)
+    print(f"Parse {len(lines)} lines with one parser:  {best:.3f} seconds, "
+          f"{1e6 * best / len(lines):.1f} usec/line")
+
+
+if __name__ == "__main__":
+    main()
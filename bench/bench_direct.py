@@ -0,0 +1,141 @@
+"""Dispatch count and run time with and without direct calls to
+built-in methods.
+
+Assembles a loop whose arithmetic is on locals (so there are no
+constant operands for fused operations), plain and with -O, which
+makes calls to native methods of Int direct where it can tell the
+receiver is an Int.  Dispatches are counted from the VM's execution
+profile (-P), in a separate run from those that are timed.
+
+The VM in bin/ must be built from the current opdefs.txt.
+
+Run from anywhere:  python3 bench/bench_direct.py
+"""
+import argparse
+import json
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+from bench_fusion import BUILTINS, ROOT, VM
+
+
+def cli() -> object:
+    parser = argparse.ArgumentParser(
+        description="Compare VM dispatches and time with direct calls")
+    parser.add_argument("--iterations", type=int, default=20_000,
+                        help="Loop iterations (default 20000)")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Runs to time (best is reported)")
+    return parser.parse_args()
+
+
+def source(n: int) -> List[str]:
+    """Sum i * i for i from n down to 1, then print it"""
+    return [".class DirectLoop:Obj",
+            ".method $constructor",
+            ".local i,one,zero,total",
+            "    enter",
+            "    const 0",
+            "    store zero",
+            "    const 1",
+            "    store one",
+            "    load zero",
+            "    store total",
+            f"    const {n}",
+            "    store i",
+            "top:",
+            "    load i",
+            "    load zero",
+            "    call Int:less",
+            "    jump_ifnot done",
+            "    load total",
+            "    load i",
+            "    load i",
+            "    call Int:mul",
+            "    call Int:plus",
+            "    store total",
+            "    load i",
+            "    load one",
+            "    call Int:sub",
+            "    store i",
+            "    jump top",
+            "done:",
+            "    load total",
+            "    call Int:print",
+            "    pop",
+            '    const "\\n"',
+            "    call String:print",
+            "    pop",
+            "    const nothing",
+            "    return 0"]
+
+
+def build(scratch: Path, n: int, options: List[str]) -> int:
+    """Assemble the loop into scratch/OBJ; returns the number of
+    calls made direct
+    """
+    asm = scratch.joinpath("DirectLoop.asm")
+    asm.write_text("\n".join(source(n)) + "\n")
+    result = subprocess.run([sys.executable,
+                             str(ROOT.joinpath("assemble.py")),
+                             *options, str(asm), "OBJ/DirectLoop.json"],
+                            cwd=scratch, capture_output=True, check=True,
+                            text=True)
+    direct = re.search(r"Calls: (\d+)", result.stderr)
+    return int(direct.group(1)) if direct else 0
+
+
+def dispatches(scratch: Path) -> int:
+    """Instructions executed, in our methods and built-in methods"""
+    subprocess.run([str(VM), "-P", "profile.json", "DirectLoop"],
+                   cwd=scratch, capture_output=True, check=True)
+    with open(scratch.joinpath("profile.json")) as f:
+        profile = json.load(f)
+    return sum(sum(method["counts"]) for method in profile["methods"]) \
+        + sum(profile["builtin"].values())
+
+
+def best_time(scratch: Path, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([str(VM), "DirectLoop"], cwd=scratch,
+                       capture_output=True, check=True)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    args = cli()
+    print(f"{'':>8} {'direct':>7} {'dispatches':>12} {'per iter':>10} "
+          f"{'seconds':>10}")
+    results = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        scratch = Path(scratch)
+        scratch.joinpath("OBJ").mkdir()
+        for name in BUILTINS:
+            shutil.copyfile(ROOT.joinpath("OBJ", name + ".json"),
+                            scratch.joinpath("OBJ", name + ".json"))
+        shutil.copyfile(ROOT.joinpath("asm.conf"),
+                        scratch.joinpath("asm.conf"))
+        for label, options in [("plain", []), ("-O", ["-O"])]:
+            direct = build(scratch, args.iterations, options)
+            count = dispatches(scratch)
+            seconds = best_time(scratch, args.repeat)
+            results[label] = (count, seconds)
+            print(f"{label:>8} {direct:>7} {count:>12} "
+                  f"{count / args.iterations:>10.1f} {seconds:>10.3f}")
+    (plain, plain_time), (direct, direct_time) = results.values()
+    print(f"Direct calls make {100 * (1 - direct / plain):.0f}% fewer "
+          f"dispatches and run {100 * (1 - direct_time / plain_time):.0f}% "
+          f"faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Dispatch count and run time with and without fused operations.
+
+Assembles a loop that sums its counter into a field (the sequences
+fused operations replace are common in such loops), with and
+without --fuse, and runs each in the VM.  Dispatches are counted
+from the VM's execution profile (-P), in a separate run from those
+that are timed.
+
+The VM in bin/ must be built from the current opdefs.txt.
+
+Run from anywhere:  python3 bench/bench_fusion.py
+"""
+import argparse
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+from bench_symbols import ROOT
+
+VM = ROOT.joinpath("bin", "tiny_vm")
+BUILTINS = ["Bool", "Int", "Nothing", "Obj", "String"]
+
+
+def cli() -> object:
+    parser = argparse.ArgumentParser(
+        description="Compare VM dispatches and time with --fuse")
+    parser.add_argument("--iterations", type=int, default=20_000,
+                        help="Loop iterations (default 20000)")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Runs to time (best is reported)")
+    return parser.parse_args()
+
+
+def source(n: int) -> List[str]:
+    """Sum n, n-1, ..., 1 into a field, then print it"""
+    return [".class FuseLoop:Obj",
+            ".field total",
+            ".method $constructor",
+            ".local i",
+            "    enter",
+            "    const 0",
+            "    load $",
+            "    store_field $:total",
+            f"    const {n}",
+            "    store i",
+            "top:",
+            "    load i",
+            "    const 0",
+            "    call Int:less",
+            "    jump_ifnot done",
+            "    load $",
+            "    load_field $:total",
+            "    load i",
+            "    call Int:plus",
+            "    load $",
+            "    store_field $:total",
+            "    load i",
+            "    const 1",
+            "    call Int:sub",
+            "    store i",
+            "    jump top",
+            "done:",
+            "    load $",
+            "    load_field $:total",
+            "    call Int:print",
+            "    pop",
+            '    const "\\n"',
+            "    call String:print",
+            "    pop",
+            "    return 0"]
+
+
+def build(scratch: Path, n: int, options: List[str]):
+    """Assemble the loop for n iterations into scratch/OBJ"""
+    asm = scratch.joinpath("FuseLoop.asm")
+    asm.write_text("\n".join(source(n)) + "\n")
+    subprocess.run([sys.executable, str(ROOT.joinpath("assemble.py")),
+                    *options, str(asm), "OBJ/FuseLoop.json"],
+                   cwd=scratch, capture_output=True, check=True)
+
+
+def dispatches(scratch: Path) -> int:
+    """Instructions executed, in our methods and built-in methods"""
+    subprocess.run([str(VM), "-P", "profile.json", "FuseLoop"],
+                   cwd=scratch, capture_output=True, check=True)
+    with open(scratch.joinpath("profile.json")) as f:
+        profile = json.load(f)
+    return sum(sum(method["counts"]) for method in profile["methods"]) \
+        + sum(profile["builtin"].values())
+
+
+def best_time(scratch: Path, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([str(VM), "FuseLoop"], cwd=scratch,
+                       capture_output=True, check=True)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    args = cli()
+    print(f"{'':>10} {'dispatches':>12} {'per iter':>10} {'seconds':>10}")
+    results = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        scratch = Path(scratch)
+        scratch.joinpath("OBJ").mkdir()
+        for name in BUILTINS:
+            shutil.copyfile(ROOT.joinpath("OBJ", name + ".json"),
+                            scratch.joinpath("OBJ", name + ".json"))
+        shutil.copyfile(ROOT.joinpath("asm.conf"),
+                        scratch.joinpath("asm.conf"))
+        for label, options in [("plain", []), ("--fuse", ["--fuse"])]:
+            build(scratch, args.iterations, options)
+            count = dispatches(scratch)
+            seconds = best_time(scratch, args.repeat)
+            results[label] = (count, seconds)
+            print(f"{label:>10} {count:>12} "
+                  f"{count / args.iterations:>10.1f} {seconds:>10.3f}")
+    (plain, plain_time), (fused, fused_time) = results.values()
+    print(f"Fused code makes {100 * (1 - fused / plain):.0f}% fewer "
+          f"dispatches and runs {100 * (1 - fused_time / plain_time):.0f}% "
+          f"faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Lines-per-second benchmark for the assembler front end.
+
+Writes generated assembly files of several megabytes and times
+lexing alone (classifying each line) and full translation.
+
+Run from anywhere:  python3 bench/bench_lexer.py
+"""
+import argparse
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench_symbols import ROOT, generate, use_root
+sys.path.insert(0, str(ROOT))
+import assemble
+
+assemble.log.setLevel(logging.WARNING)
+
+SIZES = [10_000, 50_000, 100_000]
+
+
+def cli() -> object:
+    parser = argparse.ArgumentParser(
+        description="Time lexing and translation of large .asm files")
+    parser.add_argument("sizes", type=int, nargs="*", default=SIZES,
+                        help="Sizes of the generated files:  each has "
+                             "n fields, methods, arguments, and locals, "
+                             "in about 9n lines")
+    return parser.parse_args()
+
+
+def main():
+    args = cli()
+    use_root()
+    print(f"{'lines':>10} {'MB':>6} {'lex lines/s':>12} "
+          f"{'translate lines/s':>18}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sizes:
+            path = Path(tmp, f"Big{n}.asm")
+            lines = generate(n)
+            # Comments and indentation, as compilers emit them
+            path.write_text("\n".join(f"    {line}   # generated"
+                                      for line in lines) + "\n")
+            megabytes = path.stat().st_size / 1e6
+            with open(path) as f:
+                started = time.perf_counter()
+                for _ in assemble.lex(f):
+                    pass
+                lex_time = time.perf_counter() - started
+            with open(path) as f:
+                assemble.reset_imports()
+                started = time.perf_counter()
+                assemble.translate(f)
+                translate_time = time.perf_counter() - started
+            print(f"{len(lines):>10} {megabytes:>6.1f} "
+                  f"{len(lines) / lex_time:>12.0f} "
+                  f"{len(lines) / translate_time:>18.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Start-up time of the VM loading a program class by class, and
+from a pre-linked load image (link.py).
+
+Generates a program of many small classes, in which every other
+class extends the one before it, and each creates an object of
+the one before it.  It is assembled in both object file formats,
+and linked into one image, and into one pruned of the method each
+class has that nothing calls (link.py --prune).  Each way of loading
+it is timed as the wall time of a VM run, which does little but load.
+
+The VM's fixed capacities (classes, code words) limit the number
+of classes to about 65.
+
+Run from anywhere:  python3 bench/bench_link.py
+"""
+import argparse
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+from bench_phases import BUILTINS, ROOT
+
+VM = ROOT.joinpath("bin", "tiny_vm")
+
+
+def cli() -> object:
+    parser = argparse.ArgumentParser(
+        description="VM start-up time with and without a load image")
+    parser.add_argument("--classes", type=int, default=60,
+                        help="Classes in the program (default 60)")
+    parser.add_argument("--repeat", type=int, default=20,
+                        help="Runs to time (best is reported)")
+    return parser.parse_args()
+
+
+def sources(n: int) -> List[List[str]]:
+    """Gen0 ... Gen<n-1>, each creating an object of the one
+    before it when constructed, then Main, which creates the last
+    """
+    classes = []
+    for i in range(n):
+        super_name = f"Gen{i - 1}" if i % 2 else "Obj"
+        lines = [f".class Gen{i}:{super_name}",
+                 ".method $constructor",
+                 "    enter"]
+        if i > 0:
+            lines.extend([f"    new Gen{i - 1}",
+                          f"    call Gen{i - 1}:$constructor",
+                          "    pop"])
+        lines.extend(["    load $",
+                      "    return 0",
+                      f".method m{i}",
+                      "    enter",
+                      f"    const {i}",
+                      "    return 0"])
+        classes.append(lines)
+    main = [".class Main:Obj",
+            ".method $constructor",
+            "    enter",
+            f"    new Gen{n - 1}",
+            f"    call Gen{n - 1}:$constructor",
+            "    pop",
+            "    const nothing",
+            "    return 0"]
+    return classes + [main]
+
+
+def build(scratch: Path, n: int):
+    """Object files in both formats, and the load image"""
+    paths = []
+    for lines in sources(n):
+        class_name = lines[0].split()[1].split(":")[0]
+        path = scratch.joinpath(class_name + ".asm")
+        path.write_text("\n".join(lines) + "\n")
+        paths.append(str(path))
+    for lib, format in [("JSON", "json"), ("TVMO", "binary")]:
+        scratch.joinpath(lib).mkdir()
+        for name in BUILTINS:
+            shutil.copyfile(ROOT.joinpath("OBJ", name + ".json"),
+                            scratch.joinpath(lib, name + ".json"))
+        # The assembler finds imported classes in TVMLIB
+        scratch.joinpath("asm.conf").write_text(
+            f"[DEFAULT]\nTVMLIB = {lib}\n")
+        subprocess.run([sys.executable, str(ROOT.joinpath("assemble.py")),
+                        "--batch", *paths, "-o", lib, "--format", format],
+                       cwd=scratch, capture_output=True, check=True)
+    for image, options in [("Main.tvmi", []),
+                           ("Pruned.tvmi", ["--prune"])]:
+        subprocess.run([sys.executable, str(ROOT.joinpath("link.py")),
+                        "Main", "-L", "JSON", "-o", image, *options],
+                       cwd=scratch, capture_output=True, check=True)
+
+
+def best_time(scratch: Path, args: List[str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([str(VM), *args], cwd=scratch,
+                       capture_output=True, check=True)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def size(path: Path) -> int:
+    """Bytes in a load image, or in a library of object files"""
+    if path.is_dir():
+        return sum(file.stat().st_size for file in path.iterdir())
+    return path.stat().st_size
+
+
+def main():
+    args = cli()
+    with tempfile.TemporaryDirectory() as scratch:
+        scratch = Path(scratch)
+        build(scratch, args.classes)
+        print(f"{args.classes + 1} classes")
+        print(f"{'':>22} {'msec':>8} {'bytes':>8}")
+        for label, vm_args in [("json, class by class",
+                                ["-L", "JSON", "Main"]),
+                               ("tvmo, class by class",
+                                ["-L", "TVMO", "Main"]),
+                               ("load image", ["-I", "Main.tvmi"]),
+                               ("load image, pruned",
+                                ["-I", "Pruned.tvmi"])]:
+            seconds = best_time(scratch, vm_args, args.repeat)
+            print(f"{label:>22} {1000 * seconds:>8.2f} "
+                  f"{size(scratch.joinpath(vm_args[1])):>8}")
+
+
+if __name__ == "__main__":
+    main()
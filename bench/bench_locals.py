@@ -0,0 +1,148 @@
+"""Frame size and run time with and without shared local slots.
+
+Assembles a recursive method with many temporaries, each stored
+once and read twice (so the peephole pass leaves them alone), and a
+loop that calls it, plain and with -O, which shares local variable
+slots among temporaries whose values are never needed at the same
+time.  Each version is run in the VM; the frame size of the
+recursive method is its header, its alloc, and its max_stack.
+
+Run from anywhere:  python3 bench/bench_locals.py
+"""
+import argparse
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+from bench_fusion import BUILTINS, ROOT, VM
+
+sys.path.insert(0, str(ROOT))
+import assemble
+
+
+def cli() -> object:
+    parser = argparse.ArgumentParser(
+        description="Compare frame size and VM time with shared locals")
+    parser.add_argument("--temps", type=int, default=20,
+                        help="Temporaries in the recursive method "
+                             "(default 20)")
+    parser.add_argument("--depth", type=int, default=30,
+                        help="Depth of recursion (default 30)")
+    parser.add_argument("--calls", type=int, default=50,
+                        help="Times the recursion is started "
+                             "(default 50)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs to time (best is reported)")
+    return parser.parse_args()
+
+
+def source(temps: int, depth: int, calls: int) -> List[str]:
+    """down(n) computes (n + k) * (n + k) into temporary k for each
+    k, then calls down(n - 1), until n is 0
+    """
+    names = [f"t{k}" for k in range(temps)]
+    lines = [".class Locals:Obj",
+             ".method down forward",
+             ".method $constructor",
+             ".local i",
+             "    enter",
+             f"    const {calls}",
+             "    store i",
+             "again:",
+             f"    const {depth}",
+             "    load $",
+             "    call $:down",
+             "    pop",
+             "    load i",
+             "    const 1",
+             "    call Int:sub",
+             "    store i",
+             "    load i",
+             "    const 0",
+             "    call Int:less",
+             "    jump_if again",
+             "    const nothing",
+             "    return 0",
+             ".method down",
+             ".args n",
+             f".local {','.join(names)}",
+             "    enter",
+             "    load n",
+             "    const 0",
+             "    call Int:less",
+             "    jump_ifnot done"]
+    for k, name in enumerate(names):
+        lines.extend(["    load n",
+                      f"    const {k}",
+                      "    call Int:plus",
+                      f"    store {name}",
+                      f"    load {name}",
+                      f"    load {name}",
+                      "    call Int:mul",
+                      "    pop"])
+    lines.extend(["    load n",
+                  "    const 1",
+                  "    call Int:sub",
+                  "    load $",
+                  "    call $:down",
+                  "    pop",
+                  "done:",
+                  "    const nothing",
+                  "    return 1"])
+    return lines
+
+
+def build(scratch: Path, args, options: List[str]) -> int:
+    """Assemble into scratch/OBJ; returns the frame words of down"""
+    asm = scratch.joinpath("Locals.asm")
+    asm.write_text("\n".join(source(args.temps, args.depth,
+                                    args.calls)) + "\n")
+    subprocess.run([sys.executable, str(ROOT.joinpath("assemble.py")),
+                    *options, str(asm), "OBJ/Locals.json"],
+                   cwd=scratch, capture_output=True, check=True)
+    with open(scratch.joinpath("OBJ", "Locals.json")) as f:
+        obj = json.load(f)
+    down, = [method for method in obj["code"] if method["name"] == "down"]
+    return assemble.FIRST_LOCAL + down["max_stack"]
+
+
+def best_time(scratch: Path, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([str(VM), "Locals"], cwd=scratch,
+                       capture_output=True, check=True)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    args = cli()
+    print(f"{'':>8} {'frame words':>12} {'seconds':>10}")
+    results = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        scratch = Path(scratch)
+        scratch.joinpath("OBJ").mkdir()
+        for name in BUILTINS:
+            shutil.copyfile(ROOT.joinpath("OBJ", name + ".json"),
+                            scratch.joinpath("OBJ", name + ".json"))
+        shutil.copyfile(ROOT.joinpath("asm.conf"),
+                        scratch.joinpath("asm.conf"))
+        for label, options in [("plain", []), ("-O", ["-O"])]:
+            words = build(scratch, args, options)
+            seconds = best_time(scratch, args.repeat)
+            results[label] = (words, seconds)
+            print(f"{label:>8} {words:>12} {seconds:>10.3f}")
+    (plain, plain_time), (shared, shared_time) = results.values()
+    print(f"Shared slots make each frame of down {plain - shared} words "
+          f"smaller ({args.depth + 1} frames deep), and change run time "
+          f"by {100 * (shared_time / plain_time - 1):+.0f}%")
+
+
+if __name__ == "__main__":
+    main()
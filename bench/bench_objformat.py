@@ -0,0 +1,84 @@
+"""Compare the JSON and binary object file formats.
+
+Assembles generated classes of increasing size, writes each in
+both formats, and reports file sizes and the time to read the
+object code back (json.load versus objfile.load on a mapped file).
+
+Run from anywhere:  python3 bench/bench_objformat.py
+"""
+import argparse
+import json
+import logging
+import mmap
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench_symbols import ROOT, generate, use_root
+sys.path.insert(0, str(ROOT))
+import assemble
+import objfile
+
+assemble.log.setLevel(logging.WARNING)
+
+SIZES = [10, 100, 1_000, 10_000, 100_000]
+
+
+def cli() -> object:
+    parser = argparse.ArgumentParser(
+        description="Compare sizes and read times of object file formats")
+    parser.add_argument("sizes", type=int, nargs="*", default=SIZES,
+                        help="Numbers of symbols of each kind")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Reads per measurement (best is reported)")
+    return parser.parse_args()
+
+
+def best_time(repeat: int, f) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def read_json(path: Path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def read_binary(path: Path):
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            return objfile.load(m)
+
+
+def main():
+    args = cli()
+    use_root()
+    print(f"{'symbols':>10} {'json bytes':>12} {'binary bytes':>12} "
+          f"{'ratio':>6} {'json read':>10} {'binary read':>11} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sizes:
+            assemble.reset_imports()
+            objcode = assemble.translate(generate(n))
+            json_path = Path(tmp, f"Big{n}.json")
+            binary_path = Path(tmp, f"Big{n}.tvmo")
+            json_path.write_text(objcode.json())
+            binary_path.write_bytes(objcode.binary())
+            assert read_binary(binary_path) == read_json(json_path)
+            json_size = json_path.stat().st_size
+            binary_size = binary_path.stat().st_size
+            json_time = best_time(args.repeat, lambda: read_json(json_path))
+            binary_time = best_time(args.repeat,
+                                    lambda: read_binary(binary_path))
+            print(f"{n:>10} {json_size:>12} {binary_size:>12} "
+                  f"{json_size / binary_size:>6.1f} "
+                  f"{json_time:>10.4f} {binary_time:>11.4f} "
+                  f"{json_time / binary_time:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Time each phase of the assembler on generated workloads.
+
+Generates programs with bench/workload.py, assembles each class
+in order (writing object files so later classes can import them),
+and reports time spent in each phase:
+
+    translate      the whole translation of a class, which includes
+    encode_operand   operand encoding (symbol resolution), and
+    resolve_jumps    back-patching of labels;
+    json           producing the JSON object file.
+
+One workload parameter can be swept over several values to look
+for scaling cliffs, e.g.
+
+    python3 bench/bench_phases.py --sweep methods 10 100 1000 10000
+
+Results are saved as JSON (in bench/results by default), and
+--compare prints the ratio of each time to an earlier result file.
+
+Run from anywhere:  python3 bench/bench_phases.py
+"""
+import argparse
+import datetime
+import json
+import logging
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from workload import Workload
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import assemble
+
+assemble.log.setLevel(logging.WARNING)
+
+RESULTS = ROOT.joinpath("bench", "results")
+BUILTINS = ["Bool", "Int", "Nothing", "Obj", "String"]
+PHASES = ["translate", "encode_operand", "resolve_jumps", "json"]
+
+
+def cli() -> object:
+    parser = argparse.ArgumentParser(
+        description="Time assembler phases on generated workloads")
+    for name, default in Workload.DEFAULTS.items():
+        parser.add_argument(f"--{name}", type=int, default=default,
+                            help=f"Workload parameter (default {default})")
+    parser.add_argument("--sweep", nargs="+", metavar=("PARAM", "VALUE"),
+                        help="Vary one workload parameter over values")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs per workload (best is reported)")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="Result file (default bench/results/...)")
+    parser.add_argument("--compare", type=Path, default=None,
+                        help="Earlier result file to compare with")
+    args = parser.parse_args()
+    if args.sweep:
+        if args.sweep[0] not in Workload.DEFAULTS or len(args.sweep) < 2:
+            parser.error(f"--sweep needs one of {list(Workload.DEFAULTS)} "
+                         f"and one or more values")
+        args.sweep[1:] = [int(value) for value in args.sweep[1:]]
+    return args
+
+
+class PhaseTimer:
+    """Accumulates time spent in methods of ObjectCode, by wrapping
+    them.  Wrapping adds a little time to each call, which is
+    counted in the phase.
+    """
+    def __init__(self, names: List[str]):
+        self.times: Dict[str, float] = {name: 0.0 for name in names}
+        self.originals = {name: getattr(assemble.ObjectCode, name)
+                          for name in names}
+
+    def wrap(self, name: str):
+        original = self.originals[name]
+        times = self.times
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                times[name] += time.perf_counter() - started
+        return timed
+
+    def __enter__(self) -> "PhaseTimer":
+        for name in self.originals:
+            setattr(assemble.ObjectCode, name, self.wrap(name))
+        return self
+
+    def __exit__(self, *exc):
+        for name, original in self.originals.items():
+            setattr(assemble.ObjectCode, name, original)
+
+
+def assemble_workload(workload: Workload, lib: Path) -> Dict[str, float]:
+    """Assemble every class of workload into lib, returning
+    seconds spent in each phase
+    """
+    times = {phase: 0.0 for phase in PHASES}
+    with PhaseTimer(["encode_operand", "resolve_jumps"]) as timer:
+        for i, class_name in enumerate(workload.class_names()):
+            source = workload.source(i)
+            assemble.reset_imports()
+            started = time.perf_counter()
+            objcode = assemble.translate(source)
+            times["translate"] += time.perf_counter() - started
+            started = time.perf_counter()
+            text = objcode.json()
+            times["json"] += time.perf_counter() - started
+            lib.joinpath(class_name).with_suffix(".json").write_text(text)
+    times.update(timer.times)
+    return times
+
+
+def measure(workload: Workload, repeat: int) -> dict:
+    """Best times over repeat runs, in a fresh library each time"""
+    n_lines = sum(len(workload.source(i)) for i in range(workload.classes))
+    best = {phase: float("inf") for phase in PHASES}
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as scratch:
+            lib = Path(scratch)
+            for name in BUILTINS:
+                shutil.copyfile(ROOT.joinpath("OBJ", name + ".json"),
+                                lib.joinpath(name + ".json"))
+            use_library(lib)
+            times = assemble_workload(workload, lib)
+        for phase in PHASES:
+            best[phase] = min(best[phase], times[phase])
+    return {"params": workload.params, "lines": n_lines, "seconds": best}
+
+
+def use_library(lib: Path):
+    """Point the assembler at a fresh object file directory"""
+    assemble.CONFIG.search_path = [lib]
+    assemble.CONFIG.tvmlib = lib
+    assemble.CONFIG.signature_cache = Path(f"{lib}.signatures.json")
+    assemble.CONFIG.method_cache = Path(f"{lib}.methods")
+    assemble.LIBRARY_INDEX.clear()
+    assemble.SIGNATURES.clear()
+    assemble.MODULES.clear()
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: List[dict], earlier: dict):
+    """Ratio of each time to the earlier time for the same workload"""
+    before = {json.dumps(result["params"], sort_keys=True): result
+              for result in earlier["results"]}
+    print(f"\nCompared with {earlier['commit']} ({earlier['date']}); "
+          f"ratio < 1 is faster")
+    for result in results:
+        old = before.get(json.dumps(result["params"], sort_keys=True))
+        if not old:
+            continue
+        ratios = [result["seconds"][phase] / old["seconds"][phase]
+                  if old["seconds"][phase] else float("nan")
+                  for phase in PHASES]
+        print(f"{result['lines']:>10} " +
+              " ".join(f"{ratio:>14.2f}" for ratio in ratios))
+
+
+def main():
+    args = cli()
+    base = {name: getattr(args, name) for name in Workload.DEFAULTS}
+    if args.sweep:
+        param, values = args.sweep[0], args.sweep[1:]
+        workloads = [Workload(**dict(base, **{param: value}))
+                     for value in values]
+    else:
+        workloads = [Workload(**base)]
+
+    print(f"{'lines':>10} " + " ".join(f"{phase:>14}" for phase in PHASES)
+          + f" {'usec/line':>10}")
+    results = []
+    for workload in workloads:
+        result = measure(workload, args.repeat)
+        results.append(result)
+        seconds = result["seconds"]
+        print(f"{result['lines']:>10} " +
+              " ".join(f"{seconds[phase]:>14.4f}" for phase in PHASES) +
+              f" {1e6 * seconds['translate'] / result['lines']:>10.2f}")
+
+    report = {"date": datetime.datetime.now().isoformat(timespec="seconds"),
+              "commit": git_commit(),
+              "python": platform.python_version(),
+              "results": results}
+    output = args.output
+    if output is None:
+        RESULTS.mkdir(exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = RESULTS.joinpath(f"phases-{stamp}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results in {output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Peak memory of the assembler, with and without --stream.
+
+Writes generated sources with many methods (as a compiler might
+produce), assembles each in a fresh process in each mode, and
+reports the peak resident set size the assembler logs, against
+the size of the source.  With --stream, peak memory should grow
+much more slowly than the source.
+
+Run from anywhere:  python3 bench/bench_stream.py
+"""
+import argparse
+import re
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from bench_symbols import ROOT
+
+SIZES = [1_000, 10_000, 100_000]
+PEAK_PAT = re.compile(r"Peak memory ([0-9.]+) MB")
+
+
+def cli() -> object:
+    parser = argparse.ArgumentParser(
+        description="Peak memory of assembly, with and without streaming")
+    parser.add_argument("sizes", type=int, nargs="*", default=SIZES,
+                        help="Numbers of methods")
+    parser.add_argument("--format", choices=["json", "binary"],
+                        default="json", help="Object code format")
+    return parser.parse_args()
+
+
+def write_source(path: Path, n: int):
+    """A class with n methods, each a loop with a few locals"""
+    with open(path, "w") as f:
+        print(".class Gen:Obj", file=f)
+        print(".field count", file=f)
+        for i in range(n):
+            print(f".method m{i}", file=f)
+            print(".args a", file=f)
+            print(".local i,total", file=f)
+            print("    enter", file=f)
+            print("    const 0", file=f)
+            print("    store i", file=f)
+            print("    load a", file=f)
+            print("    store total", file=f)
+            print("top:", file=f)
+            print("    load i", file=f)
+            print("    const 10", file=f)
+            print("    call Int:less", file=f)
+            print("    jump_ifnot done", file=f)
+            print("    load total", file=f)
+            print("    load i", file=f)
+            print("    call Int:plus", file=f)
+            print("    store total", file=f)
+            print("    const 1", file=f)
+            print("    load i", file=f)
+            print("    call Int:plus", file=f)
+            print("    store i", file=f)
+            print("    jump top", file=f)
+            print("done:", file=f)
+            print("    load total", file=f)
+            print("    return 1", file=f)
+
+
+def peak_memory(source: Path, target: Path, options: list) -> float:
+    """Peak RSS in MB, as logged by the assembler"""
+    result = subprocess.run(
+        [sys.executable, "assemble.py", *options, str(source), str(target)],
+        cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(PEAK_PAT.search(result.stderr)[1])
+
+
+def main():
+    args = cli()
+    print(f"{'methods':>10} {'source MB':>10} {'peak MB':>10} "
+          f"{'stream MB':>10}")
+    with tempfile.TemporaryDirectory() as scratch:
+        source = Path(scratch).joinpath("Gen.asm")
+        target = Path(scratch).joinpath("Gen.obj")
+        for n in args.sizes:
+            write_source(source, n)
+            size = source.stat().st_size / 2**20
+            options = ["--format", args.format]
+            whole = peak_memory(source, target, options)
+            streamed = peak_memory(source, target, options + ["--stream"])
+            print(f"{n:>10} {size:>10.1f} {whole:>10.1f} {streamed:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Scaling benchmark for assembler symbol tables.
+
+Assembles a generated class with n fields, n methods,
+n arguments, and n local variables, each referenced from
+method code, for n from 10 to 100,000.  Time per symbol
+should stay roughly constant (linear scaling).
+
+Run from anywhere:  python3 bench/bench_symbols.py
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import assemble
+
+assemble.log.setLevel(logging.WARNING)
+
+SIZES = [10, 100, 1_000, 10_000, 100_000]
+
+
+def use_root():
+    """Work in the repository root, where the assembler reads
+    asm.conf, and through it finds the built-in classes' object
+    files.  Called from main, not on import, since other
+    benchmarks import this module.
+    """
+    os.chdir(ROOT)
+
+
+def cli() -> object:
+    parser = argparse.ArgumentParser(
+        description="Time assembly of classes with many symbols")
+    parser.add_argument("sizes", type=int, nargs="*", default=SIZES,
+                        help="Numbers of symbols of each kind")
+    return parser.parse_args()
+
+
+def generate(n: int) -> List[str]:
+    """Assembly source for a class with n of each kind of symbol"""
+    lines = [".class Big:Obj"]
+    lines += [f".field f{i}" for i in range(n)]
+    lines += [f".method m{i} forward" for i in range(n)]
+    lines.append(".method $constructor")
+    lines.append(".args " + ",".join(f"a{i}" for i in range(n)))
+    lines.append(".local " + ",".join(f"v{i}" for i in range(n)))
+    lines.append("    enter")
+    for i in range(n):
+        lines.append(f"    load a{i}")
+        lines.append(f"    store v{i}")
+        lines.append("    load $")
+        lines.append(f"    load_field $:f{i}")
+        lines.append(f"    call $:m{i}")
+        lines.append("    new Obj")
+        lines.append("    pop")
+    lines.append("    load $")
+    lines.append(f"    return {n}")
+    return lines
+
+
+def main():
+    args = cli()
+    use_root()
+    print(f"{'symbols':>10} {'lines':>10} {'seconds':>10} {'usec/symbol':>12}")
+    for n in args.sizes:
+        source = generate(n)
+        assemble.reset_imports()
+        started = time.perf_counter()
+        assemble.translate(source)
+        elapsed = time.perf_counter() - started
+        print(f"{n:>10} {len(source):>10} {elapsed:>10.3f} "
+              f"{1e6 * elapsed / n:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Generator of synthetic assembly programs for benchmarks.
+
+A workload is a set of classes Gen0, Gen1, ... in which each
+class may refer to (import) the classes before it, so they must
+be assembled in order.  The shape of each class is set by a
+Workload:  numbers of fields, methods, locals per method, labels
+per method (each the target of a forward jump), distinct
+constants, and imported classes.  Every generated program is
+valid assembly (it assembles without errors).
+"""
+from typing import Dict, List
+
+
+class Workload:
+    """Shape of a generated program"""
+    # Parameter names and defaults, in the order we report them
+    DEFAULTS: Dict[str, int] = {
+        "classes": 4,
+        "methods": 20,
+        "fields": 5,
+        "locals": 4,
+        "labels": 4,
+        "constants": 10,
+        "imports": 2,
+    }
+
+    def __init__(self, **params: int):
+        unknown = set(params) - set(self.DEFAULTS)
+        if unknown:
+            raise ValueError(f"Unknown workload parameters {unknown}")
+        self.params = dict(self.DEFAULTS, **params)
+        for name, value in self.params.items():
+            setattr(self, name, value)
+
+    def class_names(self) -> List[str]:
+        return [f"Gen{i}" for i in range(self.classes)]
+
+    def source(self, i: int) -> List[str]:
+        """Lines of assembly source for class i"""
+        lines = [f".class Gen{i}:Obj"]
+        lines += [f".field f{k}" for k in range(self.fields)]
+        # Forward declarations, so any method can call any other
+        lines += [f".method m{k} forward" for k in range(self.methods)]
+        imports = [f"Gen{j}" for j in range(max(0, i - self.imports), i)]
+        for k in range(self.methods):
+            lines += self.method(k, imports)
+        return lines
+
+    def constant(self, n: int) -> str:
+        """The nth constant operand, cycling through the pool"""
+        n %= max(1, self.constants)
+        if n % 2:
+            return f'"string {n}"'
+        return str(n)
+
+    def method(self, k: int, imports: List[str]) -> List[str]:
+        local_vars = [f"v{n}" for n in range(max(1, self.locals))]
+        lines = [f".method m{k}",
+                 ".args a",
+                 f".local {','.join(local_vars)}",
+                 "    enter"]
+        for n, var in enumerate(local_vars):
+            lines.append(f"    const {self.constant(k + n)}")
+            lines.append(f"    store {var}")
+        for n in range(self.labels):
+            # Skip ahead to a label we have not seen yet
+            lines += [f"    load {local_vars[0]}",
+                      f"    const {self.constant(n)}",
+                      "    call Int:less",
+                      f"    jump_ifnot skip{n}",
+                      f"    load {local_vars[n % len(local_vars)]}",
+                      "    load $",
+                      f"    store_field $:f{n % self.fields}"
+                      if self.fields else "    pop",
+                      f"skip{n}:"]
+        for imported in imports:
+            lines += ["    load a",
+                      f"    new {imported}",
+                      f"    call {imported}:m0",
+                      "    pop"]
+        if self.methods > 1:
+            lines += ["    load a",
+                      "    load $",
+                      f"    call $:m{(k + 1) % self.methods}",
+                      "    pop"]
+        lines += [f"    load {local_vars[-1]}",
+                  "    return 1"]
+        return lines
@@ -0,0 +1,232 @@
+"""
+Incremental build of object files from assembly sources.
+
+    python3 build.py tests/src/*.asm
+
+assembles only the classes whose object files are out of date.
+The object code of a class depends on its own source, and on the
+*signatures* (method and field lists) of its superclass and of the
+classes it refers to, since their slot numbers are built into it.
+So a class is rebuilt when
+
+    - its source has changed (by content, not timestamp),
+    - it was built with different options, or its object file
+      is missing, or
+    - the signature of a class it depends on is not the one it
+      was built against.
+
+Classes are built in dependency order, so a changed signature is
+seen by the classes that depend on it in the same run.  A change to
+a method body leaves the signature of its class as it was, and so
+rebuilds nothing else; a new field or method rebuilds the classes
+that depend on that class, and so on only as far as signatures
+change.
+
+What each class was built from is kept next to the object files
+(e.g., OBJ.build.json).  It is safe to delete; everything is then
+rebuilt once.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+import assemble
+
+logging.basicConfig()
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+BUILD_STATE_VERSION = 1
+
+
+def cli() -> object:
+    parser = argparse.ArgumentParser(
+        description="Assemble the classes whose object files are stale")
+    parser.add_argument("sources", nargs="+", type=Path,
+                        help="Assembly sources, or directories of them")
+    parser.add_argument("-o", "--outdir", type=Path, default=None,
+                        help="Directory for object files (default TVMLIB)")
+    parser.add_argument("--format", choices=assemble.FORMAT_SUFFIXES,
+                        default="json",
+                        help="Object code format (default json)")
+    parser.add_argument("-O", "--optimize", action="store_true",
+                        help="Peephole optimization, shared local "
+                             "slots, and direct calls, as in assemble.py")
+    parser.add_argument("--fuse", action="store_true",
+                        help="Fused operations, as in assemble.py")
+    parser.add_argument("-n", "--dry-run", action="store_true",
+                        help="Report what is stale without building")
+    return parser.parse_args()
+
+
+def source_files(paths: List[Path]) -> List[Path]:
+    sources = []
+    for path in paths:
+        if path.is_dir():
+            sources.extend(sorted(path.glob("*.asm")))
+        else:
+            sources.append(path)
+    return sources
+
+
+def digest(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def signature_hash(class_name: str) -> Optional[str]:
+    """Hash of the method and field lists (and method arities)
+    in the object file of class_name, or None if there is none.
+    The output directory is searched first (see main).
+    """
+    assemble.refresh_library()
+    path = assemble.find_module(class_name)
+    if not path.exists():
+        return None
+    signature = assemble.module_signature(path)
+    return digest(json.dumps([signature["methods"], signature["fields"],
+                              signature["arities"]],
+                             sort_keys=True).encode("utf-8"))
+
+
+def build_order(items: List[assemble.BatchItem]
+                ) -> List[assemble.BatchItem]:
+    """Items with each after the items it depends on"""
+    by_class = {item.class_name: item for item in items}
+    order: List[assemble.BatchItem] = []
+    placed: Set[str] = set()
+    visiting: Set[str] = set()
+
+    def place(item: assemble.BatchItem):
+        if item.class_name in placed:
+            return
+        if item.class_name in visiting:
+            log.error(f"Circular dependence involving {item.source}")
+            return
+        visiting.add(item.class_name)
+        for dependency in sorted(item.depends):
+            if dependency in by_class:
+                place(by_class[dependency])
+        visiting.discard(item.class_name)
+        placed.add(item.class_name)
+        order.append(item)
+
+    for item in items:
+        place(item)
+    return order
+
+
+class Builder:
+    """Builds stale object files, and records what each was built from"""
+    def __init__(self, outdir: Path, format: str,
+                 optimize: bool, fuse: bool):
+        self.outdir = outdir
+        self.format = format
+        self.optimize = optimize
+        self.fuse = fuse
+        # Anything else that changes the object code for the same input
+        self.options = digest(repr((format, optimize, fuse,
+                                    assemble.opcodes.OPDEFS,
+                                    assemble.opcodes.FUSIONS)
+                                   ).encode("utf-8"))
+        self.state_path = Path(f"{outdir}.build.json")
+        self.state: Dict[str, dict] = {}
+        try:
+            with open(self.state_path, "r") as f:
+                state = json.load(f)
+            if state.get("version") == BUILD_STATE_VERSION:
+                self.state = state["classes"]
+        except (OSError, ValueError):
+            log.debug(f"No usable build state {self.state_path}")
+        self.failed: Set[str] = set()
+        self.built = 0
+
+    def target(self, item: assemble.BatchItem) -> Path:
+        return self.outdir.joinpath(item.class_name)\
+            .with_suffix(assemble.FORMAT_SUFFIXES[self.format])
+
+    def stale(self, item: assemble.BatchItem, source_hash: str,
+              depends: Dict[str, Optional[str]]) -> Optional[str]:
+        """Why item must be rebuilt, or None if it need not be"""
+        entry = self.state.get(item.class_name)
+        if entry is None:
+            return "not built before"
+        if not self.target(item).exists():
+            return "object file missing"
+        if entry["source"] != str(item.source):
+            return f"was built from {entry['source']}"
+        if entry["source_hash"] != source_hash:
+            return "source changed"
+        if entry["options"] != self.options:
+            return "options changed"
+        changed = sorted(name for name, signature in depends.items()
+                         if entry["depends"].get(name) != signature)
+        if changed:
+            return f"signature changed: {', '.join(changed)}"
+        return None
+
+    def build(self, item: assemble.BatchItem, dry_run: bool):
+        failed = item.depends & self.failed
+        if failed:
+            log.error(f"Skipping {item.source}: "
+                      f"depends on failed {sorted(failed)}")
+            self.failed.add(item.class_name)
+            return
+        source_hash = digest(item.source.read_bytes())
+        depends = {name: signature_hash(name)
+                   for name in sorted(item.depends)}
+        reason = self.stale(item, source_hash, depends)
+        if reason is None:
+            log.debug(f"{item.class_name} is up to date")
+            return
+        log.info(f"Building {item.class_name} ({reason})")
+        if dry_run:
+            self.built += 1
+            return
+        result = assemble.assemble_file(item.source, self.target(item),
+                                        self.format, stream=False,
+                                        optimize=self.optimize,
+                                        fuse=self.fuse)
+        assemble.save_signature_cache(result["signatures"])
+        if not result["ok"]:
+            self.failed.add(item.class_name)
+            self.state.pop(item.class_name, None)
+            return
+        self.built += 1
+        self.state[item.class_name] = {"source": str(item.source),
+                                       "source_hash": source_hash,
+                                       "options": self.options,
+                                       "depends": depends}
+
+    def save(self):
+        with open(self.state_path, "w") as f:
+            json.dump({"version": BUILD_STATE_VERSION,
+                       "classes": self.state}, f, indent=2)
+
+
+def main():
+    args = cli()
+    # The assembler's errors and summaries, not its debugging messages
+    assemble.log.setLevel(logging.INFO)
+    outdir = args.outdir or assemble.CONFIG.tvmlib
+    outdir.mkdir(parents=True, exist_ok=True)
+    # Dependencies are the object files we build, not copies elsewhere
+    assemble.use_outdir(outdir)
+    items = [assemble.BatchItem(source)
+             for source in source_files(args.sources)]
+    builder = Builder(outdir, args.format, args.optimize, args.fuse)
+    for item in build_order(items):
+        builder.build(item, args.dry_run)
+    if not args.dry_run:
+        builder.save()
+    verb = "Would build" if args.dry_run else "Built"
+    log.info(f"{verb} {builder.built} of {len(items)} classes")
+    sys.exit(1 if builder.failed else 0)
+
+
+if __name__ == "__main__":
+    main()
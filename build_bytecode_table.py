@@ -1,6 +1,15 @@
 """Build table mapping integer byte codes to function pointers.
 Machine operations, their names, and the number of operands
 for each are given in opdefs.txt.
+
+Optionally (--python) also build the same table as a Python
+module, opcodes.py, which the assembler imports rather than
+parsing opdefs.txt each time it starts.
+
+A fused operation (superinstruction) also gives the sequence of
+operations it replaces, e.g. "load $; load_field <any>".  The
+loader translates its operand as it would for the operation in
+the sequence that the operand came from.
 """
 import argparse
 import datetime
@@ -31,10 +40,34 @@ op_tbl_entry vm_op_bytecodes[] = {LB}
 
 # Fixed code at end of generated file
 CODA = """
-    { 0, 0, 0}  // SENTRY
+    { 0, 0, 0, 0}  // SENTRY
 };
 """
 
+# No timestamp here, unlike the C table: opcodes.py is kept in the
+# source tree, and regenerating it should change it only when
+# opdefs.txt changes.
+PY_PROLOGUE = '''"""GENERATED CODE, DO NOT EDIT
+Generated by build_bytecode_table.py from opdefs.txt.
+
+Operations of the tiny virtual machine, in byte code order,
+as (name, byte code, number of operands), and the sequences of
+operations (name, operand pattern) that fused operations replace.
+"""
+
+OPDEFS = ['''
+
+PY_FUSIONS = """]
+
+FUSIONS = ["""
+
+PY_CODA = "]"
+
+# Operand patterns in fused sequences that stand for the operand
+# the fused operation carries
+OPERAND_MARKERS = ["<any>", "<int>", "<str>"]
+
+
 def cli() -> object:
     """Command line interface"""
     parser = argparse.ArgumentParser(prog=__name__,
@@ -45,16 +78,19 @@ def cli() -> object:
     parser.add_argument("outfile", type=argparse.FileType("w"),
                         nargs="?", default=sys.stdout,
                         help="Put C header file here")
+    parser.add_argument("--python", type=argparse.FileType("w"),
+                        help="Also put Python opcode module here")
     args = parser.parse_args()
     return args
 
 
-def main():
-    log.info("Bytecode table generation")
-    args = cli()
-    print(PROLOGUE, file=args.outfile)
-    next_byte_code = 0;
-    for line in args.infile:
+def read_opdefs(infile) -> list:
+    """(name, func, inlines, fuses, comment) for each operation,
+    where fuses is the sequence a fused operation replaces,
+    as a list of (name, operand pattern), or empty
+    """
+    opdefs = []
+    for line in infile:
         line = line.strip()
         # Strip off comments
         parts = line.split("#")
@@ -66,12 +102,56 @@ def main():
         if len(line) == 0:
             continue
         parts = line.split(",")
-        assert len(parts) == 3, f"Couldn't parse {line}"
-        name, func, inlines = parts
-        print(f'\t {LB} "{name}", {func}, {inlines} {RB}, //{next_byte_code} {comment}',
+        assert len(parts) in [3, 4], f"Couldn't parse {line}"
+        name, func, inlines = parts[:3]
+        fuses = []
+        if len(parts) == 4:
+            for step in parts[3].split(";"):
+                op_name, _, operand = step.strip().partition(" ")
+                fuses.append((op_name, operand.strip() or None))
+        opdefs.append((name, func, int(inlines), fuses, comment))
+    return opdefs
+
+
+def operand_funcs(opdefs: list) -> dict:
+    """For each operation name, the function of the operation
+    whose operand it carries ("0" if it has none)
+    """
+    funcs = {name: func for name, func, _, _, _ in opdefs}
+    carried = {}
+    for name, func, inlines, fuses, _ in opdefs:
+        carried[name] = func if inlines else "0"
+        markers = [op_name for op_name, operand in fuses
+                   if operand in OPERAND_MARKERS]
+        if fuses:
+            assert len(markers) == inlines <= 1, \
+                f"{name} must carry the one operand marked in its sequence"
+            carried[name] = funcs[markers[0]] if markers else "0"
+    return carried
+
+
+def main():
+    log.info("Bytecode table generation")
+    args = cli()
+    opdefs = read_opdefs(args.infile)
+    carried = operand_funcs(opdefs)
+    print(PROLOGUE, file=args.outfile)
+    for next_byte_code, (name, func, inlines, fuses, comment) \
+            in enumerate(opdefs):
+        print(f'\t {LB} "{name}", {func}, {inlines}, {carried[name]} {RB}, //{next_byte_code} {comment}',
               file=args.outfile)
-        next_byte_code += 1
     print(CODA, file=args.outfile)
+    if args.python:
+        print(PY_PROLOGUE, file=args.python)
+        for byte_code, (name, func, inlines, fuses, comment) \
+                in enumerate(opdefs):
+            print(f'    ({name!r}, {byte_code}, {inlines}),  # {comment.strip()}',
+                  file=args.python)
+        print(PY_FUSIONS, file=args.python)
+        for name, func, inlines, fuses, comment in opdefs:
+            if fuses:
+                print(f'    ({name!r}, {fuses!r}),', file=args.python)
+        print(PY_CODA, file=args.python)
     log.info("Finished bytecode table generation")
 
 if __name__ == "__main__":
@@ -5,9 +5,25 @@ Basic calculator
 A simple example of a REPL calculator
 
 This example shows how to write a basic calculator with variables.
+Each line is compiled to assembly code for the VM.  Constant
+subexpressions (and variables assigned them) are evaluated at
+compile time, so only the work that remains is emitted.
+
+With a file of expressions, builds a class whose constructor prints
+the value of each, writing its object code directly:
+
+    python3 calc.py exprs.txt OBJ/Calc.json
+    bin/tiny_vm Calc
 """
 from lark import Lark, Transformer, v_args
+from collections import namedtuple
+from typing import Iterable, List, Optional, Tuple
 import logging
+import sys
+import time
+
+import assemble
+
 logging.basicConfig()
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
@@ -43,45 +59,112 @@ calc_grammar = """
     %ignore WS_INLINE
 """
 
+# Expression trees.  Constants are folded as the tree is built,
+# so a Const is a value known at compile time and anything else
+# is work that must be done at run time.
+Const = namedtuple("Const", "value")
+Var = namedtuple("Var", "name")          # Value known only at run time
+BinOp = namedtuple("BinOp", "op left right")
+Neg = namedtuple("Neg", "operand")
+Assign = namedtuple("Assign", "name value")
+
+# Int methods of the VM.  The receiver is pushed last, and
+# sub and div take it as the right operand (other - this).
+METHODS = {"+": "Int:plus", "-": "Int:sub", "*": "Int:mul", "/": "Int:div"}
+
+# Int is 32 bits in the VM; results that overflow are left to it
+INT_MIN, INT_MAX = -2 ** 31, 2 ** 31 - 1
+
+
+def divide(left: int, right: int) -> int:
+    """Integer division as in C, truncating toward zero"""
+    quotient = abs(left) // abs(right)
+    return quotient if (left < 0) == (right < 0) else -quotient
+
+
+OPERATIONS = {"+": lambda left, right: left + right,
+              "-": lambda left, right: left - right,
+              "*": lambda left, right: left * right,
+              "/": divide}
+
+
+def is_const(node, value=None) -> bool:
+    return isinstance(node, Const) and (value is None or node.value == value)
+
+
+def fold_neg(operand):
+    if is_const(operand) and -operand.value <= INT_MAX:
+        return Const(-operand.value)
+    if isinstance(operand, Neg):
+        return operand.operand                          # --x
+    return Neg(operand)
+
+
+def fold_binop(op: str, left, right):
+    """Simplest tree for left op right.  Division by zero is
+    never folded, so it still fails at run time as it should.
+    """
+    if op == "/" and is_const(right, 0):
+        return BinOp(op, left, right)
+    if is_const(left) and is_const(right):
+        value = OPERATIONS[op](left.value, right.value)
+        if INT_MIN <= value <= INT_MAX:
+            return Const(value)
+        return BinOp(op, left, right)
+    if op == "+" and is_const(left, 0):
+        return right                                    # 0+x
+    if op in "+-" and is_const(right, 0):
+        return left                                     # x+0, x-0
+    if op == "-" and is_const(left, 0):
+        return fold_neg(right)                          # 0-x
+    if op == "*" and is_const(left, 1):
+        return right                                    # 1*x
+    if op in "*/" and is_const(right, 1):
+        return left                                     # x*1, x/1
+    return BinOp(op, left, right)
+
+
 @v_args(inline=True)    # Affects the signatures of the methods
-class EmitCode(Transformer):
-    """Copying from CalculateTree except that we are not
-    importing add, sub, etc from operator.
+class BuildTree(Transformer):
+    """Like CalculateTree, but building a folded expression tree.
+    Variables assigned a constant are replaced by it; others
+    are kept in locals of the same name.
     """
     def __init__(self):
-        log.debug("EmitCode constructor")
+        log.debug("BuildTree constructor")
+        self.vars = {}
 
     def assign_var(self, name, value):
-        self.vars[name] = value
-        return value
+        name = str(name)
+        self.vars[name] = value if is_const(value) else Var(name)
+        return Assign(name, value)
 
     def add(self, left, right):
         log.debug('sum "+" product   -> add')
-        print("call Int:plus")
+        return fold_binop("+", left, right)
 
     def sub(self, left, right):
         log.debug('sum "-" product   -> sub')
-        print("call Int:sub")
-
-    def product(self, left):
-        log.debug('?product: atom')
+        return fold_binop("-", left, right)
 
     def mul(self, left, right):
         log.debug('product "*" atom   -> mul')
-        print("call Int:mul")
+        return fold_binop("*", left, right)
 
     def div(self, left, right):
         log.debug('product "/" atom   -> div')
-        print("call Int:div")
+        return fold_binop("/", left, right)
 
     def number(self, v):
         log.debug(f'number: {v}')
-        print(f"const {v}")
+        try:
+            return Const(int(v))
+        except ValueError:
+            raise Exception("Only integers are supported: %s" % v)
 
-    def neg(self, left):
+    def neg(self, operand):
         log.debug('"-" atom           -> neg')
-        print("const 0")
-        print("call Int:sub")
+        return fold_neg(operand)
 
     def var(self, name):
         try:
@@ -89,6 +172,36 @@ class EmitCode(Transformer):
         except KeyError:
             raise Exception("Variable not found: %s" % name)
 
+
+Op = Tuple[str, Optional[str]]  # Operation name and operand
+
+
+def emit(node) -> List[Op]:
+    """Instructions that leave the value of node on the stack
+    (or for an assignment, store it, if it is not a constant)
+    """
+    if isinstance(node, Assign):
+        if is_const(node.value):
+            return []
+        return emit(node.value) + [("store", node.name)]
+    if isinstance(node, Const):
+        if node.value < 0:
+            # Only non-negative literals assemble
+            return [("const", "0"), ("const", str(-node.value)),
+                    ("call", "Int:sub")]
+        return [("const", str(node.value))]
+    if isinstance(node, Var):
+        return [("load", node.name)]
+    if isinstance(node, Neg):
+        return [("const", "0")] + emit(node.operand) + [("call", "Int:sub")]
+    return emit(node.left) + emit(node.right) + [("call", METHODS[node.op])]
+
+
+def as_text(ops: List[Op]) -> str:
+    return "\n".join(name if operand is None else f"{name} {operand}"
+                     for name, operand in ops)
+
+
 @v_args(inline=True)    # Affects the signatures of the methods
 class CalculateTree(Transformer):
     from operator import add, sub, mul, truediv as div, neg
@@ -108,12 +221,144 @@ class CalculateTree(Transformer):
             raise Exception("Variable not found: %s" % name)
 
 
-# calc_parser = Lark(calc_grammar, parser='lalr', transformer=CalculateTree())
-calc_parser = Lark(calc_grammar, parser='lalr', transformer=EmitCode())
-calc = calc_parser.parse
-
-
-def main():
+# The parser is built when first used, not on import.  Analysis
+# of the grammar takes much longer than loading the LALR tables,
+# so Lark caches them in a file next to TVMLIB, like the assembler's
+# caches (not in the shared temporary directory, since the cache is
+# a pickle); the cache is rebuilt if the grammar (or the version of
+# Lark) changes.  None means OBJ.calc_parser.lark for TVMLIB = OBJ.
+PARSER_CACHE: Optional[str] = None
+
+tree_builder = BuildTree()
+_calc_parser: Optional[Lark] = None
+
+
+def calc_parser() -> Lark:
+    """The one parser, which applies tree_builder as it parses"""
+    global _calc_parser
+    if _calc_parser is None:
+        # calc_parser = Lark(calc_grammar, parser='lalr', transformer=CalculateTree())
+        _calc_parser = Lark(calc_grammar, parser='lalr',
+                            transformer=tree_builder,
+                            cache=PARSER_CACHE or
+                            f"{assemble.CONFIG.tvmlib}.calc_parser.lark")
+    return _calc_parser
+
+
+def calc(s: str) -> str:
+    """Assembly code for one line"""
+    return as_text(emit(calc_parser().parse(s)))
+
+
+# ----------------
+# Batch compilation:  A file of expressions becomes the constructor
+# of a class that prints the value of each expression (assignments
+# print nothing).  Instructions go straight to the assembler's
+# ObjectCode, with no assembly text in between.
+#
+# Each distinct constant takes a slot in the class's constant pool,
+# which the VM loader limits (see LOADER_CONSTANT_CAPACITY).
+#
+PRINT_VALUE = [("call", "Int:print"), ("pop", None),
+               ("const", '"\\n"'), ("call", "String:print"), ("pop", None)]
+
+
+def parse_lines(lines: Iterable[str]) -> Tuple[List[object], int]:
+    """Folded trees of the non-blank lines, and the number of
+    lines that could not be parsed (which are logged and skipped).
+    All the lines share one parser.
+    """
+    parser = calc_parser()
+    tree_builder.vars = {}  # A fresh program
+    trees, errors = [], 0
+    for line_num, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            trees.append(parser.parse(line))
+        except Exception as e:
+            log.error(f"Line {line_num}: {e}")
+            errors += 1
+    return trees, errors
+
+
+def locals_of(trees: List[object]) -> List[str]:
+    """Variables that must be kept at run time"""
+    method_locals = []
+    for tree in trees:
+        if isinstance(tree, Assign) and not is_const(tree.value) \
+                and tree.name not in method_locals:
+            method_locals.append(tree.name)
+    return method_locals
+
+
+def compile_trees(trees: List[object], class_name: str = "Calc"
+                  ) -> assemble.ObjectCode:
+    """Object code for a class whose constructor evaluates trees"""
+    # Locals are allocated before any code, so we need them all first
+    method_locals = locals_of(trees)
+    # Forget classes imported for an earlier program in this process
+    assemble.reset_imports()
+    code = assemble.ObjectCode()
+    code.declare_class(class_name, "Obj")
+    code.begin_method("$constructor")
+    if method_locals:
+        code.add_instruction(instruction("alloc", len(method_locals)))
+        code.declare_locals(method_locals)
+    code.add_instruction(instruction("enter"))
+    for tree in trees:
+        ops = emit(tree)
+        if not isinstance(tree, Assign):
+            ops += PRINT_VALUE
+        for name, operand in ops:
+            code.add_instruction(instruction(name, operand))
+    code.add_instruction(instruction("const", "nothing"))
+    code.add_instruction(instruction("return", "0"))
+    code.end_method()
+    return code
+
+
+def instruction(name: str, operand=None) -> assemble.Instruction:
+    return assemble.Instruction(None, assemble.INSTRS[name], operand)
+
+
+def cli() -> object:
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Calculator:  a REPL printing assembly code, or with "
+                    "a source, a compiler to object code")
+    parser.add_argument("source", type=argparse.FileType("r"), nargs="?",
+                        help="Expressions, one per line ('-' for stdin)")
+    parser.add_argument("target", type=argparse.FileType("w"), nargs="?",
+                        help="Object file (default OBJ/<class>.json)")
+    parser.add_argument("--class", dest="class_name", default="Calc",
+                        help="Name of the class to build (default Calc)")
+    return parser.parse_args()
+
+
+def compile_file(source, target, class_name: str) -> bool:
+    """Compile source to target, logging throughput.
+    Returns True iff every line compiled.
+    """
+    started = time.perf_counter()
+    trees, errors = parse_lines(source)
+    parsed = time.perf_counter()
+    code = compile_trees(trees, class_name)
+    if target is None:
+        assemble.CONFIG.tvmlib.mkdir(exist_ok=True)
+        target = open(assemble.CONFIG.tvmlib.joinpath(
+            f"{class_name}.json"), "w")
+    with target:
+        code.write(target)
+    elapsed = time.perf_counter() - started
+    log.info(f"Compiled {len(trees)} expressions to {target.name} in "
+             f"{elapsed:.3f} seconds ({len(trees) / elapsed:.0f} per "
+             f"second; {100 * (parsed - started) / elapsed:.0f}% parsing)")
+    return errors == 0
+
+
+def repl():
     while True:
         try:
             s = input('> ')
@@ -122,9 +367,21 @@ def main():
         print(calc(s))
 
 
+def main():
+    args = cli()
+    # Only our own summary, not the assembler's messages about imports
+    assemble.log.setLevel(logging.WARNING)
+    if args.source is None:
+        repl()
+    elif not compile_file(args.source, args.target, args.class_name):
+        sys.exit(1)
+
+
 def test():
     print(calc("a = 1+2"))
     print(calc("1+a*-3"))
+    print(calc("b = a/0"))
+    print(calc("--b*1+0"))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,398 @@
+"""
+Whole-program linker:  combine the object files of a program
+into one pre-linked load image, which the VM loads in one pass.
+
+    python3 link.py Main            # writes Main.tvmi
+    bin/tiny_vm -I Main.tvmi
+
+Starting from the main class, the linker finds every class the
+program needs (superclasses and imports, transitively) in the
+object file library, orders them so that each class comes after
+its superclass, merges their constant pools into one, resolves
+class references to indexes in one class table, and works out
+which class's method fills each slot of each vtable.  The loader
+then has no classes to find by name (except built-in classes),
+no constants to remap class by class, and no JSON to parse.
+
+With --prune, the linker also leaves out the code that the program
+cannot reach.  Starting from the constructor of the main class, it
+follows calls (by vtable slot, to every class the program creates),
+new, and is_instance through the code they reach.  Methods no call
+can reach are left out, and their vtable slots filled with a stub
+that stops the VM; classes that reachable code neither creates nor
+tests for, and that no class kept inherits from, are left out
+altogether.
+
+Image layout (version 3).  As in binary object files (see
+objfile.py), every item is a little-endian 32-bit word:
+
+    "TVMI"                      magic
+    version                     currently 3
+    length                      of the whole file, in bytes
+    main                        class index of the main class
+    strings:    as in binary object files
+    builtins:   count, then string indexes of built-in classes,
+                which come first in the class table
+    classes:    count, then for each class, in load order,
+                name string index, super class index,
+                n_fields, n_methods
+    constants:  count, then (kind character, value string index)
+    code:       count, then for each method
+                class index, slot, name string index,
+                max_stack (-1 if not known), number of words, words
+    vtables:    for each class, n_methods class indexes: the
+                class whose own method fills that slot, or -1 if
+                its method was pruned
+
+In the code, constant operands are indexes in the image's constant
+pool (named literals are negative, as in object files), and class
+operands are class indexes.
+
+The loader (vm_loader.c) MUST agree with this layout.
+"""
+
+import argparse
+import logging
+import sys
+from array import array
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import assemble
+import objfile
+
+logging.basicConfig()
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+MAGIC = b"TVMI"
+VERSION = 3
+IMAGE_SUFFIX = ".tvmi"
+UNREACHABLE = -1  # Class index in the vtable of a pruned slot
+
+# Classes the VM provides, which have no code in object files;
+# these MUST match the classes vm_loader_init loads
+BUILTINS = ["Obj", "String", "Boolean", "Int", "Nothing"]
+
+# Capacities of the VM; these MUST match vm_state.h and vm_loader.c
+CODE_CAPACITY = 1024 - 16  # Less room for the main program
+CONST_POOL_CAPACITY = 128
+MAX_CLASSES = 100
+
+# Opcode -> number of operands, and the operation whose operand
+# it carries (a fused operation carries the operand of one of its parts)
+OPERANDS: Dict[int, Tuple[int, Optional[str]]] = {
+    op.code: (op.ops, op.operand_op) for op in assemble.INSTRS.ops.values()}
+
+# Slots of the methods that built-in methods call, by the slot of
+# the built-in method (Obj:print calls string, then print on the
+# string); these MUST match builtins.c
+BUILTIN_CALLS = {2: [1, 2]}
+
+
+class LinkError(Exception):
+    """The program cannot be linked"""
+    pass
+
+
+def cli() -> object:
+    parser = argparse.ArgumentParser(
+        description="Link a program's object files into one load image")
+    parser.add_argument("main", help="Main class")
+    parser.add_argument("-L", "--library", type=Path, default=Path("OBJ"),
+                        help="Where to find object files (default OBJ)")
+    parser.add_argument("-o", "--output", type=Path, default=None,
+                        help="Load image (default <main>.tvmi)")
+    parser.add_argument("--prune", action="store_true",
+                        help="Leave out methods and classes the "
+                             "program cannot reach")
+    return parser.parse_args()
+
+
+def operands(code: List[int]) -> Iterator[Tuple[int, Optional[str], int]]:
+    """Position, the operation it belongs to, and value of each
+    operand in encoded method code
+    """
+    pos = 0
+    while pos < len(code):
+        ops, operand_of = OPERANDS[code[pos]]
+        if ops:
+            yield pos + 1, operand_of, code[pos + 1]
+        pos += 1 + ops
+
+
+class Program:
+    """The classes of a program, in load order"""
+    def __init__(self, library: Path):
+        self.library = library
+        self.objects: Dict[str, dict] = {}
+        self.order: List[str] = []  # Each after its superclass
+        self.builtins: List[str] = []  # Those the program uses
+        self.visiting: List[str] = []  # Superclass chain being loaded
+        # Slots of each class whose own method was pruned
+        self.pruned: Dict[str, Set[int]] = {}
+
+    def read(self, class_name: str) -> dict:
+        for suffix in objfile.SUFFIXES:
+            path = self.library.joinpath(class_name + suffix)
+            if path.exists():
+                return objfile.read_object(path)
+        raise LinkError(f"No object file for class {class_name} "
+                        f"in {self.library}")
+
+    def add(self, class_name: str):
+        """Add class_name, after its superclass, then its imports"""
+        if class_name in BUILTINS:
+            if class_name not in self.builtins:
+                self.builtins.append(class_name)
+            return
+        if class_name in self.objects:
+            return
+        if class_name in self.visiting:
+            raise LinkError(f"Class {class_name} inherits from itself")
+        obj = self.read(class_name)
+        if "code" not in obj:
+            raise LinkError(f"Class {class_name} has no code, "
+                            f"and is not built into the VM")
+        self.visiting.append(class_name)
+        self.add(obj["super"])
+        self.visiting.pop()
+        self.objects[class_name] = obj
+        self.order.append(class_name)
+        for imported in obj["imports"]:
+            self.add(imported)
+
+    def class_table(self) -> List[str]:
+        return self.builtins + self.order
+
+    def owner(self, class_name: str, slot: int) -> Optional[str]:
+        """The class whose own method fills slot in the vtable of
+        class_name (a built-in class if it is inherited from one),
+        or None if no class defines it
+        """
+        while class_name not in BUILTINS:
+            obj = self.objects[class_name]
+            if any(method["slot"] == slot for method in obj["code"]):
+                return class_name
+            if slot >= obj["n_inherited"]:
+                return None
+            class_name = obj["super"]
+        return class_name
+
+    def prune(self, main: str) -> Tuple[int, int, int]:
+        """Leave out the methods that no call reachable from the
+        constructor of main can reach, and the classes that reachable
+        code neither creates nor tests for, except superclasses of
+        those.  A call may reach the method in its slot of any class
+        the program creates.  Returns the numbers of methods, words
+        of code, and classes left out.
+        """
+        created = {main}
+        tested: Set[str] = set()
+        called = {0}  # The VM calls the constructor of main
+        live: Set[Tuple[str, int]] = set()  # (class, slot) of methods
+        changed = True
+        while changed:
+            changed = False
+            for class_name in sorted(created - set(BUILTINS)):
+                obj = self.objects[class_name]
+                for slot in sorted(called):
+                    if slot >= obj["n_methods"]:
+                        continue
+                    owner = self.owner(class_name, slot)
+                    if owner in BUILTINS or owner is None \
+                            or (owner, slot) in live:
+                        continue
+                    live.add((owner, slot))
+                    changed = True
+                    owner_obj = self.objects[owner]
+                    method, = [method for method in owner_obj["code"]
+                               if method["slot"] == slot]
+                    for _, operand_of, operand in operands(method["code"]):
+                        if operand_of == "call":
+                            called.add(operand)
+                            called.update(BUILTIN_CALLS.get(operand, []))
+                        elif operand_of == "new":
+                            created.add(owner_obj["imports"][operand])
+                        elif operand_of == "is_instance":
+                            tested.add(owner_obj["imports"][operand])
+        kept: Set[str] = set()
+        for class_name in created | tested:
+            while class_name not in BUILTINS and class_name not in kept:
+                kept.add(class_name)
+                class_name = self.objects[class_name]["super"]
+        n_methods = n_words = 0
+        for class_name in self.order:
+            obj = self.objects[class_name]
+            code, pruned = [], []
+            for method in obj["code"]:
+                if class_name in kept \
+                        and (class_name, method["slot"]) in live:
+                    code.append(method)
+                else:
+                    pruned.append(method)
+            n_methods += len(pruned)
+            n_words += sum(len(method["code"]) for method in pruned)
+            self.pruned[class_name] = {method["slot"] for method in pruned}
+            self.objects[class_name] = dict(obj, code=code)
+        n_classes = len(self.order) - len(kept)
+        self.order = [name for name in self.order if name in kept]
+        return n_methods, n_words, n_classes
+
+
+class Image:
+    """Load image of a linked program"""
+    def __init__(self, program: Program, main: str):
+        self.program = program
+        self.classes = program.class_table()
+        self.class_index = {name: i for i, name in enumerate(self.classes)}
+        self.main = self.class_index[main]
+        self.strings = objfile.StringTable()
+        # Constant pool of the whole program, each entered once
+        self.constants: List[Tuple[str, str]] = []
+        self.constant_index: Dict[Tuple[str, str], int] = {}
+        self.vtables: Dict[str, List[int]] = {}
+        self.n_methods = 0
+        self.n_code_words = 0
+
+    def constant(self, kind: str, value: str) -> int:
+        key = (kind, value)
+        if key not in self.constant_index:
+            self.constant_index[key] = len(self.constants)
+            self.constants.append(key)
+        return self.constant_index[key]
+
+    def relocate(self, obj: dict, code: List[int]) -> List[int]:
+        """Code with constant and class operands made global"""
+        code = list(code)
+        for pos, operand_of, operand in operands(code):
+            if operand_of == "const" and operand >= 0:
+                constant = obj["constants"][operand]
+                code[pos] = self.constant(constant["kind"],
+                                          constant["value"])
+            elif operand_of in ["new", "is_instance"]:
+                code[pos] = self.class_index[obj["imports"][operand]]
+        return code
+
+    def vtable(self, class_name: str) -> List[int]:
+        """For each method slot, the index of the class that
+        defines the method in it
+        """
+        obj = self.program.objects[class_name]
+        defined = {method["slot"] for method in obj["code"]}
+        super_name = obj["super"]
+        if super_name in BUILTINS:
+            inherited = [self.class_index[super_name]] * obj["n_inherited"]
+        else:
+            inherited = self.vtables[super_name][:obj["n_inherited"]]
+        own = self.class_index[class_name]
+        table = []
+        for slot in range(obj["n_methods"]):
+            if slot in defined:
+                table.append(own)
+            elif slot in self.program.pruned.get(class_name, ()):
+                table.append(UNREACHABLE)
+            elif slot < len(inherited):
+                table.append(inherited[slot])
+            else:
+                raise LinkError(f"Method {obj['methods'][slot]} of "
+                                f"{class_name} is declared but not defined")
+        return table
+
+    def words(self) -> array:
+        """Everything after the string table"""
+        words = array("i")
+        words.append(len(self.program.builtins))
+        words.extend(self.strings.ref(name)
+                     for name in self.program.builtins)
+        words.append(len(self.program.order))
+        for class_name in self.program.order:
+            obj = self.program.objects[class_name]
+            words.extend([self.strings.ref(class_name),
+                          self.class_index[obj["super"]],
+                          obj["n_fields"], obj["n_methods"]])
+        code = array("i")
+        for class_name in self.program.order:
+            obj = self.program.objects[class_name]
+            for method in obj["code"]:
+                method_code = self.relocate(obj, method["code"])
+                code.extend([self.class_index[class_name], method["slot"],
+                             self.strings.ref(method["name"]),
+                             method.get("max_stack", -1),
+                             len(method_code)])
+                code.extend(method_code)
+                self.n_methods += 1
+                self.n_code_words += len(method_code)
+            self.vtables[class_name] = self.vtable(class_name)
+        # Constants are all known once the code is relocated
+        words.append(len(self.constants))
+        for kind, value in self.constants:
+            words.extend([ord(kind[0]), self.strings.ref(value)])
+        words.append(self.n_methods)
+        words.extend(code)
+        for class_name in self.program.order:
+            words.extend(self.vtables[class_name])
+        return words
+
+    def dump(self) -> bytes:
+        words = self.words()
+        text = bytearray()
+        offsets = array("i")
+        for s in self.strings.strings:
+            offsets.append(len(text))
+            text += s.encode("utf-8") + b"\0"
+        text += b"\0" * (-len(text) % 4)
+        body = (objfile.WORD.pack(len(self.strings.strings))
+                + objfile.WORD.pack(len(text))
+                + objfile.little_endian(offsets) + bytes(text)
+                + objfile.little_endian(words))
+        header = MAGIC + objfile.little_endian(
+            array("i", [VERSION, len(MAGIC) + 3 * objfile.WORD.size
+                        + len(body), self.main]))
+        return header + body
+
+    def check_capacity(self):
+        """Warn of what will not fit in the VM"""
+        for what, count, capacity in [
+                ("code words", self.n_code_words, CODE_CAPACITY),
+                ("constants", len(self.constants), CONST_POOL_CAPACITY),
+                ("classes", len(self.program.order),
+                 MAX_CLASSES - 1 - len(BUILTINS))]:
+            if count > capacity:
+                log.warning(f"Program has {count} {what}, but the VM "
+                            f"has room for {capacity}")
+
+
+def link(main: str, library: Path, prune: bool = False) -> bytes:
+    """Load image of the program whose main class is main,
+    without the code it cannot reach if prune
+    """
+    program = Program(library)
+    program.add(main)
+    if prune:
+        n_methods, n_words, n_classes = program.prune(main)
+        log.info(f"Pruned {n_methods} unreachable methods ({n_words} "
+                 f"words of code) and {n_classes} unreachable classes")
+    image = Image(program, main)
+    data = image.dump()
+    image.check_capacity()
+    log.info(f"Linked {len(program.order)} classes "
+             f"({image.n_methods} methods, {image.n_code_words} words "
+             f"of code, {len(image.constants)} constants)")
+    return data
+
+
+def main():
+    args = cli()
+    output = args.output or Path(args.main + IMAGE_SUFFIX)
+    try:
+        data = link(args.main, args.library, args.prune)
+    except (LinkError, OSError, ValueError, KeyError) as e:
+        log.error(f"Cannot link {args.main}: {e}")
+        sys.exit(1)
+    output.write_bytes(data)
+    log.info(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
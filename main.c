@@ -4,6 +4,7 @@
 #include <unistd.h>
 #include "vm_state.h"
 #include "vm_loader.h"
+#include "vm_profile.h"
 #include "logger.h"
 
 #define PATHBUFSIZE 1000
@@ -15,8 +16,19 @@ int main(int argc, char *argv[]) {
     char load_path[PATHBUFSIZE];
     int ok = 1;
     char *load_library = "./OBJ";
-    while ((opt = getopt(argc, argv, ":DL:")) != -1) {
+    char *profile_path = 0;
+    char *image_path = 0;
+    while ((opt = getopt(argc, argv, ":DL:P:I:")) != -1) {
         switch (opt) {
+            case 'I':
+                // Whole program, pre-linked by link.py
+                image_path = optarg;
+                break;
+            case 'P':
+                // Count executions of each instruction
+                profile_path = optarg;
+                vm_profile_start();
+                break;
             case 'L':
                 load_library = optarg;
                 fprintf(stderr, "Look in '%s' for object modules\n", optarg);
@@ -37,7 +49,11 @@ int main(int argc, char *argv[]) {
         }
     }
     log_debug("Finished options, load library is %s\n", load_library);
-    if (ok && optind < argc) {
+    if (ok && image_path) {
+        vm_loader_init(load_library);
+        main_class = image_path;
+        ok = vm_load_image_from_path(image_path);
+    } else if (ok && optind < argc) {
         log_debug("There is at least one non-option argument\n");
         vm_loader_init(load_library);
         for (; ok && optind < argc; ++optind) {
@@ -51,6 +67,10 @@ int main(int argc, char *argv[]) {
         log_info("Executing %s\n", main_class);
         vm_run();
         log_info("Ran");
+        if (profile_path) {
+            vm_profile_write(profile_path);
+            vm_profile_free();
+        }
     } else {
         fprintf(stderr, "Errors, will not run\n");
     }
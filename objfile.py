@@ -0,0 +1,244 @@
+"""Object file formats for the tiny virtual machine.
+
+Object code for a class can be written in either of two formats
+holding the same information:
+
+- JSON (.json), readable and easy to debug, and
+- a compact binary format (.tvmo), which is several times smaller
+  and can be read by the loader without a parser.
+
+In Python, both are represented by the structure the assembler
+builds for JSON (a dict with class_name, super, imports, methods,
+arities, fields, n_fields, n_methods, n_inherited, constants, and
+code).
+
+Binary layout (version 2).  Every item is a little-endian 32-bit
+word, so the file can be mapped into memory and read in place:
+
+    "TVMO"                      magic
+    version                     currently 2
+    length                      of the whole file, in bytes
+    class_name, super           string table indexes
+    n_fields, n_methods, n_inherited
+    strings:    count, byte length of the text, then the byte offset
+                of each string in the text, then the text: each
+                string in UTF-8 with a NUL after it, padded to a word
+    imports:    count, then string indexes
+    methods:    count, then string indexes
+    arities:    count, then the arity of each method (-1 if not known)
+    fields:     count, then string indexes
+    constants:  count, then (kind character, value string index)
+    code:       count, then for each method
+                name string index, slot, max_stack (-1 if not
+                known), number of words, words
+
+The loader (vm_loader.c) MUST agree with this layout.
+"""
+
+import io
+import json
+import struct
+from array import array
+from pathlib import Path
+from typing import BinaryIO, Dict, List, TextIO, Union
+
+MAGIC = b"TVMO"
+VERSION = 2
+JSON_SUFFIX = ".json"
+BINARY_SUFFIX = ".tvmo"
+SUFFIXES = [BINARY_SUFFIX, JSON_SUFFIX]  # In order of preference
+
+WORD = struct.Struct("<i")
+HEADER = struct.Struct("<4s7i")
+
+
+class ObjectFormatError(Exception):
+    """Not a binary object file we can read"""
+    pass
+
+
+class StringTable:
+    """Strings of a binary object file, each stored once"""
+    def __init__(self):
+        self.strings: List[str] = []
+        self.index: Dict[str, int] = {}
+
+    def ref(self, s: str) -> int:
+        if s not in self.index:
+            self.index[s] = len(self.strings)
+            self.strings.append(s)
+        return self.index[s]
+
+
+def little_endian(words: array) -> bytes:
+    """Bytes of words in the file's byte order, regardless of host"""
+    if array("i", [1]).tobytes() != WORD.pack(1):
+        words = array("i", words)
+        words.byteswap()
+    return words.tobytes()
+
+
+def write_binary(obj: dict, f: BinaryIO):
+    """Write object code structure obj to binary file f.  The code
+    of obj may be any collection of methods that can be iterated
+    twice (to size it, then to write it), so methods need not all
+    be in memory at once.
+    """
+    strings = StringTable()
+    words = array("i")
+
+    def section(items: List[int]):
+        words.append(len(items))
+        words.extend(items)
+
+    # Everything after the string table refers to strings by index,
+    # so encode it first and put the string table in front afterward.
+    section([strings.ref(name) for name in obj["imports"]])
+    section([strings.ref(name) for name in obj["methods"]])
+    section(obj.get("arities", [-1] * len(obj["methods"])))
+    section([strings.ref(name) for name in obj["fields"]])
+    words.append(len(obj["constants"]))
+    for constant in obj["constants"]:
+        words.append(ord(constant["kind"][0]))
+        words.append(strings.ref(constant["value"]))
+    n_methods = 0
+    n_code_words = 1
+    for method in obj["code"]:
+        strings.ref(method["name"])
+        n_methods += 1
+        n_code_words += 4 + len(method["code"])
+    class_name = strings.ref(obj["class_name"])
+    super_name = strings.ref(obj["super"])
+
+    text = bytearray()
+    offsets = array("i")
+    for s in strings.strings:
+        if "\0" in s:
+            raise ValueError(f"NUL character in {s!r}")
+        offsets.append(len(text))
+        text += s.encode("utf-8") + b"\0"
+    text += b"\0" * (-len(text) % 4)
+    body = (WORD.pack(len(strings.strings)) + WORD.pack(len(text))
+            + little_endian(offsets) + bytes(text) + little_endian(words))
+    length = HEADER.size + len(body) + n_code_words * WORD.size
+    f.write(HEADER.pack(MAGIC, VERSION, length, class_name, super_name,
+                        obj["n_fields"], obj["n_methods"],
+                        obj["n_inherited"]))
+    f.write(body)
+    f.write(WORD.pack(n_methods))
+    for method in obj["code"]:
+        method_words = array("i", [strings.ref(method["name"]),
+                                   method["slot"],
+                                   method.get("max_stack", -1),
+                                   len(method["code"])])
+        method_words.extend(method["code"])
+        f.write(little_endian(method_words))
+
+
+def dump(obj: dict) -> bytes:
+    """Binary object file contents for object code structure obj"""
+    f = io.BytesIO()
+    write_binary(obj, f)
+    return f.getvalue()
+
+
+def write_json(obj: dict, f: TextIO):
+    """Write object code structure obj to text file f as JSON,
+    exactly as json.dump(obj, f, indent=4) would, but one method
+    at a time.  The code of obj may be any iterable of methods.
+    """
+    head = json.dumps(dict(obj, code=[]), indent=4)
+    empty = "[]\n}"
+    assert head.endswith(empty), "Code must be the last item"
+    f.write(head[:-len(empty)])
+    separator = "[\n"
+    for method in obj["code"]:
+        f.write(separator)
+        # Nested two levels deep in the whole structure
+        text = json.dumps(method, indent=4)
+        f.write("        " + text.replace("\n", "\n        "))
+        separator = ",\n"
+    f.write("]\n}" if separator == "[\n" else "\n    ]\n}")
+
+
+def load(data: Union[bytes, memoryview]) -> dict:
+    """Object code structure from binary object file contents
+    (bytes, or a memory-mapped file)
+    """
+    if len(data) < HEADER.size:
+        raise ObjectFormatError("Truncated object file")
+    (magic, version, length, class_name, super_name,
+     n_fields, n_methods, n_inherited) = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ObjectFormatError("Not a binary object file")
+    if version != VERSION:
+        raise ObjectFormatError(f"Object file version {version}, "
+                                f"expecting {VERSION}")
+    if length != len(data):
+        raise ObjectFormatError(f"Object file length {len(data)}, "
+                                f"header says {length}")
+    pos = HEADER.size
+
+    def word() -> int:
+        nonlocal pos
+        value, = WORD.unpack_from(data, pos)
+        pos += WORD.size
+        return value
+
+    def words(n: int) -> List[int]:
+        nonlocal pos
+        values = array("i")
+        values.frombytes(data[pos:pos + n * WORD.size])
+        if array("i", [1]).tobytes() != WORD.pack(1):
+            values.byteswap()
+        pos += n * WORD.size
+        return values.tolist()
+
+    n_strings = word()
+    n_bytes = word()
+    pos += n_strings * WORD.size  # Offsets are for the loader
+    text = bytes(data[pos:pos + n_bytes])
+    strings = text.decode("utf-8").split("\0")[:n_strings]
+    pos += n_bytes
+    imports = [strings[i] for i in words(word())]
+    methods = [strings[i] for i in words(word())]
+    arities = words(word())
+    fields = [strings[i] for i in words(word())]
+    constants = []
+    for _ in range(word()):
+        kind, value = words(2)
+        constants.append({"kind": chr(kind), "value": strings[value]})
+    code = []
+    for _ in range(word()):
+        name, slot, max_stack = words(3)
+        method = {"name": strings[name], "slot": slot}
+        if max_stack >= 0:
+            method["max_stack"] = max_stack
+        method["code"] = words(word())
+        code.append(method)
+    return {
+        "class_name": strings[class_name],
+        "super": strings[super_name],
+        "imports": imports,
+        "methods": methods,
+        "arities": arities,
+        "fields": fields,
+        "n_fields": n_fields,
+        "n_methods": n_methods,
+        "n_inherited": n_inherited,
+        "constants": constants,
+        "code": code
+    }
+
+
+def loads(content: bytes) -> dict:
+    """Object code structure from object file contents in either format"""
+    if content[:len(MAGIC)] == MAGIC:
+        return load(content)
+    return json.loads(content)
+
+
+def read_object(path: Path) -> dict:
+    """Object code structure from an object file in either format"""
+    with open(path, "rb") as f:
+        return loads(f.read())
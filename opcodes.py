@@ -0,0 +1,44 @@
+"""GENERATED CODE, DO NOT EDIT
+Generated by build_bytecode_table.py from opdefs.txt.
+
+Operations of the tiny virtual machine, in byte code order,
+as (name, byte code, number of operands), and the sequences of
+operations (name, operand pattern) that fused operations replace.
+"""
+
+OPDEFS = [
+    ('halt', 0, 0),  # Stops the processor.
+    ('const', 1, 1),  # Push constant; constant value follows
+    ('call', 2, 1),  # Call an interpreted method
+    ('call_native', 3, 1),  # Trampoline to native method
+    ('enter', 4, 0),  # Prologue of called method
+    ('return', 5, 1),  # Return from method, reclaiming locals
+    ('new', 6, 1),  # Allocate a new object instance
+    ('pop', 7, 0),  # Discard top of stack
+    ('alloc', 8, 1),  # Allocate stack space for locals
+    ('load', 9, 1),  # Load (push) a local variable onto stack
+    ('store', 10, 1),  # Store (pop) top of stack to local variable
+    ('load_field', 11, 1),  # Load from object field
+    ('store_field', 12, 1),  # Store to object field
+    ('roll', 13, 1),  # [obj arg1 ... argn] -> [arg1 ... argn obj]
+    ('jump', 14, 1),  # Unconditional relative jump
+    ('jump_if', 15, 1),  # Conditional relative jump, if true
+    ('jump_ifnot', 16, 1),  # Conditional relative jump, if false
+    ('is_instance', 17, 1),  # Test membership in class (for typecase)
+    ('load_self_field', 18, 1),  # Load from field of this object
+    ('store_self_field', 19, 1),  # Store to field of this object
+    ('plus_const', 20, 1),  # Integer constant plus top of stack
+    ('sub_const', 21, 1),  # Top of stack minus integer constant
+    ('less_const', 22, 1),  # Is integer constant less than top of stack
+    ('print_const', 23, 1),  # Print string constant
+    ('call_builtin', 24, 1),  # Call a native method of a built-in class directly
+]
+
+FUSIONS = [
+    ('load_self_field', [('load', '$'), ('load_field', '<any>')]),
+    ('store_self_field', [('load', '$'), ('store_field', '<any>')]),
+    ('plus_const', [('const', '<int>'), ('call', 'Int:plus')]),
+    ('sub_const', [('const', '<int>'), ('call', 'Int:sub')]),
+    ('less_const', [('const', '<int>'), ('call', 'Int:less')]),
+    ('print_const', [('const', '<str>'), ('call', 'String:print'), ('pop', None)]),
+]
@@ -0,0 +1,182 @@
+# A method whose frame needs more words than FRAME_WORDS_UNKNOWN
+# (vm_state.h), the size assumed for object code without max_stack:
+# it pushes 1 seventy times, then adds them up, and is called
+# from a recursion a few frames deep.
+.class DeepFrame:Obj
+.method sum forward
+.method nest forward
+.method $constructor
+    enter
+    const 3
+    load $
+    call $:nest
+    call Int:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const nothing
+    return 0
+
+# sum, called from n more frames of nest
+.method nest
+.args n
+    enter
+    load n
+    const 0
+    call Int:less
+    jump_ifnot bottom
+    load n
+    const 1
+    call Int:sub
+    load $
+    call $:nest
+    return 1
+bottom:
+    load $
+    call $:sum
+    return 1
+
+# 1 + 1 + ... + 1, with all 70 on the stack at once
+.method sum
+    enter
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    const 1
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    call Int:plus
+    return 0
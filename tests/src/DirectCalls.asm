@@ -0,0 +1,65 @@
+# Calls named for a superclass (Obj) whose receiver is of a
+# subclass.  With -O, those on an Int or String constant become
+# direct calls to the subclass's native method; those on an
+# object of this class, which overrides string, and on a value
+# that may be either, must stay calls through the vtable.
+.class DirectCalls:Obj
+.method string forward
+.method either forward
+.method $constructor
+    enter
+    const 42
+    call Obj:string
+    call String:print
+    pop
+    const "\n"
+    const 42
+    const 42
+    call Obj:equals
+    call Obj:string
+    call String:print
+    pop
+    call String:print
+    pop
+    const "direct\n"
+    call Obj:string
+    call String:print
+    pop
+    new $
+    call Obj:string
+    call String:print
+    pop
+    load $
+    call Obj:print
+    pop
+    const true
+    load $
+    call $:either
+    pop
+    const false
+    load $
+    call $:either
+    pop
+    const nothing
+    return 0
+
+.method string
+    enter
+    const "overridden\n"
+    return 0
+
+# The receiver is an Int or this object, depending on flag
+.method either
+.args flag
+    enter
+    load $
+    load flag
+    jump_if call
+    pop
+    const 7
+call:  call Obj:string
+    call String:print
+    pop
+    const "\n"
+    call String:print
+    return 1
@@ -0,0 +1,174 @@
+# Jumps to the middle of sequences that --fuse would otherwise
+# replace by one fused operation.  Each method runs the sequence
+# once by jumping into it (flag true) and once by falling through
+# it (flag false), with different values on the stack.
+.class FusionJumps:Obj
+.field x
+.method plus forward
+.method sub forward
+.method less forward
+.method field forward
+.method store forward
+.method printing forward
+.method $constructor
+    enter
+    const true
+    load $
+    call $:plus
+    const false
+    load $
+    call $:plus
+    const true
+    load $
+    call $:sub
+    const false
+    load $
+    call $:sub
+    const true
+    load $
+    call $:less
+    const false
+    load $
+    call $:less
+    const true
+    load $
+    call $:field
+    const false
+    load $
+    call $:field
+    const true
+    load $
+    call $:store
+    const false
+    load $
+    call $:store
+    const true
+    load $
+    call $:printing
+    const false
+    load $
+    call $:printing
+    const nothing
+    return 0
+
+# const <int>; call Int:plus  (105, then 101)
+.method plus
+.args flag
+    enter
+    const 100
+    const 5
+    load flag
+    jump_if into
+    pop
+    const 1
+into:  call Int:plus
+    call Int:print
+    pop
+    const "\n"
+    call String:print
+    return 1
+
+# const <int>; call Int:sub  (95, then 99)
+.method sub
+.args flag
+    enter
+    const 100
+    const 5
+    load flag
+    jump_if into
+    pop
+    const 1
+into:  call Int:sub
+    call Int:print
+    pop
+    const "\n"
+    call String:print
+    return 1
+
+# const <int>; call Int:less  (5 < 1, then 0 < 1)
+.method less
+.args flag
+    enter
+    const 1
+    const 5
+    load flag
+    jump_if into
+    pop
+    const 0
+into:  call Int:less
+    call Obj:print
+    pop
+    const "\n"
+    call String:print
+    return 1
+
+# load $; load_field  (42 from another object, then 7)
+.method field
+.args flag
+.local other
+    enter
+    const 7
+    load $
+    store_field $:x
+    new $
+    store other
+    const 42
+    load other
+    store_field $:x
+    load other
+    load flag
+    jump_if into
+    pop
+    load $
+into:  load_field $:x
+    call Int:print
+    pop
+    const "\n"
+    call String:print
+    return 1
+
+# load $; store_field  (stores to another object, leaving 7,
+# then to this one, 9)
+.method store
+.args flag
+.local other
+    enter
+    const 7
+    load $
+    store_field $:x
+    new $
+    store other
+    const 9
+    load other
+    load flag
+    jump_if into
+    pop
+    load $
+into:  store_field $:x
+    load $
+    load_field $:x
+    call Int:print
+    pop
+    const "\n"
+    call String:print
+    return 1
+
+# const <str>; call String:print; pop  (jumping to the call,
+# then to the pop)
+.method printing
+.args flag
+    enter
+    const "kept\n"
+    const "jumped\n"
+    load flag
+    jump_if call
+    pop
+    const "fell through\n"
+call:  call String:print
+    load flag
+    jump_ifnot pop
+    pop
+    const "dropped"
+pop:  pop
+    call String:print
+    return 1
@@ -0,0 +1,56 @@
+# Jumps to instructions that the peephole pass (-O) would
+# otherwise remove:  a value pushed only to be popped, and a
+# store followed by a load of the same local.  Each window is
+# entered both by falling into it and by jumping into the middle.
+.class PeepholeJumps:Obj
+.method popped forward
+.method $constructor
+.local t,again
+    enter
+    const "jump into const; pop\n"
+    call String:print
+    pop
+    const true
+    load $
+    call $:popped
+    pop
+    const false
+    load $
+    call $:popped
+    pop
+    const "jump into store; load\n"
+    call String:print
+    pop
+    const true
+    store again
+    const "twice\n"
+    store t
+top:
+    load t
+    call String:print
+    pop
+    load again
+    jump_ifnot done
+    const false
+    store again
+    jump top
+done:
+    const nothing
+    return 0
+
+# Prints "kept\n" whether flag is true (jumping to the pop,
+# which discards "dropped") or false (falling through const
+# "pushed"; pop)
+.method popped
+.args flag
+    enter
+    const "kept\n"
+    const "dropped\n"
+    load flag
+    jump_if into
+    pop
+    const "pushed\n"
+into:
+    pop
+    call String:print
+    return 1
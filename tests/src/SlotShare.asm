@@ -0,0 +1,108 @@
+# Locals whose values are needed at the same time only across a
+# branch or a loop's back edge, which -O must not put in one slot,
+# and locals it can.
+.class SlotShare:Obj
+.method loop forward
+.method branch forward
+.method $constructor
+    enter
+    load $
+    call $:loop
+    pop
+    const false
+    load $
+    call $:branch
+    pop
+    const true
+    load $
+    call $:branch
+    pop
+    const nothing
+    return 0
+
+# x is printed at the top of the loop and stored at the bottom,
+# so it is live around the back edge while y is stored and read
+.method loop
+.local x,y,i,a,b
+    enter
+    const "a\n"
+    store a
+    load a
+    call String:print
+    load a
+    call String:print
+    pop
+    pop
+    const "b\n"
+    store b
+    load b
+    call String:print
+    load b
+    call String:print
+    pop
+    pop
+    const "x0\n"
+    store x
+    const 2
+    store i
+top:
+    load i
+    const 0
+    call Int:less
+    jump_ifnot done
+    load x
+    call String:print
+    pop
+    const "y\n"
+    store y
+    load y
+    call String:print
+    load y
+    call String:print
+    pop
+    pop
+    const "x1\n"
+    store x
+    load i
+    const 1
+    call Int:sub
+    store i
+    jump top
+done:
+    const nothing
+    return 0
+
+# a is live through the branch that stores and reads b; t is
+# stored on one branch only, and is nothing on the other
+.method branch
+.args flag
+.local a,b,t
+    enter
+    const "a\n"
+    store a
+    load flag
+    jump_if other
+    const "b\n"
+    store b
+    load b
+    call String:print
+    load b
+    call String:print
+    pop
+    pop
+    jump join
+other:
+    const "t\n"
+    store t
+join:
+    load a
+    call String:print
+    pop
+    load t
+    call Obj:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const nothing
+    return 1
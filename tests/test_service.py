@@ -0,0 +1,97 @@
+"""The assembler service (assemble.py --serve) must survive requests
+it cannot make sense of, and go on serving the next.
+
+    python3 -m unittest tests/test_service.py
+"""
+import json
+import pathlib
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+BUILTINS = ["Bool.json", "Int.json", "Nothing.json", "Obj.json", "String.json"]
+
+sys.path.insert(0, str(ROOT))
+import asmclient
+
+
+class ServiceTest(unittest.TestCase):
+    def setUp(self):
+        self.scratch = pathlib.Path(tempfile.mkdtemp(prefix="service_"))
+        self.scratch.joinpath("OBJ").mkdir()
+        for objfile in BUILTINS:
+            shutil.copyfile(ROOT.joinpath("OBJ", objfile),
+                            self.scratch.joinpath("OBJ", objfile))
+        shutil.copyfile(ROOT.joinpath("asm.conf"),
+                        self.scratch.joinpath("asm.conf"))
+        self.socket_path = str(self.scratch.joinpath("asm.sock"))
+        self.service = subprocess.Popen(
+            [sys.executable, str(ROOT.joinpath("assemble.py")), "--serve",
+             "--socket", self.socket_path],
+            cwd=self.scratch, stderr=subprocess.DEVNULL)
+        for _ in range(100):
+            try:
+                asmclient.request({"command": "ping"}, self.socket_path)
+                break
+            except asmclient.ServiceUnavailable:
+                time.sleep(0.05)
+        else:
+            self.fail("Assembler service did not start")
+
+    def tearDown(self):
+        try:
+            asmclient.request({"command": "shutdown"}, self.socket_path)
+        except asmclient.ServiceUnavailable:
+            pass
+        try:
+            self.service.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.service.kill()
+            self.service.wait()
+        shutil.rmtree(self.scratch)
+
+    def send(self, *lines: bytes) -> list:
+        """Send raw request lines on one connection, and return
+        the responses
+        """
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.socket_path)
+            with sock.makefile("rwb") as stream:
+                responses = []
+                for line in lines:
+                    stream.write(line)
+                    stream.flush()
+                    responses.append(json.loads(stream.readline()))
+                return responses
+
+    def assemble_counter(self) -> dict:
+        source = ROOT.joinpath("tests", "src", "Counter.asm")
+        return asmclient.assemble(str(source),
+                                  str(self.scratch.joinpath("Counter.json")),
+                                  socket_path=self.socket_path)
+
+    def test_garbage_then_valid(self):
+        for garbage in [b"not json\n", b"[1, 2]\n", b"\xff\xfe\n",
+                        b'{"source": 3, "target": 4}\n', b'{"source": "x"}\n']:
+            response, = self.send(garbage)
+            self.assertFalse(response["ok"], garbage)
+            self.assertIn("error", response)
+        response = self.assemble_counter()
+        self.assertTrue(response["ok"])
+        self.assertTrue(self.scratch.joinpath("Counter.json").exists())
+
+    def test_garbage_on_same_connection(self):
+        """Later requests on the connection are still answered"""
+        garbage, ping = self.send(b"not json\n", b'{"command": "ping"}\n')
+        self.assertFalse(garbage["ok"])
+        self.assertTrue(ping["ok"])
+        self.assertTrue(self.assemble_counter()["ok"])
+
+
+if __name__ == "__main__":
+    unittest.main()
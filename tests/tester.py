@@ -1,13 +1,45 @@
 """Simple test script for Ori (tiny vm) asm files.
 (Extend later to work with Quack compilation)
 
+Test cases (listed in src/TESTS.csv) run in parallel, each in
+its own scratch directory with its own OBJ.  A class is assembled
+only after the classes it refers to (e.g., Counter before
+TestCounter), and their object files are copied into its scratch
+directory.  Object files and output are collected in OBJ and out
+as before.
+
+A row of TESTS.csv may give options (the third column).  For
+"assemble" and "run" they are passed to the assembler (e.g., -O or
+--fuse); the program must produce the same expected output as
+without them.  Its object file and output are named for the options
+(e.g., OBJ/Looper_O_fuse.json), so they do not replace the plain
+ones, which other classes are assembled against.  Action "link"
+links the class (assembled as in its plain row) and the classes it
+needs into a load image, passing the options to link.py (e.g.,
+--prune), and runs the image; it too must produce the expected
+output.
+
+Results are cached (in .tester_cache) by a hash of everything a
+case depends on:  its source and expected output, the object files
+it imports, the assembler, opdefs.txt, asm.conf, and the VM.  A case
+whose inputs have not changed is not assembled or run again.
+
 FIXME: There must be better ways to handle file dependencies
 """
-import subprocess
+import argparse
+import concurrent.futures
+import csv
+import filecmp
+import hashlib
+import json
+import os
 import pathlib
 import shutil
-import filecmp
-import csv
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Set
 
 import logging
 import sys
@@ -19,94 +51,357 @@ log.setLevel(logging.INFO)
 # The following might differ from system to system,
 # and should be configurable
 PY = "python3"
-ROOT = ".."
+ROOT = pathlib.Path("..").resolve()
 ASM = f"{ROOT}/assemble.py"
+LINK = f"{ROOT}/link.py"
 VM = f"{ROOT}/bin/tiny_vm"
 BUILTINS = ["Bool.json", "Int.json", "Nothing.json", "Obj.json", "String.json"]
-ASMREQS = ["asm.conf", "opdefs.txt"]
+ASMREQS = ["asm.conf"]
+# Besides sources, object files, and expected output, results depend on
+ASSEMBLER = ["assemble.py", "asmclient.py", "objfile.py", "opcodes.py",
+             "opdefs.txt", "link.py"]
+CACHE = pathlib.Path(".tester_cache")
+
+sys.path.insert(0, str(ROOT))
+from assemble import BatchItem  # Classes a source file refers to
+
+
+def cli() -> object:
+    parser = argparse.ArgumentParser(
+        description="Assemble and run the test cases in src/TESTS.csv")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="Test cases to run at once")
+    parser.add_argument("--timeout", type=float, default=10.0,
+                        help="Seconds allowed for each assembly or VM run")
+    parser.add_argument("--no-cache", dest="cache", action="store_false",
+                        help="Run every case, even if its inputs are "
+                             "unchanged")
+    return parser.parse_args()
+
 
 def install_prereqs():
     """Copy pre-requisite files.
     It would be cleaner to do this in Cmake, probably.
     """
     for objfile in BUILTINS:
-        origin = pathlib.Path("../OBJ/" + objfile)
+        origin = ROOT.joinpath("OBJ", objfile)
         copied = pathlib.Path("./OBJ/" + objfile)
         log.debug(f"Copying {origin} to {copied}")
         shutil.copyfile(origin, copied)
     for asmreq in ASMREQS:
-        origin = pathlib.Path("../" + asmreq)
+        origin = ROOT.joinpath(asmreq)
         copied = pathlib.Path("./" + asmreq)
         log.debug(f"Copying {origin} to {copied}")
         shutil.copyfile(origin, copied)
 
-def assemble(class_name: str) -> bool:
-    """Translate src/Class.asm to OBJ/Class.json.
+
+class TestCase:
+    """One line of TESTS.csv, and how it turned out"""
+    def __init__(self, class_name: str, action: str, options: str = ""):
+        self.class_name = class_name
+        self.action = action
+        self.options = options.split()
+        # E.g., Looper_O_fuse for "Looper,run,-O --fuse",
+        # Pair_link_prune for "Pair,link,--prune"
+        self.label = class_name + "".join(
+            "_" + word.lstrip("-")
+            for word in ([action] if action == "link" else []) + self.options)
+        self.source = pathlib.Path("src/" + class_name + ".asm").resolve()
+        self.depends: Set[str] = set()
+        if self.source.exists():
+            self.depends = BatchItem(self.source).depends
+        if action == "link":
+            # Linked from the object file of its plain row
+            self.depends.add(class_name)
+        self.assembled = False
+        self.ok = False
+        self.problem = ""
+        self.timed_out = False  # May pass another time, so not cached
+        self.cached = False
+        self.elapsed = 0.0
+
+    def plain(self) -> bool:
+        """Other classes are assembled against this one's object file"""
+        return self.action != "link" and not self.options
+
+    def obj(self) -> pathlib.Path:
+        return pathlib.Path("OBJ/" + self.label + ".json")
+
+    def stdout(self) -> pathlib.Path:
+        return pathlib.Path("out/" + self.label + "_stdout.txt")
+
+    def expect(self) -> pathlib.Path:
+        return pathlib.Path("expect/" + self.class_name + "_stdout.txt")
+
+
+# ----------------
+#  Result cache:  one file per key, holding the verdict,
+#  object file, and output of the case
+#
+FILE_HASHES: Dict[pathlib.Path, str] = {}  # Of files that don't change
+
+
+def file_hash(path: pathlib.Path) -> str:
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return "missing"
+
+
+def case_key(case: TestCase, needs: List[str]) -> str:
+    """Hash of everything the outcome of case depends on"""
+    if not FILE_HASHES:
+        for name in ASSEMBLER + ASMREQS + ["bin/tiny_vm"]:
+            FILE_HASHES[ROOT.joinpath(name)] = file_hash(ROOT.joinpath(name))
+    digest = hashlib.sha256(
+        " ".join([case.action] + case.options).encode("utf-8"))
+    inputs = [case.source, case.expect()] + \
+             [pathlib.Path("OBJ/" + name) for name in BUILTINS] + \
+             [pathlib.Path("OBJ/" + name + ".json") for name in needs]
+    for path in inputs:
+        digest.update(f"{path} {file_hash(path)}\n".encode("utf-8"))
+    for path, hash in FILE_HASHES.items():
+        digest.update(f"{path} {hash}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def cached_result(case: TestCase, key: str) -> bool:
+    """Restore the results of case from the cache, if they are there"""
+    try:
+        with open(CACHE.joinpath(key + ".json"), "r") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return False
+    case.assembled, case.ok, case.problem = \
+        entry["assembled"], entry["ok"], entry["problem"]
+    if entry["object"] is not None:
+        case.obj().write_text(entry["object"])
+    if entry["stdout"] is not None:
+        case.stdout().write_text(entry["stdout"])
+    case.cached = True
+    return True
+
+
+def cache_result(case: TestCase, key: str):
+    def read(path: pathlib.Path) -> Optional[str]:
+        return path.read_text() if path.exists() else None
+
+    entry = {"assembled": case.assembled, "ok": case.ok,
+             "problem": case.problem,
+             "object": read(case.obj())
+                       if case.assembled and case.action != "link" else None,
+             "stdout": read(case.stdout()) if case.action == "run" else None}
+    CACHE.mkdir(exist_ok=True)
+    temp = CACHE.joinpath(f"{key}.{threading.get_ident()}")
+    with open(temp, "w") as f:
+        json.dump(entry, f)
+    os.replace(temp, CACHE.joinpath(key + ".json"))
+
+
+def assemble(case: TestCase, scratch: pathlib.Path, timeout: float) -> bool:
+    """Translate src/Class.asm to OBJ/Class.json in the scratch
+    directory, then keep a copy in OBJ (see TestCase.obj).
     Separated because some classes (e.g., Counter) cannot
     be run as main programs.  (Main program class constructors
     cannot have arguments.)
     """
-    src = pathlib.Path("./src/" + class_name + ".asm")
-    obj = pathlib.Path("./OBJ/" + class_name + ".json")
+    obj = pathlib.Path("OBJ/" + case.class_name + ".json")
+    asm_log = pathlib.Path("out/" + case.label + "_asm_stderr.txt")
     try:
-        proc = subprocess.run([PY, ASM, src, obj], text=True)
+        with open(asm_log, "w") as std_err:
+            proc = subprocess.run([PY, ASM, *case.options, case.source, obj],
+                                  text=True, cwd=scratch, stderr=std_err,
+                                  timeout=timeout)
         proc.check_returncode() # May throw CalledProcessError
     except subprocess.CalledProcessError:
-        log.warning(f"Assembler crashed on {src}")
+        case.problem = f"Assembler crashed (see {asm_log})"
+        return False
+    except subprocess.TimeoutExpired:
+        case.problem = f"Assembler timed out after {timeout} seconds"
+        case.timed_out = True
         return False
+    shutil.copyfile(scratch.joinpath(obj), case.obj())
     return True
 
 
-def test_class(class_name: str) -> bool:
-    """Assemble, run, and check a single test case
-    for a class C, in src/C.asm, with expected output
-    in expect/C_stdout.txt.  Returns True iff test case
-    has expected outcome.
+def link(case: TestCase, scratch: pathlib.Path, timeout: float) -> bool:
+    """Link the class and the classes it needs, in OBJ in the
+    scratch directory, into a load image there
     """
-    ok = True
-    observed_stdout = pathlib.Path("out/" + class_name + "_stdout.txt")
-    observed_stderr = pathlib.Path("out/" + class_name + "_stderr.txt")
-    expect_stdout = pathlib.Path("expect/" + class_name + "_stdout.txt")
-    if not assemble(class_name):
+    link_log = pathlib.Path("out/" + case.label + "_linker_stderr.txt")
+    try:
+        with open(link_log, "w") as std_err:
+            proc = subprocess.run([PY, LINK, *case.options, "-L", "OBJ",
+                                   "-o", case.class_name + ".tvmi",
+                                   case.class_name],
+                                  text=True, cwd=scratch, stderr=std_err,
+                                  timeout=timeout)
+        proc.check_returncode() # May throw CalledProcessError
+    except subprocess.CalledProcessError:
+        case.problem = f"Linker crashed (see {link_log})"
+        return False
+    except subprocess.TimeoutExpired:
+        case.problem = f"Linker timed out after {timeout} seconds"
+        case.timed_out = True
         return False
+    return True
+
+
+def execute(case: TestCase, scratch: pathlib.Path, timeout: float) -> bool:
+    """Run the class as a main program in the scratch directory,
+    and compare its output with expect/Class_stdout.txt
+    """
+    observed_stdout = case.stdout()
+    observed_stderr = pathlib.Path("out/" + case.label + "_stderr.txt")
+    expect_stdout = case.expect()
+    if case.action == "link":
+        command = [VM, "-I", case.class_name + ".tvmi"]
+    else:
+        command = [VM, case.class_name]
     try:
-        std_out = open(observed_stdout, "w")
-        std_err = open(observed_stderr, "w")
-        proc = subprocess.run([VM, class_name], text=True,
-                              stdout=std_out, stderr=std_err)
+        with open(observed_stdout, "w") as std_out, \
+                open(observed_stderr, "w") as std_err:
+            proc = subprocess.run(command, text=True,
+                                  cwd=scratch, stdout=std_out, stderr=std_err,
+                                  timeout=timeout)
         proc.check_returncode() # May throw CalledProcessError
-        if filecmp.cmp(observed_stdout, expect_stdout):
-            log.info(f"OK: {class_name} produced expected output")
-        else:
-            log.info(f"{class_name} output did not match expectation")
-            ok = False
     except subprocess.CalledProcessError:
-        log.warning(f"Crashed: {proc.args}")
-        ok = False
-    return ok
+        case.problem = f"Crashed: {proc.args}"
+        return False
+    except subprocess.TimeoutExpired:
+        case.problem = f"Timed out after {timeout} seconds"
+        case.timed_out = True
+        return False
+    if not expect_stdout.exists():
+        case.problem = f"No expected output {expect_stdout}"
+        return False
+    if not filecmp.cmp(observed_stdout, expect_stdout, shallow=False):
+        case.problem = "Output did not match expectation"
+        return False
+    log.info(f"OK: {case.label} produced expected output")
+    return True
+
+
+def test_case(case: TestCase, needs: List[str], timeout: float,
+              cache: bool) -> TestCase:
+    """Assemble and (if the action is "run") run a single test
+    case for a class C, in src/C.asm, with expected output in
+    expect/C_stdout.txt.  Classes it needs must already be in OBJ.
+    """
+    started = time.perf_counter()
+    key = case_key(case, needs)
+    if cache and cached_result(case, key):
+        case.elapsed = time.perf_counter() - started
+        return case
+    with tempfile.TemporaryDirectory(prefix=case.label + "_") as scratch:
+        scratch = pathlib.Path(scratch)
+        scratch.joinpath("OBJ").mkdir()
+        for objfile in BUILTINS + [name + ".json" for name in needs]:
+            shutil.copyfile("OBJ/" + objfile, scratch.joinpath("OBJ", objfile))
+        for asmreq in ASMREQS:
+            shutil.copyfile(asmreq, scratch.joinpath(asmreq))
+        if case.action == "link":
+            case.assembled = link(case, scratch, timeout)
+        else:
+            case.assembled = assemble(case, scratch, timeout)
+        if case.assembled and case.action in ["run", "link"]:
+            case.ok = execute(case, scratch, timeout)
+        else:
+            case.ok = case.assembled
+    if not case.timed_out:
+        cache_result(case, key)
+    case.elapsed = time.perf_counter() - started
+    return case
+
+
+def read_cases() -> List[TestCase]:
+    cases = []
+    with open("src/TESTS.csv") as f:
+        for row in csv.DictReader(f):
+            if row["Action"] not in ["assemble", "run", "link"]:
+                log.error(f"Unrecognized action '{row['Action']}' "
+                          f"for class {row['Class']}")
+                continue
+            cases.append(TestCase(row["Class"], row["Action"],
+                                  row.get("Options") or ""))
+    return cases
+
+
+def run_cases(cases: List[TestCase], jobs: int, timeout: float,
+              cache: bool):
+    """Run each case after the cases for classes it refers to
+    have been assembled, up to jobs at a time
+    """
+    in_suite = {case.class_name for case in cases if case.plain()}
+    # Every class each case needs, directly or indirectly
+    needs: Dict[str, Set[str]] = {}
+    assembled: Set[str] = set()
+    failed: Set[str] = set()
+    waiting = list(cases)
+    running = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        while waiting or running:
+            for case in list(waiting):
+                depends = case.depends & in_suite
+                if depends & failed:
+                    case.problem = (f"Not assembled: needs "
+                                    f"{', '.join(sorted(depends & failed))}")
+                    if case.plain():
+                        failed.add(case.class_name)
+                    waiting.remove(case)
+                elif depends <= assembled:
+                    case_needs = set(depends)
+                    for name in depends:
+                        case_needs |= needs[name]
+                    if case.plain():
+                        needs[case.class_name] = case_needs
+                    running[pool.submit(test_case, case, sorted(case_needs),
+                                        timeout, cache)] = case
+                    waiting.remove(case)
+            if not running:
+                # Everything left waits on something that will never finish
+                for case in waiting:
+                    case.problem = "Circular dependence"
+                    failed.add(case.class_name)
+                break
+            finished, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                case = running.pop(future)
+                future.result()  # Re-raises anything unexpected
+                if not case.plain():
+                    continue
+                if case.assembled:
+                    assembled.add(case.class_name)
+                else:
+                    failed.add(case.class_name)
 
 
 def main():
-    """Stub"""
+    """Run all the test cases and summarize"""
+    args = cli()
     install_prereqs()
-    with open("src/TESTS.csv") as cases:
-        case_reader = csv.DictReader(cases)
-        for case in case_reader:
-            class_name = case["Class"]
-            action = case["Action"]
-            if action == "assemble":
-                # Assemble but do not execute
-                log.info(f"Class '{class_name} -- assemble only")
-                ok = assemble(class_name)
-            elif action == "run":
-                log.info(f"Class '{class_name} -- assemble and run")
-                ok = test_class(class_name)
-            else:
-                log.error(f"Unrecognized action '{action}' for class {class_name}")
-            if not ok:
-                print(f"*** Failed test case: {action} {class_name}", file=sys.stderr)
-    # FIXME: Add a check for omitted source files
-    print("Testing complete")
+    cases = read_cases()
+    started = time.perf_counter()
+    run_cases(cases, args.jobs, args.timeout, args.cache)
+    elapsed = time.perf_counter() - started
+    for case in cases:
+        if not case.ok:
+            print(f"*** Failed test case: {case.action} {case.label}: "
+                  f"{case.problem}", file=sys.stderr)
+    n_passed = sum(case.ok for case in cases)
+    case_time = sum(case.elapsed for case in cases)
+    print(f"Testing complete: {n_passed} of {len(cases)} cases passed "
+          f"in {elapsed:.2f} seconds on {args.jobs} workers "
+          f"({case_time:.2f} seconds of test cases)")
+    n_cached = sum(case.cached for case in cases)
+    print(f"Result cache: {n_cached} hits, "
+          f"{len(cases) - n_cached} cases assembled or run")
+    slowest = sorted(cases, key=lambda case: case.elapsed, reverse=True)
+    for case in slowest[:5]:
+        print(f"    {case.elapsed:6.2f}s  {case.action} {case.label}")
+    sys.exit(0 if n_passed == len(cases) else 1)
 
 
 if __name__ == "__main__":
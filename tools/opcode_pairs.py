@@ -0,0 +1,157 @@
+"""
+Count sequences of two and three operations in object code,
+to find candidates for fused operations (superinstructions).
+
+Reads object files in either format.  A sequence is counted only
+if no jump lands inside it, since only then could the assembler
+fuse it.  A call whose receiver is a constant just pushed is
+shown with the method it must call, e.g. "call Int:plus", and
+a load of the receiver of the method is shown as "load $".
+
+    python3 tools/opcode_pairs.py OBJ tests/OBJ
+"""
+
+import argparse
+import collections
+import logging
+import sys
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import objfile
+import opcodes
+
+logging.basicConfig()
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+OPS = {code: (name, ops) for name, code, ops in opcodes.OPDEFS}
+JUMPS = ["jump", "jump_if", "jump_ifnot"]
+# Classes of constants, by constant pool kind
+CONST_CLASSES = {"i": "Int", "s": "String"}
+NAMED_CONST_CLASSES = {-1: "Nothing", -2: "Bool", -3: "Bool"}
+
+
+def cli() -> object:
+    """Command line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Count operation pairs and triples in object code")
+    parser.add_argument("paths", nargs="+", type=Path,
+                        help="Object files, or directories of them")
+    parser.add_argument("-n", "--top", type=int, default=15,
+                        help="How many of each to list (default 15)")
+    parser.add_argument("-L", "--library", type=Path, default=Path("OBJ"),
+                        help="Where to find built-in classes "
+                             "for method names (default OBJ)")
+    return parser.parse_args()
+
+
+def object_files(paths: List[Path]) -> Iterator[Path]:
+    for path in paths:
+        if path.is_dir():
+            for suffix in objfile.SUFFIXES:
+                yield from sorted(path.glob(f"*{suffix}"))
+        else:
+            yield path
+
+
+Decoded = Tuple[int, str, Optional[int]]  # Address, name, operand
+
+
+def decode(code: List[int]) -> Tuple[List[Decoded], List[bool]]:
+    """Instructions (address, name, operand) of a method, and
+    for each whether some jump lands on it
+    """
+    instrs = []
+    addresses: Dict[int, int] = {}  # Address -> instruction number
+    targets = set()
+    pos = 0
+    while pos < len(code):
+        name, ops = OPS[code[pos]]
+        addresses[pos] = len(instrs)
+        operand = code[pos + 1] if ops else None
+        instrs.append((pos, name, operand))
+        pos += 1 + ops
+        if name in JUMPS:
+            targets.add(pos + operand)
+    landed = [False] * len(instrs)
+    for target in targets:
+        if target in addresses:
+            landed[addresses[target]] = True
+    return instrs, landed
+
+
+class Counter:
+    """Sequences of operations in the methods counted so far"""
+    def __init__(self, library: Path):
+        self.library = library
+        self.methods: Dict[str, List[str]] = {}  # Of built-in classes
+        self.singles = collections.Counter()
+        self.pairs = collections.Counter()
+        self.triples = collections.Counter()
+
+    def method_name(self, class_name: str, slot: int) -> str:
+        if class_name not in self.methods:
+            for suffix in objfile.SUFFIXES:
+                path = self.library.joinpath(class_name + suffix)
+                if path.exists():
+                    self.methods[class_name] = \
+                        objfile.read_object(path)["methods"]
+                    break
+            else:
+                self.methods[class_name] = []
+        methods = self.methods[class_name]
+        return methods[slot] if slot < len(methods) else f"#{slot}"
+
+    def count_object(self, obj: dict):
+        constants = obj.get("constants", [])
+        for method in obj.get("code", []):  # Built-ins have none
+            instrs, landed = decode(method["code"])
+            names = []
+            receiver = None  # Class of a constant just pushed
+            for _, name, operand in instrs:
+                if name == "call" and receiver:
+                    name = f"call {receiver}:" \
+                           f"{self.method_name(receiver, operand)}"
+                receiver = None
+                if name == "load" and operand == 0:
+                    name = "load $"
+                elif name == "const":
+                    receiver = NAMED_CONST_CLASSES.get(operand) \
+                        or CONST_CLASSES[constants[operand]["kind"]]
+                names.append(name)
+            self.singles.update(names)
+            for i in range(len(names)):
+                if i + 1 < len(names) and not landed[i + 1]:
+                    self.pairs[tuple(names[i:i + 2])] += 1
+                    if i + 2 < len(names) and not landed[i + 2]:
+                        self.triples[tuple(names[i:i + 3])] += 1
+
+    def report(self, top: int):
+        total = sum(self.singles.values())
+        print(f"{total} instructions")
+        for title, counts in [("Pairs", self.pairs),
+                              ("Triples", self.triples)]:
+            print(f"\n{title}:")
+            for sequence, count in counts.most_common(top):
+                print(f"{count:>8} {100 * count / total:>6.1f}%  "
+                      + "; ".join(sequence))
+
+
+def main():
+    args = cli()
+    counter = Counter(args.library)
+    n_files = 0
+    for path in object_files(args.paths):
+        try:
+            counter.count_object(objfile.read_object(path))
+            n_files += 1
+        except (OSError, ValueError, KeyError) as e:
+            log.warning(f"Skipping {path}: {e}")
+    log.info(f"Counted {n_files} object files")
+    counter.report(args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+Profile of the operations in object code, and of a VM run.
+
+Statically, counts operations, pairs of operations, and call
+targets in each method and class of the object files given.
+With --profile, also counts how many times each of those was
+executed in a run of the VM with -P, e.g.
+
+    bin/tiny_vm -P profile.json Looper
+    python3 tools/opcode_profile.py OBJ --profile profile.json
+
+and reports hot spots:  the methods and instructions executed
+most, and operations, pairs and calls by executions.  --detail
+adds the counts for each class and method; --json writes all of
+it as JSON instead.
+
+A call target is named Class:method where the receiver is known
+from the instruction just before the call (a constant, $, or a
+new object), and *:method (by slot) otherwise.
+"""
+
+import argparse
+import collections
+import json
+import logging
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# opcode_pairs puts the repository on sys.path
+from opcode_pairs import Decoded, NAMED_CONST_CLASSES, CONST_CLASSES, \
+    decode, object_files
+import objfile
+
+logging.basicConfig()
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+NO_FALL_THROUGH = ["jump", "return", "halt"]
+HISTOGRAMS = ["operations", "pairs", "calls"]
+
+
+def cli() -> object:
+    """Command line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Static and dynamic profile of operations")
+    parser.add_argument("paths", nargs="+", type=Path,
+                        help="Object files, or directories of them")
+    parser.add_argument("--profile", type=Path, default=None,
+                        help="Execution counts from tiny_vm -P")
+    parser.add_argument("-n", "--top", type=int, default=10,
+                        help="How many of each to list (default 10)")
+    parser.add_argument("--detail", action="store_true",
+                        help="Also report each class and method")
+    parser.add_argument("--json", action="store_true",
+                        help="Write the profile as JSON")
+    parser.add_argument("-L", "--library", type=Path, default=Path("OBJ"),
+                        help="Where to find classes for method names "
+                             "(default OBJ)")
+    return parser.parse_args()
+
+
+class MethodProfile:
+    """Instructions of one method, with their call targets
+    and (after merge) how many times each was executed
+    """
+    def __init__(self, class_name: str, name: str,
+                 instrs: List[Decoded], landed: List[bool],
+                 targets: Dict[int, str], size: int):
+        self.class_name = class_name
+        self.name = name
+        self.instrs = instrs
+        self.landed = landed
+        self.targets = targets  # Instruction number -> call target
+        self.size = size  # Words
+        self.counts: Optional[List[int]] = None
+
+    def merge(self, word_counts: List[int]):
+        """Executions of each instruction, from counts by word"""
+        if len(word_counts) != self.size:
+            log.warning(f"{self.class_name}:{self.name} has {self.size} "
+                        f"words but {len(word_counts)} in the profile; "
+                        f"was it assembled again since?")
+            return
+        self.counts = [word_counts[address] for address, _, _ in self.instrs]
+
+    def executed(self) -> int:
+        return sum(self.counts) if self.counts else 0
+
+    def histograms(self, dynamic: bool) -> Dict[str, collections.Counter]:
+        """Operations, pairs and call targets, each counted once
+        (static) or by executions (dynamic)
+        """
+        if dynamic:
+            weights = self.counts or [0] * len(self.instrs)
+        else:
+            weights = [1] * len(self.instrs)
+        counts = {name: collections.Counter() for name in HISTOGRAMS}
+        for i, (_, name, _) in enumerate(self.instrs):
+            counts["operations"][name] += weights[i]
+            if i in self.targets:
+                counts["calls"][self.targets[i]] += weights[i]
+            # A pair is executed as often as its second instruction,
+            # provided that is reached only from the first
+            if i + 1 < len(self.instrs) and not self.landed[i + 1] \
+                    and name not in NO_FALL_THROUGH:
+                second = self.instrs[i + 1][1]
+                counts["pairs"][f"{name}; {second}"] += weights[i + 1]
+        return counts
+
+
+class Program:
+    """Profiles of all the methods in a set of object files"""
+    def __init__(self, library: Path):
+        self.library = library
+        self.method_lists: Dict[str, List[str]] = {}
+        self.methods: List[MethodProfile] = []
+        self.builtin: Dict[str, int] = {}  # Executed outside our code
+        self.profiled = False
+
+    def method_list(self, class_name: str) -> List[str]:
+        if class_name not in self.method_lists:
+            self.method_lists[class_name] = []
+            for suffix in objfile.SUFFIXES:
+                path = self.library.joinpath(class_name + suffix)
+                if path.exists():
+                    self.method_lists[class_name] = \
+                        objfile.read_object(path)["methods"]
+                    break
+        return self.method_lists[class_name]
+
+    def target(self, class_name: Optional[str], slot: int) -> str:
+        """Name of the method in slot of class, or if the class
+        is not known, of the methods every class has (from Obj)
+        """
+        methods = self.method_list(class_name or "Obj")
+        method = methods[slot] if slot < len(methods) else f"#{slot}"
+        return f"{class_name or '*'}:{method}"
+
+    def add_object(self, obj: dict):
+        class_name = obj["class_name"]
+        self.method_lists[class_name] = obj["methods"]
+        imports = obj.get("imports", [])
+        constants = obj.get("constants", [])
+        for method in obj.get("code", []):
+            instrs, landed = decode(method["code"])
+            targets = {}
+            receiver = None  # Class of the value just pushed, if known
+            for i, (_, name, operand) in enumerate(instrs):
+                if name == "call":
+                    targets[i] = (receiver, operand)
+                receiver = None
+                if name == "const":
+                    receiver = NAMED_CONST_CLASSES.get(operand) \
+                        or CONST_CLASSES[constants[operand]["kind"]]
+                elif name == "load" and operand == 0:
+                    receiver = class_name
+                elif name == "new":
+                    receiver = imports[operand]
+            self.methods.append(MethodProfile(
+                class_name, method["name"], instrs, landed, targets,
+                len(method["code"])))
+
+    def resolve_targets(self):
+        """Name call targets, once all method lists are known"""
+        for method in self.methods:
+            for i, (receiver, slot) in method.targets.items():
+                method.targets[i] = self.target(receiver, slot)
+
+    def merge(self, profile: dict):
+        by_name = {(method.class_name, method.name): method
+                   for method in self.methods}
+        for entry in profile["methods"]:
+            method = by_name.get((entry["class"], entry["method"]))
+            if method:
+                method.merge(entry["counts"])
+            else:
+                log.warning(f"No object code for {entry['class']}:"
+                            f"{entry['method']} in the profile")
+        self.builtin = profile.get("builtin", {})
+        self.profiled = True
+
+    def summary(self, methods: List[MethodProfile]) -> dict:
+        """Sizes and histograms of some methods, combined"""
+        result = {"instructions": sum(len(m.instrs) for m in methods),
+                  "words": sum(m.size for m in methods)}
+        kinds = ["static", "dynamic"] if self.profiled else ["static"]
+        for kind in kinds:
+            totals = {name: collections.Counter() for name in HISTOGRAMS}
+            for method in methods:
+                for name, counts in method.histograms(
+                        kind == "dynamic").items():
+                    totals[name].update(counts)
+            result[kind] = {name: dict(counts.most_common())
+                            for name, counts in totals.items()}
+        if self.profiled:
+            result["executed"] = sum(m.executed() for m in methods)
+        return result
+
+    def hot_instructions(self, top: int) -> List[dict]:
+        hot = []
+        for method in self.methods:
+            for (address, name, operand), count in zip(
+                    method.instrs, method.counts or []):
+                hot.append({"class": method.class_name,
+                            "method": method.name, "address": address,
+                            "instruction": name, "operand": operand,
+                            "executed": count})
+        hot.sort(key=lambda entry: entry["executed"], reverse=True)
+        return hot[:top]
+
+    def report(self, top: int) -> dict:
+        classes = collections.defaultdict(list)
+        for method in self.methods:
+            classes[method.class_name].append(method)
+        report = {"program": self.summary(self.methods),
+                  "classes": {}}
+        for class_name, methods in classes.items():
+            summary = self.summary(methods)
+            summary["methods"] = {m.name: self.summary([m])
+                                  for m in methods}
+            report["classes"][class_name] = summary
+        if self.profiled:
+            report["program"]["builtin"] = self.builtin
+            report["hot"] = self.hot_instructions(top)
+        return report
+
+
+def print_histograms(summary: dict, top: int, indent: str = ""):
+    static = summary["static"]
+    dynamic = summary.get("dynamic")
+    for name in HISTOGRAMS:
+        # Ordered by executions if we have them
+        order = dynamic[name] if dynamic else static[name]
+        if not order:
+            continue
+        total_static = sum(static[name].values()) or 1
+        print(f"{indent}{name.capitalize()}:")
+        for key in list(order)[:top]:
+            line = f"{indent}  {static[name].get(key, 0):>8} " \
+                   f"{100 * static[name].get(key, 0) / total_static:>5.1f}%"
+            if dynamic:
+                total_dynamic = sum(dynamic[name].values()) or 1
+                line += f" {dynamic[name][key]:>12} " \
+                        f"{100 * dynamic[name][key] / total_dynamic:>5.1f}%"
+            print(f"{line}  {key}")
+
+
+def print_report(report: dict, top: int, detail: bool):
+    program = report["program"]
+    print(f"{program['instructions']} instructions "
+          f"({program['words']} words) in {len(report['classes'])} classes")
+    if "executed" in program:
+        builtin = sum(program["builtin"].values())
+        total = program["executed"] + builtin
+        print(f"{total} executed, {program['executed']} in these classes "
+              f"and {builtin} in built-in methods")
+        print("\nHot methods:")
+        methods = [(summary["executed"], f"{class_name}:{name}",
+                    summary["instructions"])
+                   for class_name, cls in report["classes"].items()
+                   for name, summary in cls["methods"].items()]
+        methods.sort(reverse=True)
+        for executed, name, size in methods[:top]:
+            print(f"  {executed:>12} {100 * executed / (total or 1):>5.1f}%  "
+                  f"{name} ({size} instructions)")
+        print("\nHot instructions:")
+        for entry in report["hot"]:
+            operand = "" if entry["operand"] is None else entry["operand"]
+            print(f"  {entry['executed']:>12}  {entry['class']}:"
+                  f"{entry['method']} [{entry['address']}] "
+                  f"{entry['instruction']} {operand}")
+        print("\nColumns:  static count, %, executed, %")
+    print()
+    print_histograms(program, top)
+    if not detail:
+        return
+    for class_name, cls in report["classes"].items():
+        print(f"\nClass {class_name}:  {cls['instructions']} instructions")
+        print_histograms(cls, top, "  ")
+        for name, method in cls["methods"].items():
+            print(f"\n  Method {class_name}:{name}:  "
+                  f"{method['instructions']} instructions")
+            print_histograms(method, top, "    ")
+
+
+def main():
+    args = cli()
+    program = Program(args.library)
+    for path in object_files(args.paths):
+        try:
+            program.add_object(objfile.read_object(path))
+        except (OSError, ValueError, KeyError) as e:
+            log.warning(f"Skipping {path}: {e}")
+    program.resolve_targets()
+    if args.profile:
+        with open(args.profile) as f:
+            program.merge(json.load(f))
+    report = program.report(args.top)
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(report, args.top, args.detail)
+
+
+if __name__ == "__main__":
+    main()
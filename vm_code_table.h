@@ -15,6 +15,10 @@ typedef struct {
     char *name;
     vm_Instr instr;
     int n_operands;
+    /* The operation whose kind of operand this one carries:
+     * itself, or for a fused operation, one of those it fuses.
+     */
+    vm_Instr operand_of;
 } op_tbl_entry;
 
 extern op_tbl_entry vm_op_bytecodes[];
@@ -4,12 +4,18 @@
 #include "vm_state.h"
 #include "builtins.h" // For constants
 #include "vm_code_table.h" // opcode -> instruction
+#include "vm_profile.h"  // Where each method's code is
 #include "logger.h"
 #include <cjson/cJSON.h>
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
 #include <assert.h>
+#include <stdint.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
 
 
 // Set load library path before loading each class by name.
@@ -33,6 +39,7 @@ vm_addr vm_current_address() {
  * the ref->header.name
  */
 #define MAX_CLASSES 100   // And we will behave very badly if you have more
+                          // (link.py MUST agree)
 class_ref loaded_classes[MAX_CLASSES];
 static int n_classes_loaded;
 
@@ -54,6 +61,8 @@ void vm_loader_init(char *load_path_prefix) {
     PATH_PREFIX = load_path_prefix;
     // The built-in classes are available from the start,
     // and don't go through the usual class-loading translation process.
+    // They are numbered in this order in call_builtin operands
+    // (assemble.py MUST agree).
     set_loaded(the_class_Obj);
     set_loaded(the_class_String);
     set_loaded(the_class_Boolean);
@@ -148,6 +157,21 @@ int read_file_fd(FILE *fd, char *file_buffer) {
 
 vm_Word *translate_method_code(cJSON *ops, int const_map[], class_ref class_map[]);
 
+/* Add one constant from an object file to the global constant
+ * pool, returning its index there.
+ */
+static int intern_constant(char kind, char *literal) {
+    int internal = 0;
+    if (kind == 'i') {
+        internal = int_literal_const(literal);
+    } else if (kind == 's') {
+        internal = str_literal_const(strdup(literal));
+    } else {
+        perror("Constant of unknown type");
+    }
+    return internal;
+}
+
 /*
  * Constants in a class file (.json) are referenced as small
  * (non-negative) integer indexes
@@ -172,14 +196,7 @@ static int remap_constants(int map[], cJSON *tree, int capacity) {
         cJSON *value_el = cJSON_GetObjectItemCaseSensitive(el, "value");
         char *kind = kind_el->valuestring;
         char *literal = value_el->valuestring;
-        int internal;
-        if (kind[0] == 'i') {
-            internal = int_literal_const(literal);
-        } else if (kind[0] == 's') {
-            internal = str_literal_const(strdup(literal));
-        } else {
-            perror("Constant of unknown type");
-        }
+        int internal = intern_constant(kind[0], literal);
         map[literal_count] = internal;
         log_debug("Literal %s internal %d remapped to %d",
                   literal, literal_count, internal);
@@ -216,6 +233,62 @@ static int map_classes(class_ref class_map[], cJSON *tree, int capacity) {
 }
 
 
+/* Allocate a class object and enter it in the loaded classes
+ * table.  Its vtable is left for the caller to fill in.
+ */
+static class_ref new_class(char *class_name, class_ref the_super,
+                           int n_fields, int n_methods) {
+    size_t class_obj_size =
+            sizeof(struct class_header_struct)
+            + n_methods * sizeof(vm_Word);
+    size_t obj_size = sizeof(struct obj_header_struct) + n_fields * sizeof(vm_Word);
+    class_ref the_class = (class_ref) malloc(class_obj_size);
+    the_class->header = (struct class_header_struct) {
+            .class_name = strdup(class_name),
+            .healthy_class_tag = HEALTHY,
+            .n_fields = n_fields,
+            .object_size = obj_size,
+            .super = the_super
+    };
+    log_debug("Class %s class object size %d with %d methods",
+             class_name, class_obj_size, n_methods);
+    log_debug("Objects of %s size %d with %d fields",
+            class_name,  obj_size, n_fields);
+    log_debug("Size of object header alone is %d bytes\n",
+             sizeof(struct obj_header_struct));
+    set_loaded(the_class);
+    return the_class;
+}
+
+/* Create a class object with the vtable entries it inherits, and
+ * enter it in the loaded classes table.  We want the class in the
+ * "loaded classes" table before loading methods, because the methods
+ * might have references to the current class.
+ */
+static class_ref create_class(char *class_name, char *super_name,
+                              int n_fields, int n_methods, int n_inherited) {
+    log_info("Class %s has %d methods and %d fields",
+             class_name, n_methods, n_fields);
+    class_ref the_super = ensure_loaded(super_name);
+    assert(the_super); // Error if we can't find the superclass
+    class_ref the_class = new_class(class_name, the_super,
+                                    n_fields, n_methods);
+    // Copy inherited method pointers into vtable
+    for (int i = 0; i < n_inherited; ++i) {
+        the_class->vtable[i] = the_super->vtable[i];
+    }
+    return the_class;
+}
+
+/* Frame stack words needed by the method whose code begins at
+ * start, from its max_stack (negative if the object code has none)
+ */
+static void set_frame_words(vm_addr start, int max_stack) {
+    vm_frame_words[start - vm_code_block] =
+            max_stack < 0 ? FRAME_WORDS_UNKNOWN
+                          : FRAME_HEADER_WORDS + max_stack;
+}
+
 static int load_json(char buf[]) {
     cJSON *tree = NULL; // Tree as a whole
     cJSON *val = NULL;  // Named value in tree
@@ -245,40 +318,12 @@ static int load_json(char buf[]) {
             cJSON_GetObjectItemCaseSensitive(tree, "n_fields"));
     int n_methods = (int) cJSON_GetNumberValue(
             cJSON_GetObjectItemCaseSensitive(tree, "n_methods"));
-    log_info("Class %s has %d methods and %d fields",
-             class_name, n_methods, n_fields);
-    size_t class_obj_size =
-            sizeof(struct class_header_struct)
-            + n_methods * sizeof(vm_Word);
-    size_t obj_size = sizeof(struct obj_header_struct) + n_fields * sizeof(vm_Word);
-    class_ref the_super = ensure_loaded(super_name);
-    assert(the_super); // Error if we can't find the superclass
-    class_ref the_class = (class_ref) malloc(class_obj_size);
-    the_class->header = (struct class_header_struct) {
-            .class_name = strdup(class_name),
-            .healthy_class_tag = HEALTHY,
-            .n_fields = n_fields,
-            .object_size = obj_size,
-            .super = the_super
-    };
-    log_debug("Class %s class object size %d with %d methods",
-             class_name, class_obj_size, n_methods);
-    log_debug("Objects of %s size %d with %d fields",
-            class_name,  obj_size, n_fields);
-    log_debug("Size of object header alone is %d bytes\n",
-             sizeof(struct obj_header_struct));
-    // Copy inherited method pointers into vtable
     int n_inherited = (int) cJSON_GetNumberValue(
             cJSON_GetObjectItemCaseSensitive(tree, "n_inherited"));
-    for (int i = 0; i < n_inherited; ++i) {
-        the_class->vtable[i] = the_super->vtable[i];
-    }
+    class_ref the_class = create_class(class_name, super_name,
+                                       n_fields, n_methods, n_inherited);
     //pop_log_level();
 
-    set_loaded(the_class);
-    // We want the class in the "loaded classes" table before loading
-    // methods, because the methods might have references to the current class.
-
     /* module class index -> class reference,
     * with potential side effect of loading more class files.
     */
@@ -294,64 +339,133 @@ static int load_json(char buf[]) {
                 cJSON_GetObjectItemCaseSensitive(el, "name"));
         int method_slot = (int) cJSON_GetNumberValue(
                 cJSON_GetObjectItemCaseSensitive(el, "slot"));
+        cJSON *max_stack = cJSON_GetObjectItemCaseSensitive(el, "max_stack");
         cJSON *ops = cJSON_GetObjectItemCaseSensitive(el, "code");
         vm_Word *method_start_addr =
                 translate_method_code(ops, constant_renumber_map, class_map);
+        set_frame_words(method_start_addr, cJSON_IsNumber(max_stack)
+                                           ? max_stack->valueint : -1);
+        vm_profile_method(class_name, method_name,
+                          method_start_addr, vm_current_address());
         the_class->vtable[method_slot] = method_start_addr;
     }
     cJSON_Delete(tree);
     return 1;
 }
 
+/* A call_builtin operand is builtin * BUILTIN_SLOTS + slot, where
+ * builtin is the position of a built-in class in loaded_classes
+ * (assemble.py MUST agree).
+ */
+#define N_BUILTINS 5
+#define BUILTIN_SLOTS 32
+
+/* The call_native word of a method that is just a trampoline to
+ * native code (enter, loads, call_native f, return n), or NULL
+ */
+static vm_addr native_call_of(vm_addr method) {
+    vm_addr pc = method;
+    if (pc->instr != vm_op_enter) {
+        return NULL;
+    }
+    ++pc;
+    while (pc->instr == vm_op_load) {
+        pc += 2;
+    }
+    if (pc[0].instr == vm_op_call_native && pc[2].instr == vm_op_return) {
+        return pc;
+    }
+    return NULL;
+}
+
+/* The operand of call_builtin becomes the call_native word of the
+ * built-in method.  If the method is not a native trampoline in
+ * this VM, the call goes through the vtable as usual.
+ */
+static void translate_builtin_call(int operand) {
+    int builtin = operand / BUILTIN_SLOTS;
+    int slot = operand % BUILTIN_SLOTS;
+    assert(0 <= builtin && builtin < N_BUILTINS);
+    class_ref clazz = loaded_classes[builtin];
+    vm_addr native_call = native_call_of(clazz->vtable[slot]);
+    if (native_call) {
+        vm_code_block[vm_code_index++] = (vm_Word)
+                {.code_addr = native_call};
+    } else {
+        log_debug("Method %d of %s is not native; calling it as usual",
+                  slot, clazz->header.class_name);
+        vm_code_block[vm_code_index - 1] = (vm_Word)
+                {.instr = vm_op_methodcall};
+        vm_code_block[vm_code_index++] = (vm_Word) {.intval = slot};
+    }
+}
+
+/* Translate an operand from object code to the loaded form.
+ * Constants must be renumbered since local
+ * constant number is not global constant number,
+ * class indexes become class references, and direct calls
+ * of built-in methods become references to their native code.
+ * A fused operation's operand is translated like the
+ * operand of the operation it came from.
+ */
+static void translate_operand(int opcode, int operand,
+                              int const_map[], class_ref class_map[]) {
+    log_debug("[%d] Operand: %d",
+              vm_current_address() - vm_code_block,
+              operand);
+    vm_Instr operand_of = vm_op_bytecodes[opcode].operand_of;
+    if (operand_of == vm_op_const) {
+        int const_index;
+        if (operand == CODE_FALSE) {
+            const_index = lookup_const_index("$false");
+        } else if (operand == CODE_TRUE) {
+            const_index = lookup_const_index("$true");
+        } else if (operand == CODE_NOTHING) {
+            const_index = lookup_const_index("$nothing");
+        } else {
+            assert(operand >= 0);
+            const_index = const_map[operand];
+        }
+        assert(const_index);
+        check_health_object(get_const_value(const_index));
+        vm_code_block[vm_code_index++] = (vm_Word)
+                {.intval=  const_index};
+    } else if(operand_of == vm_op_new
+              || operand_of == vm_op_is_instance) {
+        class_ref clazz = class_map[operand];
+        log_debug("Translating allocation of new '%s'",
+                  clazz->header.class_name);
+        vm_code_block[vm_code_index++] = (vm_Word)
+                {.clazz = clazz};
+    } else if (operand_of == vm_op_call_builtin) {
+        translate_builtin_call(operand);
+    } else {
+        vm_code_block[vm_code_index++] = (vm_Word)
+                {.intval = operand};
+    }
+}
+
+/* Translate an opcode from object code to an instruction */
+static void translate_opcode(int opcode) {
+    log_debug("[%d] Op: %d (%s)",
+              vm_current_address() - vm_code_block,
+              opcode, vm_op_bytecodes[opcode].name);
+    vm_code_block[vm_code_index++] = (vm_Word)
+            {.instr = vm_op_bytecodes[opcode].instr};
+}
+
 vm_Word *translate_method_code(cJSON *ops, int const_map[], class_ref class_map[]) {
-    // Translating code.  Constants must be renumbered since local
-    // constant number is not global constant number.
     assert (cJSON_IsArray(ops));
     cJSON *el = ops->child;
     vm_Word *method_start_address = vm_current_address();
     while (el) {
         assert(cJSON_IsNumber(el));
         int opcode = el->valueint;
-        log_debug("[%d] Op: %d (%s)",
-               vm_current_address() - vm_code_block,
-               opcode, vm_op_bytecodes[opcode].name);
-        vm_code_block[vm_code_index++] = (vm_Word)
-                {.instr = vm_op_bytecodes[opcode].instr};
-
+        translate_opcode(opcode);
         if (vm_op_bytecodes[opcode].n_operands) {
             // Max is 1 operand!
             el = el->next;
-            int operand = el->valueint;
-            log_debug("[%d] Operand: %d",
-                      vm_current_address() - vm_code_block,
-                      operand);
-            if (vm_op_bytecodes[opcode].instr == vm_op_const) {
-                int const_index;
-                if (operand == CODE_FALSE) {
-                    const_index = lookup_const_index("$false");
-                } else if (operand == CODE_TRUE) {
-                    const_index = lookup_const_index("$true");
-                } else if (operand == CODE_NOTHING) {
-                    const_index = lookup_const_index("$nothing");
-                } else {
-                    assert(operand >= 0);
-                    const_index = const_map[operand];
-                }
-                assert(const_index);
-                check_health_object(get_const_value(const_index));
-                vm_code_block[vm_code_index++] = (vm_Word)
-                        {.intval=  const_index};
-            } else if(vm_op_bytecodes[opcode].instr == vm_op_new
-                      || vm_op_bytecodes[opcode].instr == vm_op_is_instance) {
-                class_ref clazz = class_map[operand];
-                log_debug("Translating allocation of new '%s'",
-                          clazz->header.class_name);
-                vm_code_block[vm_code_index++] = (vm_Word)
-                        {.clazz = clazz};
-            } else {
-                vm_code_block[vm_code_index++] = (vm_Word)
-                        {.intval = operand};
-            }
+            translate_operand(opcode, el->valueint, const_map, class_map);
         }
         el = el->next;
     }
@@ -359,6 +473,299 @@ vm_Word *translate_method_code(cJSON *ops, int const_map[], class_ref class_map[
 }
 
 
+/* ---------- Compact binary object files (.tvmo) ----------
+ * The layout is defined in objfile.py, which writes them.
+ * Every item is a little-endian 32-bit word, and strings are
+ * NUL-terminated, so we can use the mapped file in place
+ * without parsing it into a tree first.
+ */
+#define BINARY_MAGIC "TVMO"
+#define BINARY_VERSION 2
+#define BINARY_HEADER_WORDS 8
+
+/* Reading position within a binary object file */
+struct bin_reader {
+    char *base;
+    size_t length;
+    size_t pos;
+};
+
+static int32_t bin_word(struct bin_reader *r) {
+    int32_t word;
+    assert(r->pos + sizeof(word) <= r->length);  // Truncated file
+    memcpy(&word, r->base + r->pos, sizeof(word));
+    r->pos += sizeof(word);
+    return word;
+}
+
+/* String table, used in place; free the result when done */
+static char **bin_strings(struct bin_reader *r) {
+    int n_strings = bin_word(r);
+    int n_text_bytes = bin_word(r);
+    char *text = r->base + r->pos + n_strings * sizeof(int32_t);
+    assert(text + n_text_bytes <= r->base + r->length);
+    char **strings = malloc((n_strings + 1) * sizeof(char *));
+    for (int i = 0; i < n_strings; ++i) {
+        strings[i] = text + bin_word(r);
+    }
+    r->pos += n_text_bytes;
+    return strings;
+}
+
+static int load_binary(char *buf, size_t length) {
+    struct bin_reader r = {.base = buf, .length = length, .pos = 0};
+    if (length < BINARY_HEADER_WORDS * sizeof(int32_t)
+        || memcmp(buf, BINARY_MAGIC, strlen(BINARY_MAGIC)) != 0) {
+        log_warn("Not a binary object file");
+        return 0;
+    }
+    r.pos = strlen(BINARY_MAGIC);
+    int version = bin_word(&r);
+    if (version != BINARY_VERSION) {
+        log_warn("Binary object file version %d, expecting %d",
+                 version, BINARY_VERSION);
+        return 0;
+    }
+    size_t declared_length = bin_word(&r);
+    assert(declared_length == length);
+    int class_name_index = bin_word(&r);
+    int super_name_index = bin_word(&r);
+    int n_fields = bin_word(&r);
+    int n_methods = bin_word(&r);
+    int n_inherited = bin_word(&r);
+
+    char **strings = bin_strings(&r);
+
+    /* Imports are mapped after this class is created,
+     * so that it can reference itself.
+     */
+    int n_imports = bin_word(&r);
+    size_t imports_pos = r.pos;
+    r.pos += n_imports * sizeof(int32_t);
+    // The assembler needs method names, arities, and field names;
+    // we do not
+    r.pos += bin_word(&r) * sizeof(int32_t);
+    r.pos += bin_word(&r) * sizeof(int32_t);
+    r.pos += bin_word(&r) * sizeof(int32_t);
+
+    /* module constant index -> global constant index */
+    int n_consts = bin_word(&r);
+    int *constant_renumber_map = malloc((n_consts + 1) * sizeof(int));
+    for (int i = 0; i < n_consts; ++i) {
+        char kind = (char) bin_word(&r);
+        char *literal = strings[bin_word(&r)];
+        constant_renumber_map[i] = intern_constant(kind, literal);
+        log_debug("Literal %s internal %d remapped to %d",
+                  literal, i, constant_renumber_map[i]);
+    }
+
+    char *class_name = strings[class_name_index];
+    char *super_name = strings[super_name_index];
+    log_info("Class %s extends %s", class_name, super_name);
+    class_ref the_class = create_class(class_name, super_name,
+                                       n_fields, n_methods, n_inherited);
+
+    /* module class index -> class reference,
+     * with potential side effect of loading more class files.
+     */
+    class_ref *class_map = malloc((n_imports + 1) * sizeof(class_ref));
+    size_t code_pos = r.pos;
+    r.pos = imports_pos;
+    for (int i = 0; i < n_imports; ++i) {
+        class_map[i] = ensure_loaded(strings[bin_word(&r)]);
+    }
+    r.pos = code_pos;
+
+    int n_blocks = bin_word(&r);
+    for (int block = 0; block < n_blocks; ++block) {
+        char *method_name = strings[bin_word(&r)];
+        int method_slot = bin_word(&r);
+        int max_stack = bin_word(&r);
+        int n_words = bin_word(&r);
+        log_debug("Method %s, slot %d, %d words",
+                  method_name, method_slot, n_words);
+        vm_Word *method_start_addr = vm_current_address();
+        size_t end = r.pos + n_words * sizeof(int32_t);
+        while (r.pos < end) {
+            int opcode = bin_word(&r);
+            translate_opcode(opcode);
+            if (vm_op_bytecodes[opcode].n_operands) {
+                translate_operand(opcode, bin_word(&r),
+                                  constant_renumber_map, class_map);
+            }
+        }
+        set_frame_words(method_start_addr, max_stack);
+        vm_profile_method(class_name, method_name,
+                          method_start_addr, vm_current_address());
+        the_class->vtable[method_slot] = method_start_addr;
+    }
+    free(class_map);
+    free(constant_renumber_map);
+    free(strings);
+    return 1;
+}
+
+/* ---------- Pre-linked load images (.tvmi) ----------
+ * The layout is defined in link.py, which writes them.  An image
+ * holds a whole program:  its classes in load order (each after
+ * its superclass), one constant pool, code whose operands are
+ * already indexes in that pool and in one class table, and the
+ * class that fills each vtable slot.  So it is loaded in one pass,
+ * finding only the built-in classes by name.
+ */
+#define IMAGE_MAGIC "TVMI"
+#define IMAGE_VERSION 3
+#define IMAGE_HEADER_WORDS 3
+#define IMAGE_UNREACHABLE (-1)  // Vtable slot of a pruned method
+
+/* Pruned methods (link.py --prune) share this stub, which the
+ * linker found no call could reach.  If one is called anyway,
+ * the VM stops rather than run the wrong code.
+ */
+static obj_ref native_unreachable(void) {
+    log_error("Called a method that link.py pruned as unreachable "
+              "(on a %s)", vm_fp->obj->header.clazz->header.class_name);
+    vm_run_state = VM_HALTED;
+    return nothing;
+}
+
+static vm_Word method_unreachable[] = {
+        {.instr = vm_op_enter},
+        {.instr = vm_op_call_native},
+        {.native = native_unreachable},
+        {.instr = vm_op_halt}
+};
+
+static int load_image(char *buf, size_t length) {
+    struct bin_reader r = {.base = buf, .length = length, .pos = 0};
+    if (length < strlen(IMAGE_MAGIC) + IMAGE_HEADER_WORDS * sizeof(int32_t)
+        || memcmp(buf, IMAGE_MAGIC, strlen(IMAGE_MAGIC)) != 0) {
+        log_warn("Not a load image");
+        return 0;
+    }
+    r.pos = strlen(IMAGE_MAGIC);
+    int version = bin_word(&r);
+    if (version != IMAGE_VERSION) {
+        log_warn("Load image version %d, expecting %d",
+                 version, IMAGE_VERSION);
+        return 0;
+    }
+    size_t declared_length = bin_word(&r);
+    assert(declared_length == length);
+    int main_index = bin_word(&r);
+    char **strings = bin_strings(&r);
+
+    /* Class table:  built-in classes, then the program's classes */
+    int n_builtins = bin_word(&r);
+    size_t builtins_pos = r.pos;
+    r.pos += n_builtins * sizeof(int32_t);
+    int n_classes = n_builtins + bin_word(&r);
+    class_ref *class_map = malloc((n_classes + 1) * sizeof(class_ref));
+    int *n_methods = malloc((n_classes + 1) * sizeof(int));
+    size_t classes_pos = r.pos;
+    r.pos = builtins_pos;
+    for (int i = 0; i < n_builtins; ++i) {
+        class_map[i] = find_loaded(strings[bin_word(&r)]);
+        assert(class_map[i]);  // The image is for a different VM
+    }
+    r.pos = classes_pos;
+    for (int i = n_builtins; i < n_classes; ++i) {
+        char *class_name = strings[bin_word(&r)];
+        int super_index = bin_word(&r);
+        assert(super_index < i);  // Superclass first
+        int n_fields = bin_word(&r);
+        n_methods[i] = bin_word(&r);
+        log_info("Class %s has %d methods and %d fields",
+                 class_name, n_methods[i], n_fields);
+        class_map[i] = new_class(class_name, class_map[super_index],
+                                 n_fields, n_methods[i]);
+    }
+
+    /* The one constant pool:  image index -> global constant index */
+    int n_consts = bin_word(&r);
+    int *constant_renumber_map = malloc((n_consts + 1) * sizeof(int));
+    for (int i = 0; i < n_consts; ++i) {
+        char kind = (char) bin_word(&r);
+        constant_renumber_map[i] = intern_constant(kind, strings[bin_word(&r)]);
+    }
+
+    int n_blocks = bin_word(&r);
+    for (int block = 0; block < n_blocks; ++block) {
+        class_ref the_class = class_map[bin_word(&r)];
+        int method_slot = bin_word(&r);
+        char *method_name = strings[bin_word(&r)];
+        int max_stack = bin_word(&r);
+        int n_words = bin_word(&r);
+        vm_Word *method_start_addr = vm_current_address();
+        size_t end = r.pos + n_words * sizeof(int32_t);
+        while (r.pos < end) {
+            int opcode = bin_word(&r);
+            translate_opcode(opcode);
+            if (vm_op_bytecodes[opcode].n_operands) {
+                translate_operand(opcode, bin_word(&r),
+                                  constant_renumber_map, class_map);
+            }
+        }
+        set_frame_words(method_start_addr, max_stack);
+        vm_profile_method(the_class->header.class_name, method_name,
+                          method_start_addr, vm_current_address());
+        the_class->vtable[method_slot] = method_start_addr;
+    }
+
+    /* Each slot from the class whose own method fills it,
+     * which is now loaded, or the stub if it was pruned
+     */
+    for (int i = n_builtins; i < n_classes; ++i) {
+        for (int slot = 0; slot < n_methods[i]; ++slot) {
+            int owner = bin_word(&r);
+            class_map[i]->vtable[slot] = owner == IMAGE_UNREACHABLE
+                    ? method_unreachable
+                    : class_map[owner]->vtable[slot];
+        }
+    }
+    vm_loader_set_main(class_map[main_index]->header.class_name);
+    free(constant_renumber_map);
+    free(n_methods);
+    free(class_map);
+    free(strings);
+    return 1;
+}
+
+/* Map a whole file and hand it to a loader */
+static int load_mapped(char *path, int (*loader)(char *, size_t)) {
+    int fd = open(path, O_RDONLY);
+    if (fd < 0) {
+        perror("Failed to open file");
+        return 0;
+    }
+    struct stat st;
+    if (fstat(fd, &st) != 0) {
+        perror("Failed to stat file");
+        close(fd);
+        return 0;
+    }
+    char *buf = mmap(NULL, st.st_size, PROT_READ, MAP_PRIVATE, fd, 0);
+    if (buf == MAP_FAILED) {
+        perror("Failed to map file");
+        close(fd);
+        return 0;
+    }
+    int ok = loader(buf, st.st_size);
+    munmap(buf, st.st_size);
+    close(fd);
+    return ok;
+}
+
+int vm_load_binary_from_path(char *path) {
+    return load_mapped(path, load_binary);
+}
+
+int vm_load_image_from_path(char *path) {
+    log_info("Loading image %s", path);
+    return load_mapped(path, load_image);
+}
+
+
 
 /* Load an "object" file (json format) from
  * a class name.
@@ -367,6 +774,12 @@ vm_Word *translate_method_code(cJSON *ops, int const_map[], class_ref class_map[
 extern int vm_load_class(char *classname) {
     char load_path[PATHBUFSIZE];
     // Use printf for multi-concat
+    // Prefer the compact binary object file if there is one
+    snprintf(load_path, PATHBUFSIZE, "%s/%s.tvmo", PATH_PREFIX, classname);
+    if (access(load_path, R_OK) == 0) {
+        log_info("Loading %s", load_path);
+        return vm_load_binary_from_path(load_path);
+    }
     snprintf(load_path, PATHBUFSIZE, "%s/%s.json", PATH_PREFIX, classname);
     log_info("Loading %s", load_path);
     return vm_load_from_path(load_path);
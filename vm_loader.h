@@ -24,8 +24,8 @@ void vm_loader_set_main(char *main_class_name);
  */
 extern class_ref find_loaded(char *name);
 
-/* Load an "object" file (json format) from
- * a class name.
+/* Load an "object" file from a class name,
+ * Class.tvmo (binary format) if present, else Class.json.
  */
 extern int vm_load_class(char *classname);
 
@@ -34,6 +34,17 @@ extern int vm_load_class(char *classname);
  */
 extern int vm_load_from_path(char *path);
 
+/* Load a compact binary object file (.tvmo), written by
+ * objfile.py.  Return 1 = success, 0 = failure.
+ */
+extern int vm_load_binary_from_path(char *path);
+
+/* Load a whole program from a pre-linked load image (.tvmi),
+ * written by link.py, and make its main class the one to run.
+ * Return 1 = success, 0 = failure.
+ */
+extern int vm_load_image_from_path(char *path);
+
 /* Constants in method bytecode will be small non-negative
  * integers corresponding to the "constants" list in the
  * object code json, or chosen from this fixed set of
@@ -72,18 +72,25 @@ extern void vm_op_methodcall(void) {
     int method_index = vm_fetch_next().intval;
     // New "this" will be receiver object
     vm_addr new_fp = vm_sp;
-    // Save program counter for return
-    vm_frame_push_word((vm_Word) {.code_addr = vm_pc});
-    // Save caller's frame pointer
-    vm_frame_push_word((vm_Word) {.frame_addr = vm_fp});
-    vm_fp = new_fp;
     // Address of code for called method, found in the
     // class vtable.
-    obj_ref receiver = (*vm_fp).obj;
+    obj_ref receiver = (*new_fp).obj;
     check_health_object(receiver);
     class_ref clazz = receiver->header.clazz;
     check_health_class(clazz);
     vm_addr method_addr = clazz->vtable[method_index];
+    // The whole frame must fit; pushes within it are not checked
+    if (! vm_frame_fits(new_fp, method_addr)) {
+        log_error("Frame stack overflow calling method %d of %s",
+                  method_index, clazz->header.class_name);
+        vm_run_state = VM_HALTED;
+        return;
+    }
+    // Save program counter for return
+    vm_frame_push_word((vm_Word) {.code_addr = vm_pc});
+    // Save caller's frame pointer
+    vm_frame_push_word((vm_Word) {.frame_addr = vm_fp});
+    vm_fp = new_fp;
     vm_pc = method_addr;
     return;
 }
@@ -113,6 +120,35 @@ extern void vm_op_call_native(void) {
     vm_frame_push_word(word);
 }
 
+/* Call a native method of a built-in class directly.
+ * The assembler emits this only where it knows the class of the
+ * receiver, so the method need not be found in the vtable; and
+ * the method is a trampoline (enter, call_native f, return n), so
+ * we can call f without making a frame for the method.
+ * The loader replaces the operand with the address of the
+ * trampoline's call_native word, which is followed by the native
+ * function and then by the return and its arity.
+ *
+ * The native function sees the receiver at fp and its arguments
+ * below it, as it would in the trampoline.
+ *
+ * vm_op_call_builtin(call_native_word): [arg1 ... argn obj] -> [result]
+ */
+extern void vm_op_call_builtin(void) {
+    vm_addr native_call = vm_fetch_next().code_addr;
+    vm_Native m = native_call[1].native;
+    int arity = native_call[3].intval;
+    vm_addr caller_fp = vm_fp;
+    vm_fp = vm_sp;  // The receiver
+    check_health_object(vm_fp->obj);
+    obj_ref result = m();
+    check_health_object(result);
+    vm_fp = caller_fp;
+    // Result replaces the receiver and arguments, as after return
+    vm_sp -= arity;
+    vm_sp->obj = result;
+}
+
 
 extern void vm_op_enter() {
     // Currently does nothing
@@ -313,3 +349,90 @@ extern void vm_op_store_field() {
     target_obj->fields[field_slot] = value;
     // pop_log_level();
 }
+
+/* =======  Fused operations  ===========
+ * Each does the work of a short sequence of the operations
+ * above (see opdefs.txt) in a single dispatch.  The assembler
+ * emits them with --fuse.
+ */
+
+/* load $; load_field i
+ * (i) [] -> [this.field]
+ */
+extern void vm_op_load_self_field() {
+    int field_slot = vm_fetch_next().intval;
+    obj_ref the_obj = vm_fp->obj;
+    check_health_object(the_obj);
+    obj_ref val = the_obj->fields[field_slot];
+    check_health_object(val);
+    vm_frame_push_word((vm_Word) {.obj=val});
+}
+
+/* load $; store_field i
+ * (i) [val] -> [], this.fields[i] = val
+ */
+extern void vm_op_store_self_field() {
+    int field_slot = vm_fetch_next().intval;
+    obj_ref target_obj = vm_fp->obj;
+    check_health_object(target_obj);
+    obj_ref value = vm_frame_pop_word().obj;
+    check_health_object(value);
+    assert(target_obj->header.clazz->header.n_fields > field_slot);
+    target_obj->fields[field_slot] = value;
+}
+
+/* The integer constant operations call no method, but compute
+ * what the Int method would, with the constant as receiver and
+ * the top of stack as the other operand.  (Int:sub subtracts
+ * the receiver from the other operand.)
+ */
+static int fetch_int_const(void) {
+    int inline_const_index = vm_fetch_next().intval;
+    obj_ref the_constant = get_const_value(inline_const_index);
+    assert_is_type(the_constant, the_class_Int);
+    return ((obj_Int) the_constant)->value;
+}
+
+static int pop_int(void) {
+    obj_ref other = vm_frame_pop_word().obj;
+    assert_is_type(other, the_class_Int);
+    return ((obj_Int) other)->value;
+}
+
+/* const c; call Int:plus
+ * (c) [x] -> [c + x]
+ */
+extern void vm_op_plus_const() {
+    int c = fetch_int_const();
+    vm_frame_push_word((vm_Word) {.obj = new_int(c + pop_int())});
+}
+
+/* const c; call Int:sub
+ * (c) [x] -> [x - c]
+ */
+extern void vm_op_sub_const() {
+    int c = fetch_int_const();
+    vm_frame_push_word((vm_Word) {.obj = new_int(pop_int() - c)});
+}
+
+/* const c; call Int:less
+ * (c) [x] -> [c < x]
+ */
+extern void vm_op_less_const() {
+    int c = fetch_int_const();
+    if (c < pop_int()) {
+        vm_frame_push_word((vm_Word) lit_true);
+    } else {
+        vm_frame_push_word((vm_Word) lit_false);
+    }
+}
+
+/* const s; call String:print; pop
+ * (s) [] -> []
+ */
+extern void vm_op_print_const() {
+    int inline_const_index = vm_fetch_next().intval;
+    obj_ref the_constant = get_const_value(inline_const_index);
+    assert_is_type(the_constant, the_class_String);
+    printf("%s", ((obj_String) the_constant)->text);
+}
@@ -40,6 +40,14 @@ extern void vm_op_methodcall(void);
 */
 extern void vm_op_call_native(void);
 
+/* Call a native method of a built-in class directly, without
+ * the vtable or the trampoline's frame.  The loader replaces
+ * the operand with the trampoline's call_native word.
+ *
+ * vm_op_call_builtin(call_native_word): [arg1 ... argn obj] -> [result]
+ */
+extern void vm_op_call_builtin(void);
+
 /* The object allocator should be called just before
  * a call to the constructor. It creates an object with the
  * class pointer, but without initializing fields.  The
@@ -107,5 +115,13 @@ extern void vm_op_load_field();  // Load from field of object
 // store_field n: [value target] -> [], target.fields[n] = value
 extern void vm_op_store_field(); // Store into field of object
 
+/* Fused operations (superinstructions), see opdefs.txt */
+extern void vm_op_load_self_field();   // load $; load_field
+extern void vm_op_store_self_field();  // load $; store_field
+extern void vm_op_plus_const();        // const c; call Int:plus
+extern void vm_op_sub_const();         // const c; call Int:sub
+extern void vm_op_less_const();        // const c; call Int:less
+extern void vm_op_print_const();       // const s; call String:print; pop
+
 
 #endif //TINY_VM_VM_OPS_H
@@ -0,0 +1,109 @@
+/* Execution profile of a VM run, see vm_profile.h */
+
+#include "vm_profile.h"
+#include "vm_code_table.h"  // operation names
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#define MAX_PROFILED_METHODS 256
+#define MAX_OPERATIONS 64
+
+/* Executions of each instruction word in the code block */
+static long code_counts[CODE_CAPACITY];
+
+/* Executions of each operation (by byte code) outside it */
+static long builtin_counts[MAX_OPERATIONS];
+
+typedef struct {
+    char *class_name;
+    char *method_name;
+    int start;  // Index in code block
+    int end;    // Just after the last word
+} profiled_method;
+
+static profiled_method methods[MAX_PROFILED_METHODS];
+static int n_methods = 0;
+
+static int profiling = 0;  // Set by vm_profile_start (-P)
+
+static void count_step(vm_addr pc) {
+    if (pc >= vm_code_block && pc < vm_code_block + CODE_CAPACITY) {
+        code_counts[pc - vm_code_block] += 1;
+        return;
+    }
+    for (int i = 0; i < MAX_OPERATIONS && vm_op_bytecodes[i].name; ++i) {
+        if (vm_op_bytecodes[i].instr == pc->instr) {
+            builtin_counts[i] += 1;
+            return;
+        }
+    }
+}
+
+void vm_profile_start(void) {
+    vm_step_hook = count_step;
+    profiling = 1;
+}
+
+void vm_profile_method(char *class_name, char *method_name,
+                       vm_addr start, vm_addr end) {
+    if (! profiling) {
+        return;
+    }
+    if (n_methods == MAX_PROFILED_METHODS) {
+        log_warn("Too many methods to profile %s:%s",
+                 class_name, method_name);
+        return;
+    }
+    // Names may be freed with the object file they came from
+    methods[n_methods++] = (profiled_method) {
+        .class_name = strdup(class_name),
+        .method_name = strdup(method_name),
+        .start = start - vm_code_block,
+        .end = end - vm_code_block};
+}
+
+/* {"methods": [{"class": C, "method": M, "start": address,
+ *               "counts": [per code word]}, ...],
+ *  "builtin": {operation: count, ...}}
+ */
+int vm_profile_write(char *path) {
+    FILE *f = fopen(path, "w");
+    if (!f) {
+        perror("Failed to write profile");
+        return 0;
+    }
+    fprintf(f, "{\"methods\": [");
+    for (int m = 0; m < n_methods; ++m) {
+        profiled_method *method = &methods[m];
+        fprintf(f, "%s\n  {\"class\": \"%s\", \"method\": \"%s\", "
+                   "\"start\": %d, \"counts\": [",
+                m ? "," : "", method->class_name, method->method_name,
+                method->start);
+        for (int i = method->start; i < method->end; ++i) {
+            fprintf(f, "%s%ld", i > method->start ? ", " : "",
+                    code_counts[i]);
+        }
+        fprintf(f, "]}");
+    }
+    fprintf(f, "],\n \"builtin\": {");
+    int first = 1;
+    for (int i = 0; i < MAX_OPERATIONS && vm_op_bytecodes[i].name; ++i) {
+        if (builtin_counts[i]) {
+            fprintf(f, "%s\"%s\": %ld", first ? "" : ", ",
+                    vm_op_bytecodes[i].name, builtin_counts[i]);
+            first = 0;
+        }
+    }
+    fprintf(f, "}}\n");
+    fclose(f);
+    return 1;
+}
+
+void vm_profile_free(void) {
+    for (int m = 0; m < n_methods; ++m) {
+        free(methods[m].class_name);
+        free(methods[m].method_name);
+    }
+    n_methods = 0;
+}
@@ -0,0 +1,32 @@
+/* Execution profile of a VM run:  how many times each
+ * instruction in the code block was executed, and how many
+ * times each operation was executed outside it (in the code
+ * of built-in methods).  Written as JSON for
+ * tools/opcode_profile.py, which matches the counts to
+ * instructions in the object files.
+ */
+
+#ifndef TINY_VM_VM_PROFILE_H
+#define TINY_VM_VM_PROFILE_H
+
+#include "vm_state.h"
+
+/* Start counting (installs the step hook) */
+extern void vm_profile_start(void);
+
+/* The loader notes where the code of each method begins
+ * and ends, so that counts can be reported by method.
+ * Ignored unless vm_profile_start has been called.
+ */
+extern void vm_profile_method(char *class_name, char *method_name,
+                              vm_addr start, vm_addr end);
+
+/* Write the counts to path.
+ * Return 1 = success, 0 = failure.
+ */
+extern int vm_profile_write(char *path);
+
+/* Free the method table, at exit */
+extern void vm_profile_free(void);
+
+#endif //TINY_VM_VM_PROFILE_H
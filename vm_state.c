@@ -61,6 +61,16 @@ vm_Word *vm_fp = vm_frame_stack;    // Frame pointer, points to "this" object
 vm_Word *vm_sp = vm_frame_stack;    // Stack pointer, points to top item
 /* Evaluation stack is at end of activation record. */
 
+int vm_frame_words[CODE_CAPACITY];
+
+int vm_frame_fits(vm_addr fp, vm_addr method_addr) {
+    int words = FRAME_WORDS_BUILTIN;
+    if (vm_code_block <= method_addr
+        && method_addr < &vm_code_block[CODE_CAPACITY]) {
+        words = vm_frame_words[method_addr - vm_code_block];
+    }
+    return fp + words <= &vm_frame_stack[FRAME_CAPACITY];
+}
 
 /* Push a single word on the frame stack */
 void vm_frame_push_word(vm_Word val) {
@@ -280,8 +290,13 @@ void stack_dump(int n_words) {
     log_debug("===");
 }
 
+void (*vm_step_hook)(vm_addr pc) = 0;
+
 /* One execution step, at current PC */
 void vm_step() {
+    if (vm_step_hook) {
+        (*vm_step_hook)(vm_pc);
+    }
     vm_Instr instr = vm_fetch_next().instr;
     char *name = guess_description((vm_Word) instr);
     log_debug("Step:  %s",name );
@@ -49,6 +49,11 @@ extern vm_Word vm_fetch_next(void);
 extern void vm_relative_jump(int n);
 
 
+/* If set, called with the program counter before each
+ * step (e.g., to count executions, see vm_profile.h)
+ */
+extern void (*vm_step_hook)(vm_addr pc);
+
 /* Execution run state - running or halted
  */
 #define VM_RUNNING 1
@@ -84,6 +89,23 @@ extern vm_Word vm_frame_top_word();  // Without popping
 /*  roll 2: [ob x y] -> [x y ob] */
 extern void vm_roll(int n);
 
+/* Words of the frame stack each method may use:  its receiver,
+ * return address, and saved frame pointer, then at most max_stack
+ * words of locals and temporaries (from its object code).  The
+ * loader records this at the index in vm_code_block where the
+ * method's code begins, and a call checks that the whole frame
+ * fits, so pushes within the frame need no check.
+ */
+#define FRAME_HEADER_WORDS 3
+#define FRAME_WORDS_UNKNOWN 64  // Object code without max_stack
+#define FRAME_WORDS_BUILTIN 8   // Built-in methods, outside vm_code_block
+extern int vm_frame_words[CODE_CAPACITY];
+
+/* Does a frame at fp, for the method whose code begins
+ * at method_addr, fit on the frame stack?
+ */
+extern int vm_frame_fits(vm_addr fp, vm_addr method_addr);
+
 /* Debugging */
 void stack_dump(int n_words);
 extern void dump_constants(void);